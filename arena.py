@@ -0,0 +1,237 @@
+# arena.py
+# plays the agents in bot_configs against each other with nobody watching, to see which one is actually better.
+# every pair of agents plays a round robin of games over a process pool. each deal gets played twice, once with each
+# agent going first, so neither gets the luckier cards. a worker plays a batch of games at once and asks each agent's
+# network about all the games where it's that agent's turn in one go.
+# reports each pairing's score with a 95% confidence interval, an Elo rating for every agent, and how long games took.
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import math
+import os
+from itertools import combinations
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from bot_configs import configs
+from bot_play import Agent
+from env import SkipBoEngine, SkipBoMutator, SkipBoState, end_cause
+
+# the agents each worker process has loaded, by name
+_agents: Dict[str, Agent] = {}
+
+def _init_worker():
+    # the workers already run in parallel, more threads each just fight over the cpus
+    torch.set_num_threads(1)
+
+def _agent(name: str) -> Agent:
+    if name not in _agents:
+        _agents[name] = Agent(configs[name])
+    return _agents[name]
+
+class Seat:
+    """
+    A class to represent one agent's side of a batch of games. It has its own obs builder and action parser,
+    so two agents never share one, even when their configs use the same kind (or the same one).
+    """
+    def __init__(self, name: str, deterministic: bool = False):
+        self.name = name
+        self.agent = _agent(name)
+        self.obs_builder = copy.deepcopy(configs[name].obs_builder)
+        self.action_parser = copy.deepcopy(configs[name].action_parser)
+        self.deterministic = deterministic
+
+    def act(self, states: List[SkipBoState]):
+        """This agent's action in each of states."""
+        if self.agent.search_config is not None:
+            # searching doesn't batch, and Agent.get_action prints every move
+            with contextlib.redirect_stdout(io.StringIO()):
+                return [self.agent.get_action(state) for state in states]
+        shared_infos = [{} for _ in states]
+        obs = self.obs_builder.build_obs_batch(states, shared_infos)
+        with torch.no_grad():
+            actions, _ = self.agent.model.get_action(None, list(obs), deterministic=self.deterministic)
+        actions = np.asarray(actions).reshape(len(states), -1)
+        return [self.action_parser.parse_actions({0: actions[i]}, state, shared_info)[0]
+                for i, (state, shared_info) in enumerate(zip(states, shared_infos))]
+
+def play_games(names: Tuple[str, str], seeds: List[int], stock_pile_size: int = 20, max_turns: int = 1000,
+               deterministic: bool = False) -> List[Dict[str, Any]]:
+    """
+    Play every deal in seeds twice between the two named agents, once with each going first, all at the same time.
+    Returns a record of every game: who went first, who won (None for a game that got cut short), why it ended and how long it took.
+    """
+    seats = [Seat(name, deterministic) for name in names]
+    games = []
+    for seed in seeds:
+        for first in (0, 1):
+            # the mutator's seed decides the deal and the engine's seed every draw and reshuffle after it,
+            # so both games get the same cards
+            engine = SkipBoEngine(2, seed=seed)
+            state = engine.create_base_state()
+            SkipBoMutator(2, stock_pile_size, seed=seed).apply(state, {})
+            engine.reset(state)
+            # which seat plays player 0 and which plays player 1
+            games.append({'engine': engine, 'players': (first, 1 - first), 'seed': seed, 'steps': 0})
+
+    records = []
+    active = games
+    while len(active) > 0:
+        for seat_idx, seat in enumerate(seats):
+            turn = [game for game in active if game['players'][game['engine'].state.current_player] == seat_idx]
+            if len(turn) == 0:
+                continue
+            actions = seat.act([game['engine'].state for game in turn])
+            for game, action in zip(turn, actions):
+                game['engine'].step({0: action}, {})
+                game['steps'] += 1
+            # check before the other seat moves, a game can end on a discard that hands it the turn
+            active = [game for game in active if not _finished(game, names, max_turns, records)]
+    return records
+
+def _finished(game: Dict[str, Any], names: Tuple[str, str], max_turns: int, records: List[Dict[str, Any]]) -> bool:
+    """Whether game is over. If it is, its record goes in records."""
+    state = game['engine'].state
+    cause = end_cause(state, max_turns)
+    if cause is None:
+        return False
+    winner = None
+    if cause == 'win':
+        winner = names[game['players'][next(i for i, ps in enumerate(state.player_states) if len(ps.stock_pile) == 0)]]
+    records.append({
+        'first': names[game['players'][0]],
+        'winner': winner,
+        'cause': cause,
+        'turns': state.num_turns,
+        'steps': game['steps'],
+        'seed': game['seed'],
+    })
+    return True
+
+def _play_job(job: Tuple[Tuple[str, str], List[int], int, int, bool]):
+    names, seeds, stock_pile_size, max_turns, deterministic = job
+    return names, play_games(names, seeds, stock_pile_size, max_turns, deterministic)
+
+def wilson_interval(score: float, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """The Wilson score interval for a win rate of score over n games."""
+    if n == 0:
+        return 0.0, 1.0
+    center = (score + z * z / (2 * n)) / (1 + z * z / n)
+    half_width = z * math.sqrt(score * (1 - score) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+def elo_ratings(names: List[str], points: Dict[Tuple[str, str], float], games: Dict[Tuple[str, str], int],
+                iterations: int = 1000) -> Dict[str, float]:
+    """
+    Elo ratings (averaging 1500) from a Bradley-Terry fit. points[(a, b)] is how many points a got against b over
+    games[(a, b)] games, a draw being worth half. Every pairing gets one extra draw, so an agent that won every game
+    still gets a finite rating.
+    """
+    strengths = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        updated = {}
+        for name in names:
+            won = 0.0
+            denominator = 0.0
+            for other in names:
+                if other == name or (name, other) not in games:
+                    continue
+                n = games[(name, other)] + 1
+                won += points[(name, other)] + 0.5
+                denominator += n / (strengths[name] + strengths[other])
+            updated[name] = won / denominator if denominator > 0 else strengths[name]
+        # keep the geometric mean at 1, so the ratings average 1500
+        scale = math.exp(sum(math.log(strength) for strength in updated.values()) / len(updated))
+        strengths = {name: strength / scale for name, strength in updated.items()}
+    return {name: 1500 + 400 * math.log10(strength) for name, strength in strengths.items()}
+
+def summarize(names: List[str], records: Dict[Tuple[str, str], List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """Scores, confidence intervals, Elo and game lengths from the game records of every pairing."""
+    points = {}
+    games = {}
+    pairings = {}
+    for (a, b), pair_records in records.items():
+        wins_a = sum(1 for record in pair_records if record['winner'] == a)
+        wins_b = sum(1 for record in pair_records if record['winner'] == b)
+        draws = len(pair_records) - wins_a - wins_b
+        n = len(pair_records)
+        points[(a, b)] = wins_a + draws / 2
+        points[(b, a)] = wins_b + draws / 2
+        games[(a, b)] = games[(b, a)] = n
+        score = points[(a, b)] / n if n > 0 else 0.5
+        turns = np.array([record['turns'] for record in pair_records])
+        wins_first = sum(1 for record in pair_records if record['winner'] is not None and record['winner'] == record['first'])
+        causes = {}
+        for record in pair_records:
+            causes[record['cause']] = causes.get(record['cause'], 0) + 1
+        pairings[f"{a} vs {b}"] = {
+            'games': n,
+            'wins': {a: wins_a, b: wins_b},
+            'draws': draws,
+            'score': score,
+            'score_interval': wilson_interval(score, n),
+            'first_player_win_rate': wins_first / n if n > 0 else 0.0,
+            'end_causes': causes,
+            'turns': {
+                'mean': float(turns.mean()) if n > 0 else 0.0,
+                'median': float(np.median(turns)) if n > 0 else 0.0,
+                'p90': float(np.percentile(turns, 90)) if n > 0 else 0.0,
+            },
+            'mean_steps': float(np.mean([record['steps'] for record in pair_records])) if n > 0 else 0.0,
+        }
+    return {'elo': elo_ratings(names, points, games), 'pairings': pairings}
+
+def run_arena(names: List[str], deals: int, games_per_job: int = 50, processes: Optional[int] = None,
+              seed: int = 0, stock_pile_size: int = 20, max_turns: int = 1000, deterministic: bool = False) -> Dict[str, Any]:
+    """Play deals deals (2 games each) between every pair of names over a process pool, and summarize the results."""
+    jobs = []
+    deals_per_job = max(1, games_per_job // 2)
+    for pair_idx, names_pair in enumerate(combinations(names, 2)):
+        # every pairing gets its own deals, and the same ones from run to run
+        pair_seeds = [seed + pair_idx * deals + i for i in range(deals)]
+        for start in range(0, deals, deals_per_job):
+            jobs.append((names_pair, pair_seeds[start:start + deals_per_job], stock_pile_size, max_turns, deterministic))
+    records = {names_pair: [] for names_pair in combinations(names, 2)}
+    with Pool(processes, initializer=_init_worker) as pool:
+        for names_pair, job_records in pool.imap_unordered(_play_job, jobs):
+            records[names_pair].extend(job_records)
+    return summarize(names, records)
+
+def print_summary(summary: Dict[str, Any]):
+    print("Elo:")
+    for name, rating in sorted(summary['elo'].items(), key=lambda item: -item[1]):
+        print(f"  {name:<20} {rating:7.0f}")
+    print("Pairings:")
+    for pairing, stats in summary['pairings'].items():
+        low, high = stats['score_interval']
+        print(f"  {pairing:<36} score {stats['score']:.3f} [{low:.3f}, {high:.3f}]  "
+              f"{stats['draws']} draws of {stats['games']}  turns mean {stats['turns']['mean']:.0f} median {stats['turns']['median']:.0f}  "
+              f"first player wins {stats['first_player_win_rate']:.1%}")
+
+if __name__ == "__main__":
+    # agents that search are slow, so only play them when they're asked for
+    default_agents = [name for name, config in configs.items() if config.search is None and os.path.exists(config.data_path)]
+    parser = argparse.ArgumentParser(description="Play agents against each other and rate them.")
+    parser.add_argument("--agents", nargs="+", choices=list(configs), default=default_agents)
+    parser.add_argument("--deals", type=int, default=100, help="deals per pairing. each gets played twice, once with each agent going first")
+    parser.add_argument("--games-per-job", type=int, default=50, help="games a worker plays at once")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stock-pile-size", type=int, default=20)
+    parser.add_argument("--max-turns", type=int, default=1000)
+    parser.add_argument("--deterministic", action="store_true", help="always play the network's most likely move instead of sampling")
+    parser.add_argument("--out", default=None, help="save the results as json here")
+    args = parser.parse_args()
+
+    summary = run_arena(args.agents, args.deals, args.games_per_job, args.processes, args.seed,
+                        args.stock_pile_size, args.max_turns, args.deterministic)
+    print_summary(summary)
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
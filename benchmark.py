@@ -0,0 +1,327 @@
+# benchmark.py
+# how fast the environment runs, and where the time goes.
+# every workload is seeded and picks random legal moves in place of a network, so two runs on the same machine
+# do the same work. results are saved as json, and can be checked against a saved baseline for regressions.
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from env import (
+    SkipBoEngine, SkipBoMutator, SkipBoAction, SkipBoTerminalCondition, SkipBoTruncationCondition,
+    IoObsBuilder, GanymedeObsBuilder, CallistoObsBuilder, HimaliaObsBuilder,
+    GeneralActionParser, AmaltheaActionParser, HimaliaActionParser,
+    legal_move_mask, moves_in_mask,
+)
+from profiler import COMPONENTS
+from vector_env import VectorSkipBoEngine
+import rewards
+from train import build_rlgym_v2_env
+
+OBS_BUILDERS = {
+    'io': IoObsBuilder,
+    'ganymede': GanymedeObsBuilder,
+    'callisto': CallistoObsBuilder,
+    'himalia': HimaliaObsBuilder,
+}
+ACTION_PARSERS = {
+    'general': GeneralActionParser,
+    'amalthea': AmaltheaActionParser,
+    'himalia': HimaliaActionParser,
+}
+REWARDS = ['IoReward', 'EuropaReward', 'GanymedeReward', 'CallistoReward', 'AmaltheaReward', 'HimaliaReward']
+
+
+class Timers:
+    """A class to represent call counts and total time for named methods, timed by wrapping them on their instance."""
+    def __init__(self):
+        self.calls: Dict[str, int] = {}
+        self.seconds: Dict[str, float] = {}
+
+    def wrap(self, obj: Any, method: str, name: str):
+        inner = getattr(obj, method)
+        self.calls[name] = 0
+        self.seconds[name] = 0.0
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return inner(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+        # an instance attribute wins over the class's method, so only this object gets timed
+        setattr(obj, method, timed)
+
+    def time(self, name: str, fn: Callable[[], Any]):
+        """Time a single call that isn't a method on something."""
+        start = time.perf_counter()
+        result = fn()
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return result
+
+    def report(self, total_seconds: float) -> Dict[str, Dict[str, float]]:
+        return {name: {
+            'calls': self.calls[name],
+            'seconds': self.seconds[name],
+            'us_per_call': 1e6 * self.seconds[name] / self.calls[name] if self.calls[name] > 0 else 0.0,
+            'share': self.seconds[name] / total_seconds if total_seconds > 0 else 0.0,
+        } for name in self.calls}
+
+
+def bench_rlgym(steps: int, seed: int) -> Dict[str, Any]:
+    """The training env from train.py, picking a random real move from the move list each step."""
+    env = build_rlgym_v2_env(seed)
+    timers = Timers()
+    # the same parts the training profiler times, so the numbers line up
+    for attribute, method, name in COMPONENTS:
+        timers.wrap(getattr(env, attribute), method, name)
+    timers.wrap(env.transition_engine, '_draw_cards', 'engine._draw_cards')
+
+    rng = np.random.default_rng(seed)
+    episodes = 0
+    start = time.perf_counter()
+    env.reset()
+    for _ in range(steps):
+        legal_slots = np.flatnonzero(env.shared_info['action_mask'])
+        _, _, terminated, truncated = env.step({0: np.array([rng.choice(legal_slots)])})
+        if terminated[0] or truncated[0]:
+            episodes += 1
+            env.reset()
+    seconds = time.perf_counter() - start
+    return {
+        'steps': steps,
+        'episodes': episodes,
+        'seconds': seconds,
+        'steps_per_sec': steps / seconds,
+        'episodes_per_sec': episodes / seconds,
+        'components': timers.report(seconds),
+    }
+
+
+def bench_engine(steps: int, seed: int) -> Dict[str, Any]:
+    """Just the engine and mutator, stepping random legal moves."""
+    engine = SkipBoEngine(2, seed=seed)
+    mutator = SkipBoMutator(2, 20, seed=seed + 1)
+    termination = SkipBoTerminalCondition()
+    truncation = SkipBoTruncationCondition()
+    timers = Timers()
+    timers.wrap(engine, 'step', 'engine.step')
+    timers.wrap(engine, '_draw_cards', 'engine._draw_cards')
+    timers.wrap(mutator, 'apply', 'mutator.apply')
+    rng = random.Random(seed)
+
+    def new_game():
+        state = engine.create_base_state()
+        mutator.apply(state, {})
+        engine.reset(state)
+
+    episodes = 0
+    start = time.perf_counter()
+    new_game()
+    for _ in range(steps):
+        move = rng.choice(moves_in_mask(legal_move_mask(engine.state)))
+        engine.step({0: SkipBoAction(*move)}, {})
+        if termination.is_done([0], engine.state, {})[0] or truncation.is_done([0], engine.state, {})[0]:
+            episodes += 1
+            new_game()
+    seconds = time.perf_counter() - start
+    return {
+        'steps': steps,
+        'episodes': episodes,
+        'seconds': seconds,
+        'steps_per_sec': steps / seconds,
+        'episodes_per_sec': episodes / seconds,
+        'components': timers.report(seconds),
+    }
+
+
+# every (card_source, card_destination) pair, in VectorSkipBoEngine.legal_moves order
+ALL_MOVES = np.array([(src, dst) for src in range(10) for dst in range(8)])
+
+def bench_vector(steps: int, seed: int, num_games: int = 4096) -> Dict[str, Any]:
+    """
+    VectorSkipBoEngine stepping num_games games at once with random legal moves, steps game steps in total.
+    steps_per_sec counts everything, picking the moves included, like the engine workload does.
+    The times per call are for all num_games games, so per game step they're that over num_games.
+    """
+    engine = VectorSkipBoEngine(num_games, seed=seed)
+    timers = Timers()
+    timers.wrap(engine, 'step', 'vector.step')
+    timers.wrap(engine, '_draw_cards', 'vector._draw_cards')
+    timers.wrap(engine, 'legal_moves', 'vector.legal_moves')
+    rng = np.random.default_rng(seed)
+    rounds = max(1, steps // num_games)
+
+    def pick_moves():
+        legal = engine.legal_moves()
+        # a random legal move per game (the first move, invalid, for a game with none)
+        keys = legal * rng.random(legal.shape, dtype=np.float32)
+        return ALL_MOVES[keys.argmax(axis=1)]
+
+    episodes = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        moves = timers.time('pick_moves', pick_moves)
+        _, terminated, truncated = engine.step(moves)
+        episodes += int((terminated | truncated).sum())
+    seconds = time.perf_counter() - start
+    components = timers.report(seconds)
+    return {
+        'steps': rounds * num_games,
+        'episodes': episodes,
+        'seconds': seconds,
+        'steps_per_sec': rounds * num_games / seconds,
+        'episodes_per_sec': episodes / seconds,
+        'num_games': num_games,
+        'components': components,
+    }
+
+
+def _recorded_positions(count: int, seed: int):
+    """count (state, shared_info) pairs from seeded random games of the training env."""
+    env = build_rlgym_v2_env(seed)
+    rng = np.random.default_rng(seed)
+    positions = []
+    env.reset()
+    while len(positions) < count:
+        legal_slots = np.flatnonzero(env.shared_info['action_mask'])
+        idx = rng.choice(legal_slots)
+        _, _, terminated, truncated = env.step({0: np.array([idx])})
+        shared_info = {key: value for key, value in env.shared_info.items() if key not in ('state_version',)}
+        shared_info['raw_action_idx'] = int(idx)
+        positions.append((env.state.copy(), shared_info))
+        if terminated[0] or truncated[0]:
+            env.reset()
+    return positions
+
+
+def bench_components(count: int, seed: int) -> Dict[str, Any]:
+    """Every obs builder, action parser, reward and done condition on its own, over the same recorded positions."""
+    positions = _recorded_positions(count, seed)
+    timers = Timers()
+    for name, builder_class in OBS_BUILDERS.items():
+        builder = builder_class()
+        for state, shared_info in positions:
+            timers.time(f'obs_builder.{name}', lambda: builder.build_obs([0], state, dict(shared_info)))
+        states = [state for state, _ in positions]
+        timers.time(f'obs_builder.{name}.batch', lambda: builder.build_obs_batch(states))
+    rng = np.random.default_rng(seed)
+    for name, parser_class in ACTION_PARSERS.items():
+        parser = parser_class()
+        n_actions = parser.get_action_space(0)[1]
+        for state, shared_info in positions:
+            action = {0: np.array([rng.integers(n_actions)])}
+            timers.time(f'action_parser.{name}', lambda: parser.parse_actions(action, state, shared_info))
+    for reward_name in REWARDS:
+        reward_fn = getattr(rewards, reward_name)()
+        for state, shared_info in positions:
+            timers.time(f'reward.{reward_name}', lambda: reward_fn.get_rewards([0], state, {0: False}, {0: False}, shared_info))
+    for name, condition in (('termination', SkipBoTerminalCondition()), ('truncation', SkipBoTruncationCondition())):
+        for state, shared_info in positions:
+            timers.time(f'done.{name}', lambda: condition.is_done([0], state, shared_info))
+    seconds = sum(timers.seconds.values())
+    return {'positions': count, 'seconds': seconds, 'components': timers.report(seconds)}
+
+
+WORKLOADS = {
+    'rlgym': bench_rlgym,
+    'engine': bench_engine,
+    'vector': bench_vector,
+    'components': bench_components,
+}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(workloads: List[str], steps: int, seed: int) -> Dict[str, Any]:
+    results = {
+        'meta': {
+            'time': time.time(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'steps': steps,
+            'seed': seed,
+        },
+        'workloads': {},
+    }
+    for name in workloads:
+        # the components workload times each piece once per position, so it doesn't need as many
+        results['workloads'][name] = WORKLOADS[name](steps if name != 'components' else max(1, steps // 10), seed)
+    return results
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_us: float = 0.5) -> List[str]:
+    """
+    Everything that got more than tolerance slower than the baseline: throughput, and time per call of each component.
+    A component also has to be at least min_us slower per call, so timer noise on the tiny ones doesn't count.
+    """
+    regressions = []
+    for name, workload in results['workloads'].items():
+        base = baseline.get('workloads', {}).get(name)
+        if base is None:
+            continue
+        if 'steps_per_sec' in workload and workload['steps_per_sec'] < base['steps_per_sec'] * (1 - tolerance):
+            regressions.append(f"{name}: {workload['steps_per_sec']:.0f} steps/sec, baseline {base['steps_per_sec']:.0f}")
+        for component, stats in workload['components'].items():
+            base_stats = base['components'].get(component)
+            if base_stats is None or base_stats['us_per_call'] == 0:
+                continue
+            slower_by = stats['us_per_call'] - base_stats['us_per_call']
+            if slower_by > base_stats['us_per_call'] * tolerance and slower_by > min_us:
+                regressions.append(f"{name}/{component}: {stats['us_per_call']:.2f} us/call, baseline {base_stats['us_per_call']:.2f}")
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    for name, workload in results['workloads'].items():
+        if 'steps_per_sec' in workload:
+            print(f"{name}: {workload['steps_per_sec']:.0f} steps/sec, {workload['episodes_per_sec']:.2f} episodes/sec ({workload['steps']} steps in {workload['seconds']:.2f}s)")
+            if 'num_games' in workload:
+                print(f"  {workload['num_games']} games at once")
+        else:
+            print(f"{name}: {workload['positions']} positions in {workload['seconds']:.2f}s")
+        for component, stats in sorted(workload['components'].items(), key=lambda item: -item[1]['seconds']):
+            print(f"  {component:<36} {stats['calls']:>8} calls  {stats['us_per_call']:>9.2f} us/call  {stats['share']:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Skip-Bo environment.")
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--steps", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="save the results as json here")
+    parser.add_argument("--baseline", default=None, help="a saved results json to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="how much slower than the baseline counts as a regression")
+    parser.add_argument("--min-us", type=float, default=0.5, help="how many microseconds per call slower a component has to be to count")
+    args = parser.parse_args()
+
+    results = run(args.workloads, args.steps, args.seed)
+    print_results(results)
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_us)
+        if len(regressions) > 0:
+            print("Regressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            raise SystemExit(1)
+        print("No regressions against the baseline.")
@@ -1,7 +1,10 @@
 from env import AmaltheaActionParser, HimaliaActionParser, HimaliaObsBuilder, CallistoObsBuilder, GanymedeObsBuilder, GeneralActionParser, IoObsBuilder
 
+from search import SearchConfig, TurnPlanConfig
+
 from rlgym.api import ObsBuilder, ActionParser
 from dataclasses import dataclass
+from typing import Optional, Union
 
 @dataclass
 class AgentConfig:
@@ -13,6 +16,8 @@ class AgentConfig:
     action_parser: ActionParser
     description: str
     skill_rating: str
+    search: Optional[Union[SearchConfig, TurnPlanConfig]] = None # if set, the agent searches ahead instead of just asking the network
+    mask_actions: bool = False # never let the network pick a padding slot of the obs builder's move list
 
 
 configs = {
@@ -72,7 +77,8 @@ configs = {
         n_actions=20,
         layer_sizes=[256, 256, 256],
         obs_builder=HimaliaObsBuilder(),
-        action_parser=HimaliaActionParser(),
+        action_parser=HimaliaActionParser(masked=True),
+        mask_actions=True,
         description="Only allowed to pick from a list of possible moves.",
         skill_rating="1 - plays to build piles, but not intelligently",
     ),
@@ -82,7 +88,8 @@ configs = {
         n_actions=20,
         layer_sizes=[256, 256, 256],
         obs_builder=HimaliaObsBuilder(),
-        action_parser=HimaliaActionParser(),
+        action_parser=HimaliaActionParser(masked=True),
+        mask_actions=True,
         description="Same setup as Himalia, but trained for longer.",
         skill_rating="2 - occasional signs of intelligent play",
     ),
@@ -92,8 +99,33 @@ configs = {
         n_actions=20,
         layer_sizes=[256, 256, 256],
         obs_builder=HimaliaObsBuilder(),
-        action_parser=HimaliaActionParser(),
+        action_parser=HimaliaActionParser(masked=True),
+        mask_actions=True,
         description="Same setup as Himalia, but trained for 100x longer.",
         skill_rating="3 - signs of intelligent play",
     ),
+    "pasiphae-search": AgentConfig(
+        data_path="agents/pasiphae.pt",
+        input_size=73,
+        n_actions=20,
+        layer_sizes=[256, 256, 256],
+        obs_builder=HimaliaObsBuilder(),
+        action_parser=HimaliaActionParser(masked=True),
+        mask_actions=True,
+        description="Pasiphae, but searching ahead for half a second before each move.",
+        skill_rating="3 - signs of intelligent play",
+        search=SearchConfig(time_budget=0.5),
+    ),
+    "pasiphae-planner": AgentConfig(
+        data_path="agents/pasiphae.pt",
+        input_size=73,
+        n_actions=20,
+        layer_sizes=[256, 256, 256],
+        obs_builder=HimaliaObsBuilder(),
+        action_parser=HimaliaActionParser(masked=True),
+        mask_actions=True,
+        description="Plans out each whole turn at once instead of asking the network card by card.",
+        skill_rating="3 - signs of intelligent play",
+        search=TurnPlanConfig(),
+    ),
 }
\ No newline at end of file
@@ -1,30 +1,144 @@
+import copy
+import math
+import threading
+from typing import Any, Dict, Optional
 import torch
 import numpy as np
 from rlgym_learn_algos.ppo.discrete_actor import DiscreteFF
+from rlgym_learn_algos.ppo.basic_critic import BasicCritic
+from masked_actor import MaskedDiscreteFF
 from colored import Fore, Style
 
 from bot_configs import configs, AgentConfig
 from env import SkipBoEngine, SkipBoMutator, SkipBoTerminalCondition, SkipBoState, SkipBoAction
+from search import ISMCTS, TurnPlanConfig, TurnPlanner, TranspositionTable, position_key, winner
+
+class PerThread:
+    """A class to represent a separate copy of something for every thread that uses it, for things with their own mutable state (like an obs builder's rng and cache)."""
+    def __init__(self, original):
+        self.original = original
+        self._local = threading.local()
+
+    def get(self):
+        copied = getattr(self._local, 'copy', None)
+        if copied is None:
+            copied = self._local.copy = copy.deepcopy(self.original)
+        return copied
+
+class CriticEvaluator:
+    """Scores positions for the turn planner with a trained critic network."""
+    def __init__(self, config: AgentConfig, critic_path: str):
+        self.model = BasicCritic(config.input_size, config.layer_sizes, "cpu")
+        self.model.load_state_dict(torch.load(critic_path, map_location="cpu"))
+        self.model.eval()
+        self.obs_builder = PerThread(config.obs_builder)
+
+    def __call__(self, state: SkipBoState, player: int) -> float:
+        won_by = winner(state)
+        if won_by is not None:
+            return math.inf if won_by == player else -math.inf
+        obs = self.obs_builder.get().build_obs([0], state, {})[0]
+        with torch.no_grad():
+            value = float(self.model([0], [obs])[0, 0])
+        # the critic scores the state for whoever's turn it is
+        return value if state.current_player == player else -value
 
 class Agent:
     def __init__(self, config: AgentConfig):
-        self.model = DiscreteFF(
-            input_size=config.input_size,
-            n_actions=config.n_actions,
-            layer_sizes=config.layer_sizes,
-            device="cpu"
-        )
+        if config.mask_actions:
+            self.model = MaskedDiscreteFF(
+                input_size=config.input_size,
+                n_actions=config.n_actions,
+                layer_sizes=config.layer_sizes,
+                device="cpu",
+                mask_offset=config.obs_builder.spec.offsets['possible_moves']
+            )
+        else:
+            self.model = DiscreteFF(
+                input_size=config.input_size,
+                n_actions=config.n_actions,
+                layer_sizes=config.layer_sizes,
+                device="cpu"
+            )
         self.model.load_state_dict(torch.load(config.data_path, map_location="cpu"))
         self.model.eval()
-        self.obs_builder = config.obs_builder
-        self.action_parser = config.action_parser
+        # every thread gets its own, so concurrent moves don't share a cache or an rng
+        self.obs_builder = PerThread(config.obs_builder)
+        self.action_parser = PerThread(config.action_parser)
+        self.search_config = config.search
+        self.masked = config.mask_actions
+        self.evaluator = None
+        if isinstance(self.search_config, TurnPlanConfig) and self.search_config.evaluator == "critic":
+            self.evaluator = CriticEvaluator(config, self.search_config.critic_path)
+        # the rest of the last planned turns, keyed by the position each move should be played from
+        self._planned_moves = {}
+        self._planned_moves_lock = threading.Lock()
+        # evaluations of positions, shared between plans so repeated positions don't get re-scored (it locks itself)
+        self.table = TranspositionTable()
 
-    def get_action(self, state: SkipBoState):
-        # Convert the observation to the format expected by the model
+    def move_priors(self, state: SkipBoState):
+        """How likely the network is to play each (card_source, card_destination) move."""
         shared_info = {}
-        obs = self.obs_builder.build_obs([0], state, shared_info)[0]
-        out, weights = self.model.get_action([0], [obs])
-        action = self.action_parser.parse_actions({0: out[0]}, state, shared_info)[0]
+        obs = self.obs_builder.get().build_obs([0], state, shared_info)[0]
+        with torch.no_grad():
+            probs = self.model.get_output([obs])[0].numpy()
+        priors = {}
+        action_parser = self.action_parser.get()
+        possible_moves = shared_info.get('possible_moves')
+        for idx, prob in enumerate(probs):
+            if self.masked and possible_moves is not None and possible_moves[idx][0] == -1:
+                # a padding slot the network can't pick
+                continue
+            # go through the action parser, so the priors land where the network's choices would actually end up
+            action = action_parser.parse_actions({0: np.array([idx])}, state, shared_info)[0]
+            move = (action.card_source, action.card_destination)
+            priors[move] = priors.get(move, 0.0) + float(prob)
+        return priors
+
+    def _planned_move(self, state: SkipBoState):
+        """The next move of the turn being played, planning the turn first if needed."""
+        with self._planned_moves_lock:
+            move = self._planned_moves.pop(position_key(state, canonical=False), None)
+        if move is not None and SkipBoEngine.is_action_valid(SkipBoAction(*move), state):
+            return move
+        plan = TurnPlanner(self.search_config, self.evaluator, len(state.player_states), self.table).plan(state)
+        if len(plan) == 0:
+            return None
+        # remember where each later move in the plan should be played from
+        engine = SkipBoEngine(len(state.player_states))
+        engine.reset(state.copy())
+        planned_moves = {}
+        for planned in plan:
+            planned_moves[position_key(engine.state, canonical=False)] = planned
+            engine.step({0: SkipBoAction(*planned)}, {})
+        planned_moves.pop(position_key(state, canonical=False), None)
+        with self._planned_moves_lock:
+            if len(self._planned_moves) > 10_000:
+                self._planned_moves.clear()
+            self._planned_moves.update(planned_moves)
+        return plan[0]
+
+    def get_action(self, state: SkipBoState, shared_info: Optional[Dict[str, Any]] = None, search: bool = True):
+        """
+        Pick a move. shared_info can carry a 'state_version' so an obs already built for this state gets reused.
+        Safe to call from several threads at once. With search off, just ask the network, even if the config searches.
+        """
+        if search and self.search_config is not None:
+            if isinstance(self.search_config, TurnPlanConfig):
+                move = self._planned_move(state)
+            else:
+                # a new searcher per call, so concurrent requests don't share a tree
+                move = ISMCTS(self.search_config, self.move_priors, len(state.player_states)).search(state)
+            if move is not None:
+                action = SkipBoAction(*move)
+                print(f"action: {action}")
+                return action
+        # Convert the observation to the format expected by the model
+        shared_info = dict(shared_info) if shared_info is not None else {}
+        obs = self.obs_builder.get().build_obs([0], state, shared_info)[0]
+        with torch.no_grad():
+            out, weights = self.model.get_action([0], [obs])
+        action = self.action_parser.get().parse_actions({0: out[0]}, state, shared_info)[0]
         print(f"action: {action}")
         return action
 
@@ -0,0 +1,276 @@
+# compact_state.py
+# an alternative, array-backed representation of SkipBoState
+# every game lives in one preallocated int16 buffer: a small header, a length counter per pile,
+# the hands, and a fixed-capacity slot for every pile. piles are exposed as zero-copy numpy views.
+# it is NOT a drop-in for SkipBoState: the piles are numpy views, not lists, so nothing that appends, pops, slices or
+# concatenates piles works on it. that means SkipBoEngine (step and _draw_cards), SkipBoEngine.is_action_valid, the
+# obs blocks in env.py and search.py all still need a SkipBoState, and SkipBoEngine.reset refuses a compact one.
+# for now only vector_env (which has its own engine over the pile primitives below) and reward_replay use it, so
+# the train.py env processes still pay the list-based per-step cost. converting them means rewriting those on
+# top of size/top/push/pop/set_pile, the way vector_env does. until then use to_state() to hand a game to them.
+
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+from env import PlayerState, SkipBoAction, SkipBoLastStep, SkipBoState, Card
+
+# 12 of each card from 1-12 and 18 skipbo cards
+DECK_SIZE = 162
+HAND_SIZE = 5
+NUM_BUILD_PILES = 4
+NUM_DISCARD_PILES = 4
+BUILD_PILE_CAPACITY = 12 # a build pile is cleared as soon as it reaches 12 cards
+
+# header slots
+HDR_CURRENT_PLAYER = 0
+HDR_NUM_TURNS = 1
+HDR_INVALID_ACTIONS = 2
+HDR_HAS_LAST_STEP = 3
+HDR_LAST_SRC = 4
+HDR_LAST_DST = 5
+HDR_LAST_TAKEN_BY = 6
+HDR_LAST_WAS_VALID = 7
+HEADER_SIZE = 8
+
+DTYPE = np.int16
+
+
+class CompactLayout:
+    """A class to represent where everything lives inside a compact game buffer."""
+    def __init__(self, num_players: int = 2, stock_capacity: int = 30, discard_capacity: int = DECK_SIZE):
+        self.num_players = num_players
+        self.stock_capacity = stock_capacity
+        self.discard_capacity = discard_capacity
+
+        # pile ids: per player, the stock pile then the 4 discard piles. then build piles, draw pile, completed piles
+        self.num_piles = num_players * (1 + NUM_DISCARD_PILES) + NUM_BUILD_PILES + 2
+        self.draw_pile_id = self.num_piles - 2
+        self.completed_pile_id = self.num_piles - 1
+
+        self.lengths_offset = HEADER_SIZE
+        self.hands_offset = self.lengths_offset + self.num_piles
+        offset = self.hands_offset + num_players * HAND_SIZE
+        offsets = []
+        capacities = []
+        for pile_id in range(self.num_piles):
+            capacity = self._capacity_of(pile_id)
+            offsets.append(offset)
+            capacities.append(capacity)
+            offset += capacity
+        self.pile_offsets = np.array(offsets, dtype=np.int64)
+        self.pile_capacities = np.array(capacities, dtype=np.int64)
+        self.size = offset
+
+    def _capacity_of(self, pile_id: int) -> int:
+        if pile_id < self.num_players * (1 + NUM_DISCARD_PILES):
+            return self.stock_capacity if pile_id % (1 + NUM_DISCARD_PILES) == 0 else self.discard_capacity
+        if pile_id < self.draw_pile_id:
+            return BUILD_PILE_CAPACITY
+        return DECK_SIZE
+
+    def stock_id(self, player: int) -> int:
+        return player * (1 + NUM_DISCARD_PILES)
+
+    def discard_id(self, player: int, pile: int) -> int:
+        return player * (1 + NUM_DISCARD_PILES) + 1 + pile
+
+    def build_id(self, pile: int) -> int:
+        return self.num_players * (1 + NUM_DISCARD_PILES) + pile
+
+    def hand_offset(self, player: int) -> int:
+        return self.hands_offset + player * HAND_SIZE
+
+    def __eq__(self, other):
+        return isinstance(other, CompactLayout) and (self.num_players, self.stock_capacity, self.discard_capacity) == (other.num_players, other.stock_capacity, other.discard_capacity)
+
+
+class CompactPlayerState:
+    """A zero-copy view of one player inside a CompactSkipBoState. Mirrors PlayerState."""
+    def __init__(self, game: 'CompactSkipBoState', player: int):
+        self._game = game
+        self._player = player
+
+    @property
+    def hand(self) -> np.ndarray:
+        offset = self._game.layout.hand_offset(self._player)
+        return self._game.buffer[offset:offset + HAND_SIZE]
+
+    @property
+    def stock_pile(self) -> np.ndarray:
+        return self._game.pile(self._game.layout.stock_id(self._player))
+
+    @property
+    def discard_piles(self) -> List[np.ndarray]:
+        return [self._game.pile(self._game.layout.discard_id(self._player, i)) for i in range(NUM_DISCARD_PILES)]
+
+
+class CompactSkipBoState:
+    """A class to represent the state of the game in a single preallocated integer array."""
+    def __init__(self, layout: Optional[CompactLayout] = None, buffer: Optional[np.ndarray] = None):
+        self.layout = layout if layout is not None else CompactLayout()
+        if buffer is None:
+            buffer = np.zeros(self.layout.size, dtype=DTYPE)
+        elif buffer.shape != (self.layout.size,) or buffer.dtype != DTYPE:
+            raise ValueError(f"Buffer must be a {DTYPE.__name__} array of shape ({self.layout.size},), got {buffer.dtype} {buffer.shape}")
+        self.buffer = buffer
+        self._lengths = buffer[self.layout.lengths_offset:self.layout.lengths_offset + self.layout.num_piles]
+        self.player_states = [CompactPlayerState(self, i) for i in range(self.layout.num_players)]
+
+    # pile primitives. these are what an engine working on the compact state should use
+    def size(self, pile_id: int) -> int:
+        return int(self._lengths[pile_id])
+
+    def pile(self, pile_id: int) -> np.ndarray:
+        """A zero-copy view of the cards in a pile. index 0 is the bottom card."""
+        offset = self.layout.pile_offsets[pile_id]
+        return self.buffer[offset:offset + self._lengths[pile_id]]
+
+    def top(self, pile_id: int) -> Card:
+        """The top card of a pile, or 0 if it's empty."""
+        length = self._lengths[pile_id]
+        if length == 0:
+            return 0
+        return int(self.buffer[self.layout.pile_offsets[pile_id] + length - 1])
+
+    def push(self, pile_id: int, card: Card):
+        length = self._lengths[pile_id]
+        if length >= self.layout.pile_capacities[pile_id]:
+            raise ValueError(f"Pile {pile_id} is full ({length} cards)")
+        self.buffer[self.layout.pile_offsets[pile_id] + length] = card
+        self._lengths[pile_id] = length + 1
+
+    def pop(self, pile_id: int) -> Card:
+        length = self._lengths[pile_id]
+        if length == 0:
+            raise IndexError(f"pop from empty pile {pile_id}")
+        self._lengths[pile_id] = length - 1
+        return int(self.buffer[self.layout.pile_offsets[pile_id] + length - 1])
+
+    def set_pile(self, pile_id: int, cards):
+        if len(cards) > self.layout.pile_capacities[pile_id]:
+            raise ValueError(f"Pile {pile_id} can hold {self.layout.pile_capacities[pile_id]} cards, got {len(cards)}")
+        offset = self.layout.pile_offsets[pile_id]
+        self.buffer[offset:offset + len(cards)] = cards
+        self._lengths[pile_id] = len(cards)
+
+    # the same accessors as SkipBoState
+    @property
+    def build_piles(self) -> List[np.ndarray]:
+        return [self.pile(self.layout.build_id(i)) for i in range(NUM_BUILD_PILES)]
+
+    @property
+    def draw_pile(self) -> np.ndarray:
+        return self.pile(self.layout.draw_pile_id)
+
+    @property
+    def completed_build_piles(self) -> np.ndarray:
+        return self.pile(self.layout.completed_pile_id)
+
+    @property
+    def current_player(self) -> int:
+        return int(self.buffer[HDR_CURRENT_PLAYER])
+
+    @current_player.setter
+    def current_player(self, value: int):
+        self.buffer[HDR_CURRENT_PLAYER] = value
+
+    @property
+    def num_turns(self) -> int:
+        return int(self.buffer[HDR_NUM_TURNS])
+
+    @num_turns.setter
+    def num_turns(self, value: int):
+        self.buffer[HDR_NUM_TURNS] = value
+
+    @property
+    def invalid_actions_count(self) -> int:
+        return int(self.buffer[HDR_INVALID_ACTIONS])
+
+    @invalid_actions_count.setter
+    def invalid_actions_count(self, value: int):
+        self.buffer[HDR_INVALID_ACTIONS] = value
+
+    @property
+    def last_step(self) -> Optional[SkipBoLastStep]:
+        if self.buffer[HDR_HAS_LAST_STEP] == 0:
+            return None
+        return SkipBoLastStep(
+            action=SkipBoAction(int(self.buffer[HDR_LAST_SRC]), int(self.buffer[HDR_LAST_DST])),
+            taken_by=int(self.buffer[HDR_LAST_TAKEN_BY]),
+            was_valid=bool(self.buffer[HDR_LAST_WAS_VALID])
+        )
+
+    @last_step.setter
+    def last_step(self, value: Optional[SkipBoLastStep]):
+        if value is None:
+            self.buffer[HDR_HAS_LAST_STEP:HDR_LAST_WAS_VALID + 1] = 0
+            return
+        action = value.action
+        if isinstance(action, dict):
+            # SkipBoState.from_dict leaves the action as a dict
+            action = SkipBoAction(**action)
+        self.buffer[HDR_HAS_LAST_STEP] = 1
+        self.buffer[HDR_LAST_SRC] = action.card_source
+        self.buffer[HDR_LAST_DST] = action.card_destination
+        self.buffer[HDR_LAST_TAKEN_BY] = value.taken_by
+        self.buffer[HDR_LAST_WAS_VALID] = int(value.was_valid)
+
+    # conversion to and from the dataclass representation
+    @classmethod
+    def from_state(cls, state: SkipBoState, layout: Optional[CompactLayout] = None, buffer: Optional[np.ndarray] = None) -> 'CompactSkipBoState':
+        """Create a CompactSkipBoState from a SkipBoState. If a buffer is given, it is filled in place."""
+        if layout is None:
+            layout = CompactLayout(num_players=len(state.player_states),
+                                   stock_capacity=max(30, max(len(ps.stock_pile) for ps in state.player_states)))
+        compact = cls(layout, buffer)
+        compact.buffer[:] = 0
+        for i, ps in enumerate(state.player_states):
+            offset = layout.hand_offset(i)
+            compact.buffer[offset:offset + HAND_SIZE] = ps.hand
+            compact.set_pile(layout.stock_id(i), ps.stock_pile)
+            for j, discard_pile in enumerate(ps.discard_piles):
+                compact.set_pile(layout.discard_id(i, j), discard_pile)
+        for i, build_pile in enumerate(state.build_piles):
+            compact.set_pile(layout.build_id(i), build_pile)
+        # list() so a CountedDeck comes out as its cards
+        compact.set_pile(layout.draw_pile_id, list(state.draw_pile))
+        compact.set_pile(layout.completed_pile_id, list(state.completed_build_piles))
+        compact.current_player = state.current_player
+        compact.num_turns = state.num_turns
+        compact.invalid_actions_count = state.invalid_actions_count
+        compact.last_step = state.last_step
+        return compact
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], layout: Optional[CompactLayout] = None) -> 'CompactSkipBoState':
+        """Create a CompactSkipBoState from the same dictionary SkipBoState.from_dict accepts."""
+        return cls.from_state(SkipBoState.from_dict(data), layout)
+
+    def to_state(self) -> SkipBoState:
+        """Copy this state out into a regular SkipBoState."""
+        return SkipBoState(
+            player_states=[PlayerState(
+                hand=ps.hand.tolist(),
+                stock_pile=ps.stock_pile.tolist(),
+                discard_piles=[discard_pile.tolist() for discard_pile in ps.discard_piles]
+            ) for ps in self.player_states],
+            current_player=self.current_player,
+            build_piles=[build_pile.tolist() for build_pile in self.build_piles],
+            draw_pile=self.draw_pile.tolist(),
+            completed_build_piles=self.completed_build_piles.tolist(),
+            num_turns=self.num_turns,
+            invalid_actions_count=self.invalid_actions_count,
+            last_step=self.last_step
+        )
+
+    def copy(self) -> 'CompactSkipBoState':
+        return CompactSkipBoState(self.layout, self.buffer.copy())
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactSkipBoState) or self.layout != other.layout:
+            return NotImplemented
+        # only compare the live part of each pile
+        return self.to_state() == other.to_state()
+
+    def __repr__(self):
+        return f"CompactSkipBoState({self.to_state()})"
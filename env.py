@@ -6,11 +6,87 @@ from typing import Dict, List, Any, Optional
 import numpy as np
 import random
 from dataclasses import dataclass
-from rlgym.api import TransitionEngine, StateMutator, ObsBuilder, ActionParser, RewardFunction, DoneCondition
+from rlgym.api import TransitionEngine, StateMutator, ObsBuilder, ActionParser, RewardFunction, DoneCondition, SharedInfoProvider
+from profiler import profiler
+from telemetry import telemetry
 
 # 0 means no card, 1-12 are the cards, 13 is the skipbo card
 Card = int
 
+class CountedDeck:
+    """
+    A face-down pile of cards stored as how many of each card (1-13) are left, instead of in order.
+    Drawing samples a card by the remaining counts, which is the same as drawing from a shuffled pile,
+    so shuffling and merging piles is just adding up 13 counts. Stands in for draw_pile and completed_build_piles.
+    """
+    def __init__(self, counts: Optional[List[int]] = None, rng: Any = random):
+        self.counts: List[int] = list(counts) if counts is not None else [0] * 14 # counts[card]; counts[0] is unused
+        self._total = sum(self.counts)
+        self.rng = rng # anything with randrange
+
+    @classmethod
+    def full(cls, rng: Any = random) -> 'CountedDeck':
+        """A whole skipbo deck: 12 of each card from 1-12 and 18 skipbo cards."""
+        return cls([0] + [12] * 12 + [18], rng)
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __iter__(self):
+        # there's no order, so go from low to high
+        for card in range(1, 14):
+            for _ in range(self.counts[card]):
+                yield card
+
+    def pop(self) -> Card:
+        """Draw a random card."""
+        if self._total == 0:
+            raise IndexError("pop from empty deck")
+        r = self.rng.randrange(self._total)
+        for card in range(1, 14):
+            r -= self.counts[card]
+            if r < 0:
+                self.counts[card] -= 1
+                self._total -= 1
+                return card
+        raise AssertionError("unreachable")
+
+    def append(self, card: Card):
+        self.counts[card] += 1
+        self._total += 1
+
+    def __iadd__(self, cards):
+        if isinstance(cards, CountedDeck):
+            for card in range(1, 14):
+                self.counts[card] += cards.counts[card]
+            self._total += cards._total
+        else:
+            for card in cards:
+                self.append(card)
+        return self
+
+    def __add__(self, other) -> 'CountedDeck':
+        merged = self.copy()
+        merged += other
+        return merged
+
+    def remove(self, cards: List[Card]):
+        """Take specific cards back out (e.g. to undo a completed build pile)."""
+        for card in cards:
+            self.counts[card] -= 1
+        self._total -= len(cards)
+
+    def copy(self) -> 'CountedDeck':
+        return CountedDeck(self.counts, self.rng)
+
+    def __eq__(self, other):
+        if isinstance(other, CountedDeck):
+            return self.counts == other.counts
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CountedDeck({self.counts})"
+
 @dataclass
 class PlayerState:
     """A class to represent the state of a player in the game."""
@@ -65,11 +141,231 @@ class SkipBoState:
             last_step=SkipBoLastStep(**data['last_step']) if data.get('last_step') else None
         )
 
+    def copy(self) -> 'SkipBoState':
+        """Copy the state. Much faster than copy.deepcopy, since only the lists need copying."""
+        return SkipBoState(
+            player_states=[PlayerState(ps.hand[:], ps.stock_pile[:], [discard_pile[:] for discard_pile in ps.discard_piles]) for ps in self.player_states],
+            current_player=self.current_player,
+            build_piles=[build_pile[:] for build_pile in self.build_piles],
+            draw_pile=self.draw_pile.copy(),
+            completed_build_piles=self.completed_build_piles.copy(),
+            num_turns=self.num_turns,
+            invalid_actions_count=self.invalid_actions_count,
+            last_step=self.last_step # never mutated once the step that made it is over
+        )
+
+# legal moves as an 80-bit mask: bit (src * 8 + dst) is set if SkipBoAction(src, dst) is valid
+# 10 sources (0: stock pile, 1-5: hand, 6-9: discard piles) x 8 destinations (0-3: build piles, 4-7: discard piles)
+BUILD_MOVES_MASK = sum(0x0F << (src * 8) for src in range(10))
+DISCARD_MOVES_MASK = sum(0xF0 << (src * 8) for src in range(10))
+# only cards in the hand can be discarded, and only if there's actually a card there
+_DISCARD_BITS = [[0xF0 if 1 <= src <= 5 and value != 0 else 0 for value in range(14)] for src in range(10)]
+
+def _build_targets(build_heights: List[int]) -> List[int]:
+    """targets[value] is the 4-bit set of build piles a card of that value can be played on."""
+    targets = [0] * 14
+    for dst, height in enumerate(build_heights):
+        targets[height + 1] |= 1 << dst
+    targets[13] = 0x0F # skipbo cards go anywhere
+    return targets
+
+def legal_move_mask_from_tops(source_values: List[Card], build_heights: List[int]) -> int:
+    """Build the legal move mask from the 10 source cards and the 4 build pile heights."""
+    targets = _build_targets(build_heights)
+    mask = 0
+    for src, value in enumerate(source_values):
+        mask |= (targets[value] | _DISCARD_BITS[src][value]) << (src * 8)
+    return mask
+
+def _source_values(player_state: PlayerState) -> List[Card]:
+    """The card at each of the 10 sources, 0 where there isn't one."""
+    source_values = [player_state.stock_pile[-1] if len(player_state.stock_pile) > 0 else 0]
+    source_values += player_state.hand
+    source_values += [discard_pile[-1] if len(discard_pile) > 0 else 0 for discard_pile in player_state.discard_piles]
+    return source_values
+
+def legal_move_mask(state: SkipBoState) -> int:
+    """Compute the legal move mask for the current player."""
+    return legal_move_mask_from_tops(_source_values(state.player_states[state.current_player]),
+                                     [len(build_pile) for build_pile in state.build_piles])
+
+def get_legal_move_mask(state: SkipBoState, shared_info: Dict[str, Any]) -> int:
+    """Get the legal move mask from shared_info if SkipBoSharedInfoProvider put it there, otherwise compute it."""
+    if 'legal_moves' in shared_info:
+        return shared_info['legal_moves']
+    return legal_move_mask(state)
+
+def moves_in_mask(mask: int) -> List[tuple]:
+    """List the (src, dst) pairs in a legal move mask, ordered by src then dst."""
+    moves = []
+    while mask:
+        low_bit = mask & -mask
+        idx = low_bit.bit_length() - 1
+        moves.append((idx >> 3, idx & 7))
+        mask ^= low_bit
+    return moves
+
+def is_move_in_mask(mask: int, src: int, dst: int) -> bool:
+    if src < 0 or src > 9 or dst < 0 or dst > 7:
+        return False
+    return bool((mask >> (src * 8 + dst)) & 1)
+
+# moves that are interchangeable: playing either one leads to the same position up to the symmetries of the game.
+# cards in the hand with the same value are interchangeable, so are build piles of the same height, and so are identical discard piles (like empty ones).
+# symmetry_mask keeps the lowest (src, dst) of every group, so legal_moves & symmetry_mask(state) has one move per group.
+def symmetry_mask(state: SkipBoState) -> int:
+    """The moves that stand in for their group of interchangeable moves, as a move mask."""
+    ps = state.player_states[state.current_player]
+    sources = [0] # the stock pile is one of a kind
+    for i, card in enumerate(ps.hand):
+        if card not in ps.hand[:i]:
+            sources.append(1 + i)
+    destinations = 0
+    for dst, build_pile in enumerate(state.build_piles):
+        if all(len(build_pile) != len(other) for other in state.build_piles[:dst]):
+            destinations |= 1 << dst
+    for i, discard_pile in enumerate(ps.discard_piles):
+        if discard_pile not in ps.discard_piles[:i]:
+            sources.append(6 + i)
+            destinations |= 1 << (4 + i)
+    mask = 0
+    for src in sources:
+        mask |= destinations << (src * 8)
+    return mask
+
+def canonical_moves(state: SkipBoState, legal_moves: int) -> List[tuple]:
+    """One legal (src, dst) move of each group of interchangeable moves, ordered by src then dst."""
+    return moves_in_mask(legal_moves & symmetry_mask(state))
+
+# SkipBoEngine.version goes up every time the cards or the turn change, and SkipBoSharedInfoProvider puts it in
+# shared_info['state_version']. anything computed from a state can then be reused until the version moves on.
+# without a version (e.g. a state that didn't come from an engine) nothing is cached.
+class VersionCache:
+    """A class to represent a one-entry cache of something computed from a state, keyed on the state and its version."""
+    def __init__(self):
+        # (state, version, key, value), swapped in as one tuple so threads can't see half an entry
+        self._entry = (None, None, None, None)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, state: SkipBoState, version: Optional[int], key: Any = None):
+        """The cached value for this state at this version (and key, for anything else it depends on), or None."""
+        cached_state, cached_version, cached_key, value = self._entry
+        if version is not None and state is cached_state and version == cached_version and key == cached_key:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def store(self, state: SkipBoState, version: Optional[int], value: Any, key: Any = None):
+        if version is not None:
+            self._entry = (state, version, key, value)
+
+    def clear(self):
+        self._entry = (None, None, None, None)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+# zobrist hashing of states, up to the symmetries of the game:
+# hand order doesn't matter, build piles of the same height are interchangeable, and so are discard piles
+# (so empty ones are too). the draw pile and the completed build piles only count by size, since their order is hidden.
+# hands and build piles are hashed as multisets (one key per (value, how many of that value came before)),
+# each discard pile as a sequence, and a player's discard piles are summed rather than XORed so identical piles don't cancel.
+MAX_PLAYERS = 6
+_MASK64 = (1 << 64) - 1
+_zobrist_rng = random.Random(0x5B1B0)
+def _zobrist_keys(*shape):
+    if len(shape) == 1:
+        return [_zobrist_rng.getrandbits(64) for _ in range(shape[0])]
+    return [_zobrist_keys(*shape[1:]) for _ in range(shape[0])]
+_Z_TURN = _zobrist_keys(MAX_PLAYERS)
+_Z_HAND = _zobrist_keys(MAX_PLAYERS, 14, 5) # [player][card][copies of that card already in the hand]
+_Z_STOCK = _zobrist_keys(MAX_PLAYERS, 162, 14) # [player][depth][card]
+_Z_DISCARD = _zobrist_keys(MAX_PLAYERS, 162, 14) # [player][depth][card]
+_Z_BUILD = _zobrist_keys(13, 4) # [height][piles of that height already counted]
+_Z_DRAW = _zobrist_keys(163) # [cards in the draw pile]
+_Z_COMPLETED = _zobrist_keys(163) # [cards in the completed build piles]
+
+def _zobrist_hand(player: int, hand: List[Card]) -> int:
+    h = 0
+    seen = [0] * 14
+    for card in hand:
+        if card != 0:
+            h ^= _Z_HAND[player][card][seen[card]]
+            seen[card] += 1
+    return h
+
+def _zobrist_pile(keys: List[List[int]], pile: List[Card]) -> int:
+    h = 0
+    for depth, card in enumerate(pile):
+        h ^= keys[depth][card]
+    return h
+
+def _zobrist_build_piles(build_piles: List[List[Card]]) -> int:
+    h = 0
+    seen = [0] * 13
+    for build_pile in build_piles:
+        height = len(build_pile)
+        h ^= _Z_BUILD[height][seen[height]]
+        seen[height] += 1
+    return h
+
+def zobrist_hash(state: SkipBoState) -> int:
+    """Compute the 64-bit hash of a state from scratch. Symmetric states hash the same."""
+    h = _Z_TURN[state.current_player]
+    for player, ps in enumerate(state.player_states):
+        h ^= _zobrist_hand(player, ps.hand)
+        h ^= _zobrist_pile(_Z_STOCK[player], ps.stock_pile)
+        h ^= sum(_zobrist_pile(_Z_DISCARD[player], discard_pile) for discard_pile in ps.discard_piles) & _MASK64
+    h ^= _zobrist_build_piles(state.build_piles)
+    h ^= _Z_DRAW[len(state.draw_pile)] ^ _Z_COMPLETED[len(state.completed_build_piles)]
+    return h
+
+def canonical_key(state: SkipBoState) -> tuple:
+    """The exact canonical form that zobrist_hash hashes. Equal keys mean equivalent states."""
+    return (
+        state.current_player,
+        tuple((tuple(sorted(ps.hand)), tuple(ps.stock_pile), tuple(sorted(tuple(discard_pile) for discard_pile in ps.discard_piles)))
+              for ps in state.player_states),
+        tuple(sorted(len(build_pile) for build_pile in state.build_piles)),
+        len(state.draw_pile),
+        len(state.completed_build_piles),
+    )
+
 class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
     """A class to represent the game engine."""
-    def __init__(self, num_players: int = 2):
+    def __init__(self, num_players: int = 2, track_legal_moves: bool = False, debug_legal_moves: bool = False,
+                 track_hash: bool = False, debug_hash: bool = False, seed: Optional[int] = None):
         self.num_players = num_players
+        # all of the engine's randomness (reshuffles) comes from here, so a seeded engine plays out the same every time
+        self.rng = random.Random(seed)
+        # goes up whenever the cards or the turn change. invalid steps only touch last_step and the invalid count, so they don't count
+        self.version = 0
         self._state: SkipBoState = None # type: ignore # this will be set by the mutator before anything gets called
+        # optionally keep the legal move mask up to date as the game goes, instead of recomputing it every step
+        # debug mode checks every update against a full recomputation
+        self.track_legal_moves = track_legal_moves or debug_legal_moves
+        self.debug_legal_moves = debug_legal_moves
+        self._legal_moves = 0
+        self._source_values: List[Card] = [0] * 10
+        self._build_heights: List[int] = [0] * 4
+        self._build_targets: List[int] = [0] * 14
+        # optionally keep the zobrist hash of the state up to date as the game goes
+        # debug mode checks every update against a full recomputation
+        self.track_hash = track_hash or debug_hash
+        self.debug_hash = debug_hash
+        self._hash = 0
+        self._hand_hashes: List[int] = []
+        self._stock_hashes: List[int] = []
+        self._discard_hashes: List[List[int]] = []
+        self._build_hash = 0
+        self._piles_hash = 0
+        # undo log for search: one list of changes per pushed step. _recording is the one being filled in, if any
+        self._undo_log: List[List[tuple]] = []
+        self._recording: Optional[List[tuple]] = None
     
     @property
     def agents(self) -> List[int]:
@@ -86,6 +382,20 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
         """Current state of the game."""
         return self._state
     
+    @property
+    def legal_moves(self) -> int:
+        """The legal move mask for the current state (see legal_move_mask)."""
+        if not self.track_legal_moves:
+            return legal_move_mask(self._state)
+        return self._legal_moves
+
+    @property
+    def state_hash(self) -> int:
+        """The zobrist hash of the current state (see zobrist_hash)."""
+        if not self.track_hash:
+            return zobrist_hash(self._state)
+        return self._hash
+
     @property
     def config(self) -> Dict[str, Any]:
         return {}
@@ -173,13 +483,19 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
         # first, pick out the action whose turn it is
         current_player = self._state.current_player
         action = actions[0]
+        if self._recording is not None:
+            self._recording.append(('header', current_player, self._state.num_turns, self._state.invalid_actions_count, self._state.last_step))
         self._state.last_step = SkipBoLastStep(
             action=action,
             taken_by=current_player,
             was_valid=True
         )
         # check if the action is valid
-        if not self.is_action_valid(action, self._state):
+        if self.track_legal_moves:
+            is_valid = is_move_in_mask(self._legal_moves, action.card_source, action.card_destination)
+        else:
+            is_valid = self.is_action_valid(action, self._state)
+        if not is_valid:
             # if the action is invalid, increment the invalid actions count
             self._state.invalid_actions_count += 1
             # set the last step to invalid
@@ -191,6 +507,7 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
         
         # if the action is valid, reset the invalid actions count
         self._state.invalid_actions_count = 0
+        self.version += 1
         # ok now we actually play skipbo
         # first, grab the card from the source
         card_source = action.card_source
@@ -218,17 +535,32 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
         elif card_destination >= 4 and card_destination <= 7:
             # move to discard pile
             ps.discard_piles[card_destination - 4].append(card_value)
+        if self._recording is not None:
+            self._recording.append(('move', current_player, card_source, card_destination, card_value))
         
         # now, check if we need to do any game maintenance
         # do we need to remove a completed build pile?
         if card_destination <= 3 and len(self._state.build_piles[card_destination]) == 12:
             # if the build pile is complete, remove it from the game
+            if self._recording is not None:
+                self._recording.append(('complete', card_destination, self._state.build_piles[card_destination]))
             self._state.completed_build_piles += self._state.build_piles[card_destination]
             self._state.build_piles[card_destination] = []
+        if self.track_legal_moves:
+            # only the source and the destination changed
+            self._update_legal_source(card_source)
+            if card_destination <= 3:
+                self._update_legal_build_pile(card_destination, len(self._state.build_piles[card_destination]))
+            else:
+                # discard pile (dst - 4) is source (dst + 2)
+                self._update_legal_source(card_destination + 2)
         # do we need to draw new cards because we emptied our hand?
         if ps.hand.count(0) == 5:
             # if the hand is empty, draw new cards
             self._draw_cards(current_player)
+            if self.track_legal_moves:
+                for src in range(1, 6):
+                    self._update_legal_source(src)
         # do we need to end the turn because we discarded a card?
         if  card_destination >= 4 and card_destination <= 7:
             # if we discarded a card, end the turn
@@ -237,22 +569,140 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
             self._state.num_turns += 1
             # draw new cards for the next player
             self._draw_cards(self._state.current_player)
-        if not DO_LOG:
-            # 10 in 20k chance to print state anyways
-            if random.randint(0, 80_000) == 0:
-                print(self)
+            if self.track_legal_moves:
+                # every source belongs to someone else now
+                for src in range(10):
+                    self._update_legal_source(src)
+        if self.track_hash:
+            self._update_hash(current_player, card_source, card_destination, card_value)
+        if self.debug_legal_moves:
+            self._check_legal_moves()
+        if self.debug_hash:
+            self._check_hash()
+        if telemetry.enabled:
+            # every so often, keep the whole state around to look at later
+            telemetry.event('engine.valid_step', lambda: str(self))
         return self._state
 
+    def _rebuild_hash(self):
+        """Recompute the tracked hash and all of its parts from scratch."""
+        if self._state is None:
+            return
+        state = self._state
+        self._hand_hashes = [_zobrist_hand(player, ps.hand) for player, ps in enumerate(state.player_states)]
+        self._stock_hashes = [_zobrist_pile(_Z_STOCK[player], ps.stock_pile) for player, ps in enumerate(state.player_states)]
+        self._discard_hashes = [[_zobrist_pile(_Z_DISCARD[player], discard_pile) for discard_pile in ps.discard_piles]
+                                for player, ps in enumerate(state.player_states)]
+        self._build_hash = _zobrist_build_piles(state.build_piles)
+        self._piles_hash = _Z_DRAW[len(state.draw_pile)] ^ _Z_COMPLETED[len(state.completed_build_piles)]
+        h = _Z_TURN[state.current_player] ^ self._build_hash ^ self._piles_hash
+        for player in range(len(state.player_states)):
+            h ^= self._hand_hashes[player] ^ self._stock_hashes[player] ^ (sum(self._discard_hashes[player]) & _MASK64)
+        self._hash = h
+
+    def _set_discard_hash(self, player: int, pile: int, new_hash: int):
+        old_sum = sum(self._discard_hashes[player]) & _MASK64
+        self._discard_hashes[player][pile] = new_hash
+        self._hash ^= old_sum ^ (sum(self._discard_hashes[player]) & _MASK64)
+
+    def _set_hand_hash(self, player: int):
+        new_hash = _zobrist_hand(player, self._state.player_states[player].hand)
+        self._hash ^= self._hand_hashes[player] ^ new_hash
+        self._hand_hashes[player] = new_hash
+
+    def _update_hash(self, player: int, card_source: int, card_destination: int, card_value: Card):
+        """Update the tracked hash after a valid move. Only the parts the move touched are rehashed."""
+        state = self._state
+        ps = state.player_states[player]
+        # the source
+        if card_source == 0:
+            key = _Z_STOCK[player][len(ps.stock_pile)][card_value]
+            self._stock_hashes[player] ^= key
+            self._hash ^= key
+        elif card_source >= 6:
+            pile = card_source - 6
+            self._set_discard_hash(player, pile, self._discard_hashes[player][pile] ^ _Z_DISCARD[player][len(ps.discard_piles[pile])][card_value])
+        # the destination
+        if card_destination <= 3:
+            new_hash = _zobrist_build_piles(state.build_piles)
+            self._hash ^= self._build_hash ^ new_hash
+            self._build_hash = new_hash
+        else:
+            pile = card_destination - 4
+            self._set_discard_hash(player, pile, self._discard_hashes[player][pile] ^ _Z_DISCARD[player][len(ps.discard_piles[pile]) - 1][card_value])
+        # the hands, and the draw pile and completed build piles, which refills and reshuffles may have changed
+        self._set_hand_hash(player)
+        if state.current_player != player:
+            self._set_hand_hash(state.current_player)
+            self._hash ^= _Z_TURN[player] ^ _Z_TURN[state.current_player]
+        new_hash = _Z_DRAW[len(state.draw_pile)] ^ _Z_COMPLETED[len(state.completed_build_piles)]
+        self._hash ^= self._piles_hash ^ new_hash
+        self._piles_hash = new_hash
+
+    def _check_hash(self):
+        expected = zobrist_hash(self._state)
+        if expected != self._hash:
+            raise RuntimeError(f"Tracked hash {self._hash:#018x} doesn't match recomputed {expected:#018x} at state {self._state}")
+
+    def _rebuild_legal_moves(self):
+        """Recompute the tracked legal move mask from scratch."""
+        if self._state is None:
+            return
+        self._source_values = _source_values(self._state.player_states[self._state.current_player])
+        self._build_heights = [len(build_pile) for build_pile in self._state.build_piles]
+        self._build_targets = _build_targets(self._build_heights)
+        self._legal_moves = legal_move_mask_from_tops(self._source_values, self._build_heights)
+
+    def _update_legal_source(self, src: int):
+        """Refresh the 8 bits of the legal move mask that belong to one source."""
+        ps = self._state.player_states[self._state.current_player]
+        if src == 0:
+            value = ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0
+        elif src <= 5:
+            value = ps.hand[src - 1]
+        else:
+            value = ps.discard_piles[src - 6][-1] if len(ps.discard_piles[src - 6]) > 0 else 0
+        self._source_values[src] = value
+        shift = src * 8
+        self._legal_moves = (self._legal_moves & ~(0xFF << shift)) | ((self._build_targets[value] | _DISCARD_BITS[src][value]) << shift)
+
+    def _update_legal_build_pile(self, dst: int, new_height: int):
+        """Move one build pile to a new height, refreshing only the sources whose playability on it changed."""
+        old_value = self._build_heights[dst] + 1
+        new_value = new_height + 1
+        self._build_heights[dst] = new_height
+        bit = 1 << dst
+        self._build_targets[old_value] &= ~bit
+        self._build_targets[new_value] |= bit
+        for src, value in enumerate(self._source_values):
+            if value == old_value:
+                self._legal_moves &= ~(bit << (src * 8))
+            elif value == new_value:
+                self._legal_moves |= bit << (src * 8)
+
+    def _check_legal_moves(self):
+        expected = legal_move_mask(self._state)
+        if expected != self._legal_moves:
+            raise RuntimeError(f"Tracked legal moves {self._legal_moves:#022x} don't match recomputed {expected:#022x} at state {self._state}")
+
     def _draw_cards(self, player_id: int):
         """Draw up to 5 cards from the draw pile to the player's hand, reshuffling the draw pile if necessary."""
         ps = self._state.player_states[player_id]
         reshuffle_needed = ps.hand.count(0) > len(self._state.draw_pile)
         if reshuffle_needed:
             # reshuffle the draw pile
+            if self._recording is not None:
+                # both old lists are replaced rather than mutated, so they can just be put back
+                self._recording.append(('reshuffle', self._state.draw_pile, self._state.completed_build_piles))
             self._state.draw_pile = self._state.completed_build_piles + self._state.draw_pile
-            random.shuffle(self._state.draw_pile)
-            self._state.completed_build_piles = []
+            if isinstance(self._state.draw_pile, CountedDeck):
+                # a counted deck is always shuffled; merging the counts was all it took
+                self._state.completed_build_piles = CountedDeck(rng=self.rng)
+            else:
+                self.rng.shuffle(self._state.draw_pile)
+                self._state.completed_build_piles = []
         # draw cards
+        drawn = []
         for i in range(5):
             if ps.hand[i] == 0:
                 if len(self._state.draw_pile) == 0:
@@ -261,6 +711,81 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
                     break
                 card = self._state.draw_pile.pop()
                 ps.hand[i] = card
+                drawn.append(i)
+        if self._recording is not None:
+            self._recording.append(('draw', player_id, drawn))
+
+    def snapshot(self) -> SkipBoState:
+        """Take a copy of the current state that restore() can go back to."""
+        return self._state.copy()
+
+    def restore(self, snapshot: SkipBoState):
+        """Go back to a snapshot. The snapshot itself is left untouched, so it can be restored again."""
+        self._state = snapshot.copy()
+        self._undo_log.clear()
+        self.version += 1
+        if self.track_legal_moves:
+            self._rebuild_legal_moves()
+        if self.track_hash:
+            self._rebuild_hash()
+
+    @property
+    def undo_depth(self) -> int:
+        """How many pushed steps can be popped."""
+        return len(self._undo_log)
+
+    def push(self, actions: Dict[int, SkipBoAction], shared_info: Optional[Dict[str, Any]] = None) -> SkipBoState:
+        """Step the game forward like step(), but remember what changed so pop() can take it back."""
+        record: List[tuple] = []
+        self._recording = record
+        try:
+            self.step(actions, shared_info if shared_info is not None else {})
+        finally:
+            self._recording = None
+            self._undo_log.append(record)
+        return self._state
+
+    def pop(self) -> SkipBoState:
+        """Take back the most recently pushed step."""
+        state = self._state
+        for change in reversed(self._undo_log.pop()):
+            kind = change[0]
+            if kind == 'header':
+                _, state.current_player, state.num_turns, state.invalid_actions_count, state.last_step = change
+            elif kind == 'move':
+                _, player_id, src, dst, card = change
+                ps = state.player_states[player_id]
+                if dst <= 3:
+                    state.build_piles[dst].pop()
+                else:
+                    ps.discard_piles[dst - 4].pop()
+                if src == 0:
+                    ps.stock_pile.append(card)
+                elif src <= 5:
+                    ps.hand[src - 1] = card
+                else:
+                    ps.discard_piles[src - 6].append(card)
+            elif kind == 'complete':
+                _, dst, build_pile = change
+                if isinstance(state.completed_build_piles, CountedDeck):
+                    state.completed_build_piles.remove(build_pile)
+                else:
+                    del state.completed_build_piles[-len(build_pile):]
+                state.build_piles[dst] = build_pile
+            elif kind == 'draw':
+                _, player_id, drawn = change
+                hand = state.player_states[player_id].hand
+                for i in reversed(drawn):
+                    state.draw_pile.append(hand[i])
+                    hand[i] = 0
+            elif kind == 'reshuffle':
+                _, state.draw_pile, state.completed_build_piles = change
+        self.version += 1
+        if self.track_legal_moves:
+            self._rebuild_legal_moves()
+        if self.track_hash:
+            self._rebuild_hash()
+        return state
 
 
     def create_base_state(self):
@@ -278,11 +803,33 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
     
     def reset(self, initial_state: Optional[SkipBoState] = None) -> None:
         """Reset the engine with an optional initial state"""
+        if initial_state is not None and not isinstance(initial_state, SkipBoState):
+            # the engine pushes and pops piles as lists, a CompactSkipBoState needs to_state() first
+            raise TypeError(f"SkipBoEngine needs a SkipBoState, got {type(initial_state).__name__}")
         self._state = initial_state if initial_state is not None else self.create_base_state()
+        self._own_decks()
+        self.version += 1
+        if self.track_legal_moves:
+            self._rebuild_legal_moves()
+        if self.track_hash:
+            self._rebuild_hash()
+
+    def _own_decks(self):
+        # the mutator's rng only decides the deal. from here on a counted deck draws with the engine's rng,
+        # so the engine's seed alone decides every draw and reshuffle
+        for pile in (self._state.draw_pile, self._state.completed_build_piles):
+            if isinstance(pile, CountedDeck):
+                pile.rng = self.rng
 
     def set_state(self, desired_state, shared_info):
         """Set the state of the game to a desired state."""
         self._state = desired_state
+        self._own_decks()
+        self.version += 1
+        if self.track_legal_moves:
+            self._rebuild_legal_moves()
+        if self.track_hash:
+            self._rebuild_hash()
         return self._state
     
     def close(self):
@@ -303,18 +850,62 @@ class SkipBoEngine(TransitionEngine[int, SkipBoState, SkipBoAction]):
         return result
 
 
+# 12 of each card from 1-12 and 18 skipbo cards
+SKIPBO_DECK = np.array([i % 12 + 1 for i in range(144)] + [13] * 18, dtype=np.int16)
+
+def shuffled_decks(rng: np.random.Generator, count: int) -> np.ndarray:
+    """Shuffle count full decks with one draw of random sort keys. Returns a (count, 162) array, one deck per row."""
+    return SKIPBO_DECK[np.argsort(rng.random((count, len(SKIPBO_DECK))), axis=1)]
+
+class DealGenerator:
+    """A class to represent a seeded source of shuffled decks that makes them batch_size at a time."""
+    def __init__(self, batch_size: int = 256, seed: Optional[int] = None):
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        self._batch: List[List[Card]] = []
+        self._next = 0
+
+    def deal_batch(self, count: int) -> np.ndarray:
+        """count shuffled decks, one per row."""
+        return shuffled_decks(self.rng, count)
+
+    def next_deck(self) -> List[Card]:
+        """The next shuffled deck, top card last like draw_pile."""
+        if self._next >= len(self._batch):
+            self._batch = self.deal_batch(self.batch_size).tolist()
+            self._next = 0
+        deck = self._batch[self._next]
+        self._next += 1
+        return deck
+
 class SkipBoMutator(StateMutator[SkipBoState]):
     """A class to represent the state mutator."""
-    def __init__(self, num_players: int = 2, stock_pile_size: int = 20):
+    def __init__(self, num_players: int = 2, stock_pile_size: int = 20, counted_deck: bool = False,
+                 seed: Optional[int] = None, deals: Optional[DealGenerator] = None):
         super().__init__()
         self.num_players = num_players
         self.stock_pile_size = stock_pile_size
+        # keep the draw pile and completed build piles as CountedDecks instead of shuffled lists
+        self.counted_deck = counted_deck
+        self.rng = random.Random(seed)
+        # if given, decks come from here (pre-shuffled in batches) instead of being shuffled one at a time
+        self.deals = deals
     
     def apply(self, state, shared_info):
         """Set up a new game."""
-        # make a pile with 12 of each card from 1-12 and 18 skipbo cards
-        state.draw_pile = [i % 12 + 1 for i in range(144)] + [13]*18
-        random.shuffle(state.draw_pile)
+        if self.counted_deck:
+            self._apply_counted(state)
+            return
+        if self.deals is not None:
+            deck = self.deals.next_deck()
+        else:
+            deck = SKIPBO_DECK.tolist()
+            self.rng.shuffle(deck)
+        self.deal(state, deck)
+
+    def deal(self, state, deck: List[Card]):
+        """Set up a new game from an already shuffled deck. Handy for playing the same deal more than once."""
+        state.draw_pile = list(deck)
 
         for player_state in state.player_states:
             player_state.hand = [0] * 5
@@ -334,206 +925,562 @@ class SkipBoMutator(StateMutator[SkipBoState]):
         state.invalid_actions_count = 0
         state.last_step = None
 
-class IoObsBuilder(ObsBuilder[int, np.ndarray, SkipBoState, tuple]):
-    """A class to represent the observation builder."""
-    def get_obs_space(self, agent):
-        return 'real', 33
-    
-    def reset(self, agents, initial_state, shared_info):
-        pass
+    def _apply_counted(self, state):
+        """Set up a new game, dealing from a CountedDeck."""
+        state.draw_pile = CountedDeck.full(self.rng)
+        for player_state in state.player_states:
+            player_state.hand = [0] * 5
+            player_state.discard_piles = [[],[],[],[]]
+            player_state.stock_pile = [state.draw_pile.pop() for _ in range(self.stock_pile_size)]
+        state.player_states[0].hand = [state.draw_pile.pop() for _ in range(5)]
 
-    def build_obs(self, agents, state, shared_info):
-        observations = {}
+        state.current_player = 0
+        state.build_piles = [[],[],[],[]]
+        state.completed_build_piles = CountedDeck(rng=self.rng)
+        state.num_turns = 0
+        state.invalid_actions_count = 0
+        state.last_step = None
 
-        ps = state.player_states[state.current_player]
-        nps = state.player_states[(state.current_player + 1) % len(state.player_states)]
-        obs_py: list[int] = [
-            ps.stock_pile[-1], # len 1
-            len(ps.stock_pile), # len 1
-        ]
-        obs_py += ps.hand # len 5
-        # len(build_pile) will give the effective value of each pile
-        obs_py += [len(build_pile) for build_pile in state.build_piles] # len 4
-        # the top 3 cards of each discard pile, left-padded with 0s, and the size of each pile
-        discards = []
-        for discard_pile in ps.discard_piles:
-            discards += [0] * (3-len(discard_pile)) + discard_pile[-3:] + [len(discard_pile)]
-        obs_py += discards # len 16
-        obs_py += [
-            nps.stock_pile[-1], # len 1
-            len(nps.stock_pile)
-        ] # len 1
-        # the top card of each of nps's discard piles
-        obs_py += [discard_pile[-1] if len(discard_pile) > 0 else 0 for discard_pile in nps.discard_piles] # len 4
-        # total len 33
-        obs = np.array(obs_py, dtype=np.int32)
-        return {0: obs}
-
-class GanymedeObsBuilder(ObsBuilder[int, np.ndarray, SkipBoState, tuple]):
-    """A class to represent the observation builder."""
-    def get_obs_space(self, agent):
-        return 'real', 34
-    
-    def reset(self, agents, initial_state, shared_info):
-        pass
+class SkipBoSharedInfoProvider(SharedInfoProvider[int, SkipBoState]):
+    """Computes things every component needs once per step and puts them in shared_info."""
+    def __init__(self, engine: Optional[SkipBoEngine] = None, episode_stats=None):
+        # if given an engine that tracks its legal moves, take them from there instead of recomputing
+        # given any engine, pass its state version along so builders can skip unchanged states
+        self.engine = engine
+        self.legal_moves_cache = VersionCache()
+        # an episode_stats.EpisodeStats to feed every state to. what it collects goes out in shared_info['episode_stats']
+        self.episode_stats = episode_stats
 
-    def build_obs(self, agents, state, shared_info):
-        observations = {}
+    def _version(self, state) -> Optional[int]:
+        if self.engine is not None and self.engine.state is state:
+            return self.engine.version
+        return None
 
-        stock_pile_is_playable = state.player_states[state.current_player].stock_pile[-1] == len(state.build_piles[0]) + 1 or state.player_states[state.current_player].stock_pile[-1] == 13
+    def _legal_moves(self, state, version):
+        if self.engine is not None and self.engine.track_legal_moves and self.engine.state is state:
+            return self.engine.legal_moves
+        legal_moves = self.legal_moves_cache.lookup(state, version)
+        if legal_moves is None:
+            legal_moves = legal_move_mask(state)
+            self.legal_moves_cache.store(state, version, legal_moves)
+        return legal_moves
 
-        ps = state.player_states[state.current_player]
-        nps = state.player_states[(state.current_player + 1) % len(state.player_states)]
-        obs_py: list[int] = [
-            ps.stock_pile[-1], # len 1
-            len(ps.stock_pile), # len 1
-            int(stock_pile_is_playable), # len 1
-        ]
-        obs_py += ps.hand # len 5
-        # len(build_pile) will give the effective value of each pile
-        obs_py += [len(build_pile) for build_pile in state.build_piles] # len 4
-        # the top 3 cards of each discard pile, left-padded with 0s, and the size of each pile
-        discards = []
-        for discard_pile in ps.discard_piles:
-            discards += [0] * (3-len(discard_pile)) + discard_pile[-3:] + [len(discard_pile)]
-        obs_py += discards # len 16
-        obs_py += [
-            nps.stock_pile[-1], # len 1
-            len(nps.stock_pile)
-        ] # len 1
-        # the top card of each of nps's discard piles
-        obs_py += [discard_pile[-1] if len(discard_pile) > 0 else 0 for discard_pile in nps.discard_piles] # len 4
-        # total len 34
-        obs = np.array(obs_py, dtype=np.int32)
-        return {0: obs}
-
-class CallistoObsBuilder(ObsBuilder[int, np.ndarray, SkipBoState, tuple]):
-    """A class to represent the observation builder."""
-    def get_obs_space(self, agent):
-        return 'real', 39
-    
-    def reset(self, agents, initial_state, shared_info):
-        pass
+    def _fill(self, state, shared_info):
+        version = self._version(state)
+        if version is None:
+            shared_info.pop('state_version', None)
+        else:
+            shared_info['state_version'] = version
+        shared_info['legal_moves'] = self._legal_moves(state, version)
+        if telemetry.enabled:
+            # counts from the last flush, if there's been one since the last step. None otherwise
+            shared_info['telemetry'] = telemetry.take_counters()
+        if profiler.enabled:
+            # component times and stack samples every profiler.ship_interval seconds. None otherwise
+            shared_info['profile'] = profiler.take()
+        if self.episode_stats is not None:
+            shared_info['episode_stats'] = self.episode_stats.take()
+        return shared_info
+
+    def create(self, shared_info):
+        # anything in here describes the previous state
+        shared_info.pop('legal_moves', None)
+        shared_info.pop('state_version', None)
+        if telemetry.enabled:
+            shared_info['telemetry'] = None
+        if profiler.enabled:
+            shared_info['profile'] = None
+        if self.episode_stats is not None:
+            shared_info['episode_stats'] = None
+        return shared_info
+
+    def set_state(self, agents, initial_state, shared_info):
+        if self.episode_stats is not None:
+            self.episode_stats.start(initial_state)
+        return self._fill(initial_state, shared_info)
+
+    def step(self, agents, state, shared_info):
+        if self.episode_stats is not None:
+            self.episode_stats.step(state)
+        return self._fill(state, shared_info)
+
+def _write_discard_block(out, offset: int, discard_piles: List[List[Card]]):
+    """The top 3 cards of each discard pile, left-padded with 0s, and the size of each pile. 16 slots."""
+    for discard_pile in discard_piles:
+        n = len(discard_pile)
+        out[offset] = discard_pile[-3] if n >= 3 else 0
+        out[offset + 1] = discard_pile[-2] if n >= 2 else 0
+        out[offset + 2] = discard_pile[-1] if n >= 1 else 0
+        out[offset + 3] = n
+        offset += 4
+
+def _write_discard_tops(out, offset: int, discard_piles: List[List[Card]]):
+    """The top card of each discard pile, or 0 if it's empty. 4 slots."""
+    for discard_pile in discard_piles:
+        out[offset] = discard_pile[-1] if len(discard_pile) > 0 else 0
+        offset += 1
+
+def _write_cards(out, offset: int, cards: List[Card]):
+    for card in cards:
+        out[offset] = card
+        offset += 1
+
+def _write_build_heights(out, offset: int, build_piles: List[List[Card]]):
+    # len(build_pile) will give the effective value of each pile
+    for build_pile in build_piles:
+        out[offset] = len(build_pile)
+        offset += 1
+
+# where each part of a state table starts
+TABLE_STOCK = 0 # top card (0 if empty), then size
+TABLE_HAND = 2
+TABLE_BUILD_PILES = 7
+TABLE_DISCARDS = 11 # 4 x (top 3 cards, size)
+TABLE_OPPONENT_STOCK = 27
+TABLE_OPPONENT_DISCARDS = 29 # 4 top cards
+TABLE_SIZE = 33
+
+def _write_table(out, state: SkipBoState):
+    """Write the state table of a state: the raw features everything else is computed from."""
+    ps = state.player_states[state.current_player]
+    nps = state.player_states[(state.current_player + 1) % len(state.player_states)]
+    out[TABLE_STOCK] = ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0
+    out[TABLE_STOCK + 1] = len(ps.stock_pile)
+    _write_cards(out, TABLE_HAND, ps.hand)
+    _write_build_heights(out, TABLE_BUILD_PILES, state.build_piles)
+    _write_discard_block(out, TABLE_DISCARDS, ps.discard_piles)
+    out[TABLE_OPPONENT_STOCK] = nps.stock_pile[-1] if len(nps.stock_pile) > 0 else 0
+    out[TABLE_OPPONENT_STOCK + 1] = len(nps.stock_pile)
+    _write_discard_tops(out, TABLE_OPPONENT_DISCARDS, nps.discard_piles)
+
+def state_tables(states: List[SkipBoState]) -> np.ndarray:
+    """Gather the state tables of many states into an (N, 33) int32 matrix to vectorize over."""
+    tables = np.empty((len(states), TABLE_SIZE), dtype=np.int32)
+    for i, state in enumerate(states):
+        _write_table(memoryview(tables[i]), state)
+    return tables
+
+def _repeats_earlier(values: np.ndarray) -> np.ndarray:
+    """For an (N, k) matrix, whether each entry is equal to one earlier in its row."""
+    k = values.shape[1]
+    return ((values[:, :, None] == values[:, None, :]) & np.tri(k, k, -1, dtype=bool)).any(axis=2)
+
+# observations are declared as an ordered list of feature blocks.
+# every block knows how to write itself for one state (write) and for a whole batch (write_batch, from the state tables)
+class FeatureBlock:
+    """A class to represent one named block of an observation."""
+    name = ''
+    size = 0
+    # what the block puts in shared_info alongside the obs
+    shared_info_keys = ()
 
-    def build_obs(self, agents, state, shared_info):
-        observations = {}
+    def write(self, out, offset: int, state: SkipBoState, shared_info: Dict[str, Any]):
+        raise NotImplementedError
 
-        stock_pile_is_playable = len(state.player_states[state.current_player].stock_pile) > 0 and (state.player_states[state.current_player].stock_pile[-1] == len(state.build_piles[0]) + 1 or state.player_states[state.current_player].stock_pile[-1] == 13)
-        if len(state.player_states[state.current_player].stock_pile) == 0:
-            print("Stock pile is empty, so it can't be played.")
+    def write_batch(self, out: np.ndarray, offset: int, tables: np.ndarray, states: List[SkipBoState],
+                    shared_infos: Optional[List[Dict[str, Any]]]):
+        raise NotImplementedError
 
+class TableBlock(FeatureBlock):
+    """A block that's just a slice of the state table."""
+    table_offset = 0
+
+    def write_batch(self, out, offset, tables, states, shared_infos):
+        out[:, offset:offset + self.size] = tables[:, self.table_offset:self.table_offset + self.size]
+
+class StockBlock(TableBlock):
+    """The top card of the stock pile (0 if it's empty) and its size."""
+    name = 'stock'
+    size = 2
+    table_offset = TABLE_STOCK
+
+    def write(self, out, offset, state, shared_info):
         ps = state.player_states[state.current_player]
+        out[offset] = ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0
+        out[offset + 1] = len(ps.stock_pile)
+
+class StockPlayableBlock(FeatureBlock):
+    """Whether the top card of the stock pile can go on the first build pile."""
+    name = 'stock_playable'
+    size = 1
+
+    def write(self, out, offset, state, shared_info):
+        stock_pile = state.player_states[state.current_player].stock_pile
+        out[offset] = len(stock_pile) > 0 and (stock_pile[-1] == len(state.build_piles[0]) + 1 or stock_pile[-1] == 13)
+
+    def write_batch(self, out, offset, tables, states, shared_infos):
+        stock_top = tables[:, TABLE_STOCK]
+        out[:, offset] = (tables[:, TABLE_STOCK + 1] > 0) & ((stock_top == tables[:, TABLE_BUILD_PILES] + 1) | (stock_top == 13))
+
+class HandBlock(TableBlock):
+    """The 5 cards in the hand, 0 for empty slots."""
+    name = 'hand'
+    size = 5
+    table_offset = TABLE_HAND
+
+    def write(self, out, offset, state, shared_info):
+        _write_cards(out, offset, state.player_states[state.current_player].hand)
+
+class HandPlayableBlock(FeatureBlock):
+    """Whether each card in the hand can be played on some build pile."""
+    name = 'hand_playable'
+    size = 5
+
+    def write(self, out, offset, state, shared_info):
+        playable_values = [len(pile) + 1 for pile in state.build_piles]
+        for card in state.player_states[state.current_player].hand:
+            out[offset] = card == 13 or card in playable_values
+            offset += 1
+
+    def write_batch(self, out, offset, tables, states, shared_infos):
+        hand = tables[:, TABLE_HAND:TABLE_HAND + 5]
+        heights = tables[:, TABLE_BUILD_PILES:TABLE_BUILD_PILES + 4]
+        out[:, offset:offset + 5] = (hand == 13) | (hand[:, :, None] == heights[:, None, :] + 1).any(axis=2)
+
+class BuildPilesBlock(TableBlock):
+    """The height of each build pile, which is also the value of its top card."""
+    name = 'build_piles'
+    size = 4
+    table_offset = TABLE_BUILD_PILES
+
+    def write(self, out, offset, state, shared_info):
+        _write_build_heights(out, offset, state.build_piles)
+
+class DiscardsBlock(TableBlock):
+    """The top 3 cards of each discard pile, left-padded with 0s, and the size of each pile."""
+    name = 'discards'
+    size = 16
+    table_offset = TABLE_DISCARDS
+
+    def write(self, out, offset, state, shared_info):
+        _write_discard_block(out, offset, state.player_states[state.current_player].discard_piles)
+
+class OpponentStockBlock(TableBlock):
+    """The top card of the next player's stock pile (0 if it's empty) and its size."""
+    name = 'opponent_stock'
+    size = 2
+    table_offset = TABLE_OPPONENT_STOCK
+
+    def write(self, out, offset, state, shared_info):
         nps = state.player_states[(state.current_player + 1) % len(state.player_states)]
-        obs_py: list[int] = [
-            ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0, # len 1
-            len(ps.stock_pile), # len 1
-            int(stock_pile_is_playable), # len 1
-        ]
-        obs_py += ps.hand # len 5
-        hand_cards_are_playable = [card == 13 or any([card == len(pile) + 1 for pile in state.build_piles]) for card in ps.hand]
-        obs_py += hand_cards_are_playable # len 5
-        # len(build_pile) will give the effective value of each pile
-        obs_py += [len(build_pile) for build_pile in state.build_piles] # len 4
-        # the top 3 cards of each discard pile, left-padded with 0s, and the size of each pile
-        discards = []
-        for discard_pile in ps.discard_piles:
-            discards += [0] * (3-len(discard_pile)) + discard_pile[-3:] + [len(discard_pile)]
-        obs_py += discards # len 16
-        obs_py += [
-            nps.stock_pile[-1] if len(nps.stock_pile) > 0 else 0, # len 1
-            len(nps.stock_pile)
-        ] # len 1
-        # the top card of each of nps's discard piles
-        obs_py += [discard_pile[-1] if len(discard_pile) > 0 else 0 for discard_pile in nps.discard_piles] # len 4
-        # total len 34
-        obs = np.array(obs_py, dtype=np.int32)
-        return {0: obs}
-
-class HimaliaObsBuilder(ObsBuilder[int, np.ndarray, SkipBoState, tuple]):
-    """A class to represent the observation builder."""
-    def get_obs_space(self, agent):
-        return 'real', 73
-    
-    def reset(self, agents, initial_state, shared_info):
-        pass
+        out[offset] = nps.stock_pile[-1] if len(nps.stock_pile) > 0 else 0
+        out[offset + 1] = len(nps.stock_pile)
 
-    def build_obs(self, agents, state, shared_info):
-        observations = {}
+class OpponentDiscardsBlock(TableBlock):
+    """The top card of each of the next player's discard piles."""
+    name = 'opponent_discards'
+    size = 4
+    table_offset = TABLE_OPPONENT_DISCARDS
 
-        ps = state.player_states[state.current_player]
+    def write(self, out, offset, state, shared_info):
         nps = state.player_states[(state.current_player + 1) % len(state.player_states)]
-        obs_py: list[int] = [
-            ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0, # len 1
-            len(ps.stock_pile), # len 1
-        ]
-        obs_py += ps.hand # len 5
-        # len(build_pile) will give the effective value of each pile
-        obs_py += [len(build_pile) for build_pile in state.build_piles] # len 4
-        # the top 3 cards of each discard pile, left-padded with 0s, and the size of each pile
-        discards = []
-        for discard_pile in ps.discard_piles:
-            discards += [0] * (3-len(discard_pile)) + discard_pile[-3:] + [len(discard_pile)]
-        obs_py += discards # len 16
-        obs_py += [
-            nps.stock_pile[-1] if len(nps.stock_pile) > 0 else 0, # len 1
-            len(nps.stock_pile)
-        ] # len 1
-        # the top card of each of nps's discard piles
-        obs_py += [discard_pile[-1] if len(discard_pile) > 0 else 0 for discard_pile in nps.discard_piles] # len 4
-        # total len 33
-
-        # now, find possible moves
+        _write_discard_tops(out, offset, nps.discard_piles)
+
+class PossibleMovesBlock(FeatureBlock):
+    """
+    Up to 20 legal moves as (src, dst) pairs, padded with (-1, -1): every move onto a build pile,
+    or every discard if there aren't any. Only one move of each group of interchangeable moves is listed (see symmetry_mask).
+    Slots are filled in mask order, then shuffled by the block's own seeded generator if shuffle is set.
+    The order is put in shared_info['possible_moves'] for the action parser, and which slots hold a real move
+    in shared_info['action_mask'] for masking the policy.
+    """
+    name = 'possible_moves'
+    size = 40
+    shared_info_keys = ('possible_moves', 'action_mask')
+
+    def __init__(self, seed: Optional[int] = None, shuffle: bool = True):
+        self.shuffle = shuffle
+        self.rng = random.Random(seed)
+        # shuffles them in write_batch, so the order differs from what write would give the same state
+        self.np_rng = np.random.default_rng(seed)
+        # how many move lists still had more than 20 moves after dropping duplicates, and lost the rest
+        self.truncated = 0
+
+    def write(self, out, offset, state, shared_info):
         # here, dst is slightly different: 3 for build pile, 5-9 for discard pile
-        possible_moves = []
-        for src in range(10):
-            for dst in range(4):
-                action = SkipBoAction(src, dst)
-                if SkipBoEngine.is_action_valid(action, state):
-                    possible_moves.append((src, dst))
+        legal_moves = get_legal_move_mask(state, shared_info) & symmetry_mask(state)
+        possible_moves = moves_in_mask(legal_moves & BUILD_MOVES_MASK)
         if len(possible_moves) == 0:
             # we can't play anything, so we have to discard
-            for src in range(1, 6):
-                if ps.hand[src - 1] != 0:
-                    for dst in range(4, 8):
-                        possible_moves.append((src, dst))
+            possible_moves = moves_in_mask(legal_moves & DISCARD_MOVES_MASK)
         if len(possible_moves) > 20:
-            print(f"Too many possible moves, reducing to 20: {possible_moves}")
-            print(f"from state: {state}")
-            # first, try to remove moves that are effectively duplicates (playing to two build piles with the same value, or sourcing from two cards from the hand with the same value)
-            for i in range(len(possible_moves)):
-                for j in range(i + 1, len(possible_moves)):
-                    source_is_same_value = False
-                    if possible_moves[i][0] >= 1 and possible_moves[i][0] <= 5 and possible_moves[j][0] >= 1 and possible_moves[j][0] <= 5:
-                        # both moves are from the hand
-                        if ps.hand[possible_moves[i][0] - 1] == ps.hand[possible_moves[j][0] - 1]:
-                            source_is_same_value = True
-                    dest_is_same_value = False
-                    if possible_moves[i][1] >= 0 and possible_moves[i][1] <= 3 and possible_moves[j][1] >= 0 and possible_moves[j][1] <= 3:
-                        # both moves are to build piles
-                        if len(state.build_piles[possible_moves[i][1]]) == len(state.build_piles[possible_moves[j][1]]):
-                            dest_is_same_value = True
-                    if source_is_same_value or dest_is_same_value:
-                        # remove the second move
-                        removed = possible_moves.pop(j)
-                        print(f"Removed duplicate move: {removed} at index {j}")
-                        break
-            # if we still have too many moves, just take the first 20
-            if len(possible_moves) > 20:
-                print(f"Too many possible moves, reducing to 20: {possible_moves}")
-                possible_moves = possible_moves[:20]
+            self.truncated += 1
+            if telemetry.enabled:
+                telemetry.event('obs.moves_truncated', lambda: possible_moves, rate=0.01)
+            possible_moves = possible_moves[:20]
 
         # fill the rest of possible moves with (-1, -1) to a length of 20
-        while len(possible_moves) < 20:
-            possible_moves.append((-1, -1))
-        random.shuffle(possible_moves)
+        possible_moves += [(-1, -1)] * (20 - len(possible_moves))
+        if self.shuffle:
+            self.rng.shuffle(possible_moves)
         # make sure the action parser knows the order of the moves
         shared_info['possible_moves'] = possible_moves
-        for i in range(20):
-            obs_py += [possible_moves[i][0], possible_moves[i][1]]
-        # total len 73
+        shared_info['action_mask'] = np.array([src != -1 for src, _ in possible_moves], dtype=bool)
+        for src, dst in possible_moves:
+            out[offset] = src
+            out[offset + 1] = dst
+            offset += 2
+
+    def write_batch(self, out, offset, tables, states, shared_infos):
+        n = len(tables)
+        # the card at each of the 10 sources: stock top, hand, then the top of each discard pile
+        discard_tops = slice(TABLE_DISCARDS + 2, TABLE_DISCARDS + 16, 4)
+        hand = tables[:, TABLE_HAND:TABLE_HAND + 5]
+        source_values = np.concatenate([tables[:, TABLE_STOCK:TABLE_STOCK + 1], hand, tables[:, discard_tops]], axis=1)
+        heights = tables[:, TABLE_BUILD_PILES:TABLE_BUILD_PILES + 4]
+        # legal[n, src, dst], laid out like the legal move mask
+        legal = np.zeros((n, 10, 8), dtype=bool)
+        values = source_values[:, :, None]
+        legal[:, :, :4] = (values != 0) & ((values == heights[:, None, :] + 1) | (values == 13))
+        can_build = legal[:, :, :4].any(axis=(1, 2))
+        # we can't play anything, so we have to discard
+        legal[:, 1:6, 4:] = ((source_values[:, 1:6] != 0) & ~can_build[:, None])[:, :, None]
+
+        # drop interchangeable moves, the same way symmetry_mask does
+        source_kept = np.ones((n, 10), dtype=bool)
+        source_kept[:, 1:6] = ~_repeats_earlier(hand)
+        destination_kept = np.ones((n, 8), dtype=bool)
+        destination_kept[:, :4] = ~_repeats_earlier(heights)
+        # the tables only have the top of each discard pile, so compare the whole piles here
+        discards_kept = np.array([[pile not in piles[:i] for i, pile in enumerate(piles)]
+                                  for piles in (state.player_states[state.current_player].discard_piles for state in states)], dtype=bool).reshape(n, 4)
+        source_kept[:, 6:] = discards_kept
+        destination_kept[:, 4:] = discards_kept
+        legal &= source_kept[:, :, None] & destination_kept[:, None, :]
+        legal = legal.reshape(n, 80)
+        counts = legal.sum(axis=1)
+        self.truncated += int((counts > 20).sum())
+        if telemetry.enabled and (counts > 20).any():
+            telemetry.count('obs.moves_truncated', int((counts > 20).sum()))
+
+        # the first 20 legal moves of each row in mask order, padded with -1
+        order = np.argsort(~legal, axis=1, kind='stable')[:, :20]
+        moves = np.stack([order >> 3, order & 7], axis=2)
+        moves[np.arange(20)[None, :] >= counts[:, None]] = -1
+        if self.shuffle:
+            moves = np.take_along_axis(moves, np.argsort(self.np_rng.random((n, 20)), axis=1)[:, :, None], axis=1)
+        out[:, offset:offset + 40] = moves.reshape(n, 40)
+        if shared_infos is not None:
+            action_masks = moves[:, :, 0] != -1
+            for i, shared_info in enumerate(shared_infos):
+                shared_info['possible_moves'] = [tuple(move) for move in moves[i].tolist()]
+                shared_info['action_mask'] = action_masks[i]
+
+class FeatureSpec:
+    """
+    A class to represent an observation layout compiled from an ordered list of feature blocks.
+    Offsets are worked out once here, so building an obs is just running each block's kernel at its offset.
+    """
+    def __init__(self, blocks: List[FeatureBlock]):
+        self.blocks = blocks
+        self.offsets: Dict[str, int] = {}
+        self.shared_info_keys = tuple(key for block in blocks for key in block.shared_info_keys)
+        self._kernels = []
+        self._batch_kernels = []
+        offset = 0
+        for block in blocks:
+            if block.name in self.offsets:
+                raise ValueError(f"Feature block {block.name!r} is in the spec twice")
+            self.offsets[block.name] = offset
+            self._kernels.append((block.write, offset))
+            self._batch_kernels.append((block.write_batch, offset))
+            offset += block.size
+        self.size = offset
+
+    def block(self, name: str) -> slice:
+        """Where the named block lives in an obs."""
+        offset = self.offsets[name]
+        for block in self.blocks:
+            if block.name == name:
+                return slice(offset, offset + block.size)
+        raise KeyError(name)
+
+    def write(self, state: SkipBoState, shared_info: Dict[str, Any], out):
+        for kernel, offset in self._kernels:
+            kernel(out, offset, state, shared_info)
+
+    def write_batch(self, states: List[SkipBoState], shared_infos: Optional[List[Dict[str, Any]]], out: np.ndarray):
+        tables = state_tables(states)
+        for kernel, offset in self._batch_kernels:
+            kernel(out, offset, tables, states, shared_infos)
+
+# every feature fits in a byte: cards are 0-13, moves are -1 to 9, and piles don't get past 127 cards in practice.
+# obs in this dtype are a quarter the size to send between processes and to keep in the experience buffer,
+# and the networks turn them into floats either way
+COMPACT_OBS_DTYPE = np.int8
+
+def narrow_obs(obs: np.ndarray, dtype, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """obs in a smaller integer dtype. anything out of its range is clamped to it instead of wrapping around."""
+    info = np.iinfo(dtype)
+    if out is None:
+        return np.clip(obs, info.min, info.max).astype(dtype)
+    return np.clip(obs, info.min, info.max, out=out, casting='unsafe')
+
+class SpecObsBuilder(ObsBuilder[int, np.ndarray, SkipBoState, tuple]):
+    """
+    A class to represent an observation builder made from a FeatureSpec. It writes straight into a flat int32 buffer,
+    or one of a smaller dtype (like COMPACT_OBS_DTYPE), going through an int32 scratch buffer and clamping when a pile is too big to fit.
+    build_obs can be given an out array to fill. Otherwise it fills its own: a fresh one each call,
+    or with reuse_buffer the same one every call (so the returned obs is only good until the next call).
+    """
+    def __init__(self, blocks: List[FeatureBlock], reuse_buffer: bool = False, dtype=np.int32):
+        super().__init__()
+        self.spec = FeatureSpec(blocks)
+        self.obs_size = self.spec.size
+        self.reuse_buffer = reuse_buffer
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'i':
+            # the move list pads with -1 (and masked_actor.py looks for it), so an unsigned dtype would change what the network sees
+            raise ValueError(f"Obs dtype has to be a signed integer type, got {self.dtype}")
+        self._buffer = np.zeros(self.obs_size, dtype=self.dtype)
+        # writing single items through a memoryview skips numpy's per-item overhead
+        self._view = memoryview(self._buffer)
+        self._narrow = self.dtype != np.int32
+        if self._narrow:
+            self._wide = np.zeros(self.obs_size, dtype=np.int32)
+            self._wide_view = memoryview(self._wide)
+            self._max_value = int(np.iinfo(self.dtype).max)
+        # the last obs built, along with whatever it put in shared_info
+        self.cache = VersionCache()
+
+    def __getstate__(self):
+        # memoryviews don't pickle or copy, so leave them out and make them again from the buffers
+        state = dict(self.__dict__)
+        state.pop('_view', None)
+        state.pop('_wide_view', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._view = memoryview(self._buffer)
+        if self._narrow:
+            self._wide_view = memoryview(self._wide)
+
+    def get_obs_space(self, agent):
+        return 'real', self.obs_size
+
+    def reset(self, agents, initial_state, shared_info):
+        pass
+
+    def build_obs(self, agents, state, shared_info, out: Optional[np.ndarray] = None):
+        version = shared_info.get('state_version')
+        cached = self.cache.lookup(state, version)
+        if cached is not None:
+            obs, extras = cached
+            shared_info.update(extras)
+            if out is not None:
+                out[:] = obs
+                return {0: out}
+            return {0: obs}
+        if out is not None:
+            self._write(state, shared_info, out)
+            # the caller can overwrite their out later, so cache a copy
+            obs = out.copy()
+        elif self.reuse_buffer:
+            self._write(state, shared_info, self._buffer, self._view)
+            obs = out = self._buffer
+        else:
+            obs = out = np.empty(self.obs_size, dtype=self.dtype)
+            self._write(state, shared_info, out)
+        self.cache.store(state, version, (obs, {key: shared_info[key] for key in self.spec.shared_info_keys}))
+        return {0: out}
 
-        obs = np.array(obs_py, dtype=np.int32)
-        return {0: obs}
+    def _fits(self, state: SkipBoState) -> bool:
+        """Whether every value state's obs can have fits the narrow dtype. Cards and moves (-1 to 13) always fit a signed one, so it's down to pile sizes."""
+        limit = self._max_value
+        for ps in state.player_states:
+            if len(ps.stock_pile) > limit:
+                return False
+            for discard_pile in ps.discard_piles:
+                if len(discard_pile) > limit:
+                    return False
+        return True
+
+    def _write(self, state, shared_info, out: np.ndarray, view: Optional[memoryview] = None):
+        # check before writing instead of catching a failed write, since a write can't be taken back
+        # (PossibleMovesBlock shuffles with its rng and counts truncations as it goes)
+        if not self._narrow or self._fits(state):
+            self.spec.write(state, shared_info, view if view is not None else memoryview(out))
+        else:
+            # something won't fit (a huge discard pile), so write it wide and clamp it
+            self.spec.write(state, shared_info, self._wide_view)
+            narrow_obs(self._wide, self.dtype, out)
+
+    def build_obs_batch(self, states: List[SkipBoState], shared_infos: Optional[List[Dict[str, Any]]] = None,
+                        out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        The obs of many states as one contiguous (N, obs_size) matrix of the builder's dtype, one row per state, with
+        every block computed across the whole batch. Per-row extras (like Himalia's possible_moves) go in shared_infos if it's given.
+        """
+        if out is None:
+            out = np.empty((len(states), self.obs_size), dtype=self.dtype)
+        if self._narrow:
+            wide = np.empty((len(states), self.obs_size), dtype=np.int32)
+            self.spec.write_batch(states, shared_infos, wide)
+            narrow_obs(wide, self.dtype, out)
+        else:
+            self.spec.write_batch(states, shared_infos, out)
+        return out
+
+class IoObsBuilder(SpecObsBuilder):
+    """A class to represent the observation builder."""
+    def __init__(self, reuse_buffer: bool = False, dtype=np.int32):
+        super().__init__([
+            StockBlock(), # len 2
+            HandBlock(), # len 5
+            BuildPilesBlock(), # len 4
+            DiscardsBlock(), # len 16
+            OpponentStockBlock(), # len 2
+            OpponentDiscardsBlock(), # len 4
+        ], reuse_buffer, dtype) # total len 33
+
+class GanymedeObsBuilder(SpecObsBuilder):
+    """A class to represent the observation builder."""
+    def __init__(self, reuse_buffer: bool = False, dtype=np.int32):
+        super().__init__([
+            StockBlock(), # len 2
+            StockPlayableBlock(), # len 1
+            HandBlock(), # len 5
+            BuildPilesBlock(), # len 4
+            DiscardsBlock(), # len 16
+            OpponentStockBlock(), # len 2
+            OpponentDiscardsBlock(), # len 4
+        ], reuse_buffer, dtype) # total len 34
+
+class CallistoObsBuilder(SpecObsBuilder):
+    """A class to represent the observation builder."""
+    def __init__(self, reuse_buffer: bool = False, dtype=np.int32):
+        super().__init__([
+            StockBlock(), # len 2
+            StockPlayableBlock(), # len 1
+            HandBlock(), # len 5
+            HandPlayableBlock(), # len 5
+            BuildPilesBlock(), # len 4
+            DiscardsBlock(), # len 16
+            OpponentStockBlock(), # len 2
+            OpponentDiscardsBlock(), # len 4
+        ], reuse_buffer, dtype) # total len 39
+
+class HimaliaObsBuilder(SpecObsBuilder):
+    """A class to represent the observation builder."""
+    def __init__(self, seed: Optional[int] = None, reuse_buffer: bool = False, shuffle_moves: bool = True, dtype=np.int32):
+        super().__init__([
+            StockBlock(), # len 2
+            HandBlock(), # len 5
+            BuildPilesBlock(), # len 4
+            DiscardsBlock(), # len 16
+            OpponentStockBlock(), # len 2
+            OpponentDiscardsBlock(), # len 4
+            PossibleMovesBlock(seed, shuffle_moves), # len 40
+        ], reuse_buffer, dtype) # total len 73
+
+    def possible_moves_batch(self, obs: np.ndarray) -> np.ndarray:
+        """The (N, 20, 2) (src, dst) move tables inside a batch of obs."""
+        return obs[:, self.spec.block('possible_moves')].reshape(len(obs), 20, 2)
+
+    def action_mask(self, obs: np.ndarray) -> np.ndarray:
+        """Which of the 20 slots hold a real move, for one obs or a batch of them."""
+        return obs[..., self.spec.block('possible_moves')][..., ::2] != -1
 
 class GeneralActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoState, tuple]):
     """A class to represent the action parser."""
@@ -592,12 +1539,9 @@ class AmaltheaActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoSta
         # if there are, don't allow the discard
         if parsed_action.card_destination >= 4 and parsed_action.card_destination <= 7:
             # check if there are any other valid actions
-            for src in range(10):
-                for dest in range(4):
-                    if SkipBoEngine.is_action_valid(SkipBoAction(src, dest), state):
-                        if src != parsed_action.card_source or dest != parsed_action.card_destination:
-                            # there is another valid action, so block the discard by giving an invalid action
-                            return {0: SkipBoAction(-1, -1)}
+            if get_legal_move_mask(state, shared_info) & BUILD_MOVES_MASK:
+                # there is another valid action, so block the discard by giving an invalid action
+                return {0: SkipBoAction(-1, -1)}
         parsed_actions[0] = parsed_action
         return parsed_actions
     
@@ -620,7 +1564,15 @@ class AmaltheaActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoSta
         return lut
 
 class HimaliaActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoState, tuple]):
-    """A class to represent the action parser."""
+    """
+    A class to represent the action parser. With masked set, the policy masks out the padding slots of the move list
+    (see masked_actor.py), so picking one is a bug: it becomes an invalid action and gets counted.
+    Without it, a padding pick gets moved to the nearest real move instead, for policies trained without masking.
+    """
+    def __init__(self, masked: bool = False):
+        super().__init__()
+        self.masked = masked
+
     def get_action_space(self, agent):
         return 'discrete', 20 # 20 possible moves max
     def reset(self, agents, initial_state, shared_info):
@@ -633,6 +1585,15 @@ class HimaliaActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoStat
         if 'possible_moves' not in shared_info:
             raise ValueError("No possible actions in shared info.")
         possible_actions = shared_info['possible_moves']
+        if self.masked:
+            src, dst = possible_actions[action_idx]
+            if src == -1 or dst == -1:
+                if telemetry.enabled:
+                    telemetry.event('parser.padding_pick', lambda: {'action_idx': int(action_idx), 'choices': possible_actions}, rate=1.0)
+                parsed_actions[0] = SkipBoAction(-1, -1)
+            else:
+                parsed_actions[0] = SkipBoAction(src, dst)
+            return parsed_actions
         # pick the valid action from the possible actions closest to the action
         # for example, if action_idx is 2, then try 2,3,1,4,0,5,6, etc. until there's a valid possible action
         # generate a list of indices to try
@@ -648,17 +1609,41 @@ class HimaliaActionParser(ActionParser[int, np.ndarray, SkipBoAction, SkipBoStat
                 break
         else:
             # if no action was found, return an invalid action
-            print(f"\033[31mNo valid action found for action idx {action_idx}. Choices: {shared_info['possible_moves']}\033[0m")
+            if telemetry.enabled:
+                telemetry.event('parser.no_valid_action', lambda: {'action_idx': int(action_idx), 'choices': possible_actions}, rate=1.0)
             parsed_action = SkipBoAction(-1, -1)
         parsed_actions[0] = parsed_action
         return parsed_actions
 
+def is_won(state: SkipBoState) -> bool:
+    """Whether someone has emptied their stock pile."""
+    return any([len(player_state.stock_pile) == 0 for player_state in state.player_states])
+
+def truncation_cause(state: SkipBoState, max_turns: int = 1000) -> Optional[str]:
+    """Why the game should be cut short ('turn_limit', 'out_of_cards' or 'invalid_actions'), or None if it shouldn't be."""
+    # if the game has been going on for too long
+    if state.num_turns >= max_turns:
+        return 'turn_limit'
+    # if there aren't enough cards in the draw pile + completed build piles
+    if len(state.draw_pile) + len(state.completed_build_piles) < 20:
+        return 'out_of_cards'
+    # if the invalid actions count is too high
+    if state.invalid_actions_count >= 500:
+        return 'invalid_actions'
+    return None
+
+def end_cause(state: SkipBoState, max_turns: int = 1000) -> Optional[str]:
+    """Why the episode ends at this state ('win' or a truncation cause), or None if it doesn't."""
+    if is_won(state):
+        return 'win'
+    return truncation_cause(state, max_turns)
+
 class SkipBoTerminalCondition(DoneCondition[int, SkipBoState]):
     """Determines when episodes end naturally (the game has been won)"""
     def reset(self, agents, initial_state, shared_info):
         pass
     def _is_done(self, agents, state: SkipBoState, shared_info):
-        return any([len(player_state.stock_pile) == 0 for player_state in state.player_states])
+        return is_won(state)
     def is_done(self, agents: List[int], state: SkipBoState, shared_info: Dict[str, Any]) -> Dict[int, bool]:
         done = self._is_done(agents, state, shared_info)
         if done:
@@ -676,19 +1661,12 @@ class SkipBoTruncationCondition(DoneCondition[int, SkipBoState]):
         pass
     
     def _is_done(self, agents, state, shared_info):
-        # if the game has been going on for too long
-        if state.num_turns >= self.max_turns:
-            print("\033[31mGame has been going on for too long.\033[0m")
-            return True
-        # if there aren't enough cards in the draw pile + completed build piles
-        if len(state.draw_pile) + len(state.completed_build_piles) < 20:
-            print("\033[31mN\033[0m", end="")
-            return True
-        # if the invalid actions count is too high
-        if state.invalid_actions_count >= 500:
-            print("\033[31mI\033[0m", end="")
-            return True
-        return False
+        cause = truncation_cause(state, self.max_turns)
+        if cause is None:
+            return False
+        if telemetry.enabled:
+            telemetry.count(f'truncation.{cause}')
+        return True
     
     def is_done(self, agents: List[int], state: SkipBoState, shared_info: Dict[str, Any]) -> Dict[int, bool]:
         # check if the game is done
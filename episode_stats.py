@@ -0,0 +1,100 @@
+# episode_stats.py
+# why and how episodes end, collected in each env process and added up by SkipBoMetricsLogger.
+# SkipBoSharedInfoProvider feeds it every state; when an episode ends, its length, turns, stock pile plays and
+# longest invalid action streak go into fixed-bin histograms (split up by end cause), and every so often those
+# get handed over in shared_info['episode_stats'].
+
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from env import SkipBoState, end_cause
+
+END_CAUSES = ('win', 'turn_limit', 'out_of_cards', 'invalid_actions')
+
+# histogram bin edges for each stat. anything past the last edge goes in the last bin
+STAT_EDGES = {
+    'length': np.arange(0, 10_001, 250),
+    'turns': np.arange(0, 1_001, 25),
+    'stock_plays': np.arange(0, 61, 2),
+    'max_invalid_streak': np.array([0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, 501]),
+}
+
+def empty_stats() -> Dict[str, Any]:
+    """Stats with no episodes in them: per end cause, an episode count, and a sum and a histogram of each stat."""
+    return {cause: {
+        'episodes': 0,
+        'sums': {stat: 0 for stat in STAT_EDGES},
+        'hists': {stat: np.zeros(len(edges) - 1, dtype=np.int64) for stat, edges in STAT_EDGES.items()},
+    } for cause in END_CAUSES}
+
+def merge_stats(into: Dict[str, Any], stats: Dict[str, Any]):
+    """Add stats into into."""
+    for cause, cause_stats in stats.items():
+        target = into[cause]
+        target['episodes'] += cause_stats['episodes']
+        for stat in STAT_EDGES:
+            target['sums'][stat] += cause_stats['sums'][stat]
+            target['hists'][stat] += cause_stats['hists'][stat]
+
+def _bin(stat: str, value: int) -> int:
+    edges = STAT_EDGES[stat]
+    return min(int(np.searchsorted(edges, value, side='right')) - 1, len(edges) - 2)
+
+class EpisodeStats:
+    """A class to represent the episode stats collector of one env process."""
+    def __init__(self, max_turns: int = 1000, ship_interval: float = 10.0):
+        self.max_turns = max_turns
+        self.ship_interval = ship_interval
+        self.stats = empty_stats()
+        self._unshipped = 0
+        self._last_ship = time.monotonic()
+        self._in_episode = False
+        self.length = 0
+        self.stock_plays = 0
+        self.max_invalid_streak = 0
+
+    def start(self, state: SkipBoState):
+        """A new episode starts from state. An episode that didn't end on its own is dropped."""
+        self._in_episode = True
+        self.length = 0
+        self.stock_plays = 0
+        self.max_invalid_streak = 0
+
+    def step(self, state: SkipBoState):
+        """Count the step that led to state, and record the episode if it ends here."""
+        if not self._in_episode:
+            return
+        self.length += 1
+        last_step = state.last_step
+        if last_step is not None and last_step.was_valid and last_step.action.card_source == 0:
+            self.stock_plays += 1
+        if state.invalid_actions_count > self.max_invalid_streak:
+            self.max_invalid_streak = state.invalid_actions_count
+        cause = end_cause(state, self.max_turns)
+        if cause is not None:
+            self._record(cause, {
+                'length': self.length,
+                'turns': state.num_turns,
+                'stock_plays': self.stock_plays,
+                'max_invalid_streak': self.max_invalid_streak,
+            })
+            self._in_episode = False
+
+    def _record(self, cause: str, values: Dict[str, int]):
+        cause_stats = self.stats[cause]
+        cause_stats['episodes'] += 1
+        for stat, value in values.items():
+            cause_stats['sums'][stat] += value
+            cause_stats['hists'][stat][_bin(stat, value)] += 1
+        self._unshipped += 1
+
+    def take(self) -> Optional[Dict[str, Any]]:
+        """The stats collected since the last take, if there are any and it's been ship_interval seconds. None otherwise."""
+        if self._unshipped == 0 or time.monotonic() - self._last_ship < self.ship_interval:
+            return None
+        stats, self.stats = self.stats, empty_stats()
+        self._unshipped = 0
+        self._last_ship = time.monotonic()
+        return stats
@@ -0,0 +1,48 @@
+# masked_actor.py
+# a DiscreteFF that only ever picks legal slots of a move list obs (like HimaliaObsBuilder's)
+# the network is the same, so weights trained without the mask load straight into it
+
+from typing import Iterable, List, Tuple
+import numpy as np
+import torch
+from rlgym_learn_algos.ppo.discrete_actor import DiscreteFF
+
+
+class MaskedDiscreteFF(DiscreteFF):
+    """
+    A class to represent a discrete policy that masks out padding slots before sampling or taking the argmax.
+    The mask comes from the obs itself: slot i is legal unless the src at obs[mask_offset + 2 * i] is -1.
+    """
+    def __init__(self, input_size, n_actions, layer_sizes, device, mask_offset: int):
+        super().__init__(input_size, n_actions, layer_sizes, device)
+        self.mask_offset = mask_offset
+
+    def legal_slots(self, obs: torch.Tensor) -> torch.Tensor:
+        """Which of the n_actions slots hold a real move, for a batch of obs."""
+        legal = obs[..., self.mask_offset:self.mask_offset + 2 * self.n_actions:2] != -1
+        # a row with nothing legal (shouldn't happen) is left unmasked rather than turned into NaNs
+        return legal | ~legal.any(dim=-1, keepdim=True)
+
+    def _masked_probs(self, obs_list: List[np.ndarray]) -> Tuple[torch.Tensor, torch.Tensor]:
+        obs = torch.as_tensor(np.array(obs_list), dtype=torch.float32, device=self.device)
+        # everything but the final softmax gives the logits
+        logits = self.model[:-1](obs)
+        legal = self.legal_slots(obs)
+        probs = torch.softmax(logits.masked_fill(~legal, float("-inf")), dim=-1)
+        return probs, legal
+
+    def get_output(self, obs_list: List[np.ndarray]) -> torch.Tensor:
+        probs, _ = self._masked_probs(obs_list)
+        # same clamp as DiscreteFF, so log probs and the entropy stay finite
+        return torch.clamp(probs, min=1e-11, max=1)
+
+    def get_action(self, agent_id_list, obs_list, **kwargs) -> Tuple[Iterable[np.ndarray], torch.Tensor]:
+        probs, legal = self._masked_probs(obs_list)
+        if "deterministic" in kwargs and kwargs["deterministic"]:
+            action = probs.cpu().numpy().argmax(axis=-1)
+            return action, torch.zeros(action.shape)
+
+        # sample from the unclamped probs so a masked slot can never come up
+        action = torch.multinomial(probs, 1, True)
+        log_prob: torch.Tensor = torch.log(torch.clamp(probs, min=1e-11, max=1)).gather(-1, action)
+        return action.cpu().numpy(), log_prob.squeeze().to(device="cpu", non_blocking=True)
@@ -0,0 +1,105 @@
+# metrics.py
+# the metrics logger used for training. on top of the usual PPO metrics, it adds up what the env processes put
+# in their shared_info (see SkipBoSharedInfoProvider) over each iteration, so it goes to wandb with everything else.
+# with profiling on (see profiler.py), that includes where the env processes spent their time, and the stack samples
+# get written to <profile_directory>/stacks_<report>.folded.
+
+import os
+from typing import Any, Dict, List, Optional
+
+from rlgym_learn_algos.logging.dict_metrics_logger import print_dict
+from rlgym_learn_algos.ppo import PPOMetricsLogger
+
+from episode_stats import END_CAUSES, STAT_EDGES, empty_stats, merge_stats
+from profiler import empty_profile, merge_profiles
+
+STAT_NAMES = {
+    'length': "Length",
+    'turns': "Turns",
+    'stock_plays': "Stock Pile Plays",
+    'max_invalid_streak': "Longest Invalid Streak",
+}
+
+class SkipBoMetricsLogger(PPOMetricsLogger):
+    """A class to represent the PPO metrics logger plus the env processes' telemetry counts, episode stats and profiles."""
+    def __init__(self, profile_directory: Optional[str] = None):
+        super().__init__()
+        self.telemetry_counters: Dict[str, int] = {}
+        self.episode_stats = empty_stats()
+        self.profile = empty_profile()
+        self.profile_directory = profile_directory
+        self.reports = 0
+
+    def collect_env_metrics(self, data: List[Dict[str, Any]]):
+        # this can get called more than once per report, so add up until the report
+        for shared_info in data:
+            if shared_info is None:
+                continue
+            flushed = shared_info.get('telemetry')
+            if flushed is not None:
+                for name, n in flushed.items():
+                    self.telemetry_counters[name] = self.telemetry_counters.get(name, 0) + n
+            stats = shared_info.get('episode_stats')
+            if stats is not None:
+                merge_stats(self.episode_stats, stats)
+            profile = shared_info.get('profile')
+            if profile is not None:
+                merge_profiles(self.profile, profile)
+
+    def _episode_metrics(self) -> Dict[str, Any]:
+        import wandb
+
+        episodes = sum(self.episode_stats[cause]['episodes'] for cause in END_CAUSES)
+        if episodes == 0:
+            return {}
+        metrics = {"Episodes": episodes, "End Causes": {}}
+        for stat, name in STAT_NAMES.items():
+            metrics[f"Mean {name}"] = sum(self.episode_stats[cause]['sums'][stat] for cause in END_CAUSES) / episodes
+        histograms = {}
+        for cause in END_CAUSES:
+            cause_stats = self.episode_stats[cause]
+            metrics["End Causes"][cause] = cause_stats['episodes'] / episodes
+            if cause_stats['episodes'] == 0:
+                continue
+            metrics[f"Mean Length ({cause})"] = cause_stats['sums']['length'] / cause_stats['episodes']
+            for stat, name in STAT_NAMES.items():
+                histograms[f"{name} ({cause})"] = wandb.Histogram(np_histogram=(cause_stats['hists'][stat], STAT_EDGES[stat]))
+        return {"Episode Stats": metrics, "Episode Histograms": histograms}
+
+    def _profile_metrics(self) -> Dict[str, Any]:
+        if self.profile['processes'] == 0:
+            return {}
+        # share is of the env processes' wall time, which includes waiting on the learner
+        metrics = {"Env Process Seconds": self.profile['seconds']}
+        for name, (calls, seconds) in sorted(self.profile['components'].items(), key=lambda item: -item[1][1]):
+            if calls == 0:
+                continue
+            metrics[name] = {
+                "Share": seconds / self.profile['seconds'],
+                "Microseconds Per Call": 1e6 * seconds / calls,
+                "Calls": calls,
+            }
+        return {"Profile": metrics}
+
+    def _write_stacks(self):
+        if self.profile_directory is None or len(self.profile['stacks']) == 0:
+            return
+        # one "frame;frame;frame count" line per stack, which is what flamegraph.pl and speedscope read
+        with open(os.path.join(self.profile_directory, f"stacks_{self.reports}.folded"), "w") as f:
+            for stack, n in sorted(self.profile['stacks'].items()):
+                f.write(f"{stack} {n}\n")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        metrics = super().get_metrics()
+        if len(self.telemetry_counters) > 0:
+            metrics["Telemetry"] = dict(self.telemetry_counters)
+        return {**metrics, **self._episode_metrics(), **self._profile_metrics()}
+
+    def report_metrics(self):
+        # histograms are for wandb, they don't print
+        print_dict({key: value for key, value in self.get_metrics().items() if key != "Episode Histograms"})
+        self._write_stacks()
+        self.reports += 1
+        self.telemetry_counters = {}
+        self.episode_stats = empty_stats()
+        self.profile = empty_profile()
@@ -0,0 +1,100 @@
+# multi_env.py
+# runs several games of skipbo in one env process, so each trip between the env process and the learner carries
+# a step of every game instead of just one. to rlgym_learn it looks like one env with an agent per game.
+# a game that ends is dealt again straight away, so the env itself never needs resetting; use
+# MultiGamePPOAgentController (multi_game_controller.py) so the learner cuts trajectories at each game's end.
+# the obs of a game's last step goes back in shared_info['final_obs'], since the obs returned for that agent is
+# already the first one of its next game.
+
+from typing import Any, Callable, Dict, List, Optional
+
+from rlgym.api import RLGym
+
+from episode_stats import merge_stats, empty_stats
+
+class MultiGameEnv:
+    """
+    A class to represent num_games independent games, each an RLGym from build_game, stepped together.
+    Agent k plays game k. Has the parts of the RLGym interface rlgym_learn's env processes use.
+    """
+    def __init__(self, build_game: Callable[[], RLGym], num_games: int):
+        self.games = [build_game() for _ in range(num_games)]
+        self.agents = list(range(num_games))
+        self.shared_info: Dict[str, Any] = {}
+        # how many games each agent has finished
+        self.episodes = [0] * num_games
+
+    @property
+    def action_spaces(self) -> Dict[int, Any]:
+        return {agent: game.action_space(0) for agent, game in enumerate(self.games)}
+
+    @property
+    def observation_spaces(self) -> Dict[int, Any]:
+        return {agent: game.observation_space(0) for agent, game in enumerate(self.games)}
+
+    @property
+    def state(self) -> List[Any]:
+        return [game.state for game in self.games]
+
+    def _collect_shared_info(self, shared_infos: List[Dict[str, Any]], final_obs: Optional[Dict[int, Any]] = None):
+        """Combine what the games want to send back into one shared_info for the env process."""
+        # the last obs of every game that ended this step, by agent
+        shared_info = {'final_obs': final_obs if final_obs is not None else {}}
+        if any('episode_stats' in info for info in shared_infos):
+            flushed = [info['episode_stats'] for info in shared_infos if info.get('episode_stats') is not None]
+            stats = None
+            if len(flushed) > 0:
+                stats = empty_stats()
+                for game_stats in flushed:
+                    merge_stats(stats, game_stats)
+            shared_info['episode_stats'] = stats
+        if any('telemetry' in info for info in shared_infos):
+            # telemetry is per process, so at most one game got handed the counts
+            shared_info['telemetry'] = next((info['telemetry'] for info in shared_infos if info.get('telemetry') is not None), None)
+        if any('profile' in info for info in shared_infos):
+            # same for the profile
+            shared_info['profile'] = next((info['profile'] for info in shared_infos if info.get('profile') is not None), None)
+        self.shared_info = shared_info
+
+    def reset(self) -> Dict[int, Any]:
+        obs = {agent: game.reset()[0] for agent, game in enumerate(self.games)}
+        self._collect_shared_info([game.shared_info for game in self.games])
+        return obs
+
+    def set_state(self, desired_state: List[Any]) -> Dict[int, Any]:
+        obs = {agent: game.set_state(state)[0] for agent, (game, state) in enumerate(zip(self.games, desired_state))}
+        self._collect_shared_info([game.shared_info for game in self.games])
+        return obs
+
+    def step(self, actions: Dict[int, Any]):
+        """
+        Step every game with its agent's action. A game that ends reports it, then gets dealt again, and its agent's
+        obs is the first one of the new game (so that's what the next action gets picked from). The game's real last obs
+        goes in shared_info['final_obs'], for the learner to bootstrap a truncated game's value from.
+        """
+        obs, rewards, terminated, truncated = {}, {}, {}, {}
+        shared_infos = []
+        final_obs = {}
+        for agent, game in enumerate(self.games):
+            game_obs, game_rewards, game_terminated, game_truncated = game.step({0: actions[agent]})
+            rewards[agent] = game_rewards[0]
+            terminated[agent] = game_terminated[0]
+            truncated[agent] = game_truncated[0]
+            if terminated[agent] or truncated[agent]:
+                # resetting clears out the shared_info, so keep a copy of what the last step put there
+                shared_infos.append(dict(game.shared_info))
+                self.episodes[agent] += 1
+                final_obs[agent] = game_obs[0]
+                game_obs = game.reset()
+            else:
+                shared_infos.append(game.shared_info)
+            obs[agent] = game_obs[0]
+        self._collect_shared_info(shared_infos, final_obs)
+        return obs, rewards, terminated, truncated
+
+    def render(self):
+        self.games[0].render()
+
+    def close(self):
+        for game in self.games:
+            game.close()
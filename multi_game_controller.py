@@ -0,0 +1,106 @@
+# multi_game_controller.py
+# the learner side of multi_env.py. PPOAgentController keeps one trajectory per agent per env, stops taking an
+# agent's steps once it's done, and resets the env once every agent is done. a MultiGameEnv's games each end and
+# get dealt again on their own, so here each agent's trajectory gets cut off at the end of every game instead.
+# the step that ends a game comes with the next game's first obs as its next_obs, so the finished trajectory's
+# final obs comes from shared_info['final_obs'] instead.
+# this reaches into EnvTrajectories' internals, so it only runs against the rlgym_learn_algos it was written for
+# (requirements.txt pins it). after an upgrade, check add_steps/get_trajectories still match and bump the version.
+
+from importlib.metadata import version
+from typing import Any, Dict, List
+
+import torch
+from rlgym_learn_algos.ppo import PPOAgentController
+from rlgym_learn_algos.ppo.env_trajectories import EnvTrajectories
+from rlgym_learn_algos.ppo.trajectory import Trajectory
+
+RLGYM_LEARN_ALGOS_VERSION = "0.1.5"
+if version("rlgym-learn-algos") != RLGYM_LEARN_ALGOS_VERSION:
+    raise ImportError(f"multi_game_controller was written against rlgym-learn-algos {RLGYM_LEARN_ALGOS_VERSION}, "
+                      f"but {version('rlgym-learn-algos')} is installed. check RollingEnvTrajectories against it first")
+
+class RollingEnvTrajectories(EnvTrajectories):
+    """A class to represent the trajectories of an env whose agents start new episodes by themselves."""
+    def __init__(self, agent_ids, agent_choice_fn=lambda agent_id_list: list(range(len(agent_id_list)))):
+        super().__init__(agent_ids, agent_choice_fn)
+        for attribute in ('used_agent_id_idx_map', 'obs_lists', 'action_lists', 'reward_lists', 'final_obs', 'dones', 'truncateds'):
+            if not hasattr(self, attribute):
+                raise RuntimeError(f"EnvTrajectories has no {attribute}, RollingEnvTrajectories needs updating for this rlgym-learn-algos")
+        # the log probs get kept per agent, since each agent's episodes start at different steps
+        self.log_prob_lists = {agent_id: [] for agent_id in self.used_agent_id_idx_map}
+        self.finished: List[Trajectory] = []
+        # the real last obs of each game that ended on the steps being added, by agent
+        self.pending_final_obs: Dict[Any, Any] = {}
+
+    def _trajectory(self, agent_id, truncated: bool) -> Trajectory:
+        return Trajectory(
+            agent_id,
+            self.obs_lists[agent_id],
+            self.action_lists[agent_id],
+            torch.stack(self.log_prob_lists[agent_id]),
+            self.reward_lists[agent_id],
+            None,
+            self.final_obs[agent_id],
+            torch.tensor(0, dtype=torch.float32),
+            truncated,
+        )
+
+    def add_steps(self, timesteps, log_probs):
+        steps_added = 0
+        for timestep in timesteps:
+            agent_id = timestep.agent_id
+            idx = self.used_agent_id_idx_map.get(agent_id)
+            if idx is None:
+                continue
+            steps_added += 1
+            self.obs_lists[agent_id].append(timestep.obs)
+            self.action_lists[agent_id].append(timestep.action)
+            self.reward_lists[agent_id].append(timestep.reward)
+            self.log_prob_lists[agent_id].append(log_probs[idx])
+            self.final_obs[agent_id] = timestep.next_obs
+            if timestep.terminated or timestep.truncated:
+                # the game's over, and the env has already dealt this agent a new one. next_obs is from the new
+                # game, so end the trajectory on the game's own last obs
+                self.final_obs[agent_id] = self.pending_final_obs.get(agent_id, timestep.next_obs)
+                self.finished.append(self._trajectory(agent_id, timestep.truncated))
+                self.obs_lists[agent_id] = []
+                self.action_lists[agent_id] = []
+                self.reward_lists[agent_id] = []
+                self.log_prob_lists[agent_id] = []
+                self.final_obs[agent_id] = None
+        return steps_added
+
+    def finalize(self):
+        # whatever's left is a game still going
+        for agent_id in self.used_agent_id_idx_map:
+            self.truncateds[agent_id] = True
+            self.dones[agent_id] = True
+
+    def get_trajectories(self) -> List[Trajectory]:
+        trajectories = list(self.finished)
+        for agent_id in self.used_agent_id_idx_map:
+            if len(self.obs_lists[agent_id]) > 0:
+                trajectories.append(self._trajectory(agent_id, self.truncateds[agent_id]))
+        return trajectories
+
+class MultiGamePPOAgentController(PPOAgentController):
+    """A class to represent a PPOAgentController for MultiGameEnv envs. It never asks them to reset."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.obs_standardizer is not None:
+            # the final obs from shared_info skip the standardizer, so the trajectories would mix standardized and raw obs
+            raise ValueError("MultiGamePPOAgentController can't be used with an obs standardizer")
+
+    def process_timestep_data(self, timestep_data):
+        for env_id, (env_timesteps, _, env_shared_info, _) in timestep_data.items():
+            if env_timesteps and env_id not in self.current_env_trajectories:
+                self.current_env_trajectories[env_id] = RollingEnvTrajectories(
+                    [timestep.agent_id for timestep in env_timesteps],
+                    self.agent_choice_fn,
+                )
+            trajectories = self.current_env_trajectories.get(env_id)
+            if isinstance(trajectories, RollingEnvTrajectories):
+                # these don't go through the obs standardizer, which is why __init__ refuses one
+                trajectories.pending_final_obs = (env_shared_info or {}).get('final_obs') or {}
+        super().process_timestep_data(timestep_data)
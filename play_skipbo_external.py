@@ -155,9 +155,11 @@ class BotActionPanel(Static):
                 self.agent = Agent(config)
                 self._agent_config = config  # Save config for comparison
             try:
-                obs = config.obs_builder.build_obs([0], self.state, {})[0]
+                # states built here are never changed afterwards, so one version covers them and the agent can reuse this obs
+                shared_info = {'state_version': 0}
+                obs = config.obs_builder.build_obs([0], self.state, shared_info)[0]
                 self.append_status(f"Obs: {obs}")
-                action: SkipBoAction = self.agent.get_action(self.state)
+                action: SkipBoAction = self.agent.get_action(self.state, shared_info)
                 self.append_status(f"Action: {action}")
                 # convert the action into the form "Play the {} from your {} onto the {} of the {}"
                 # sources: 0 = stock pile, 1-5 = hand, 6-9 = discard piles
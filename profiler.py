@@ -0,0 +1,172 @@
+# profiler.py
+# where the env processes spend their time during a real training run. off by default.
+# turn it on with configure() or by setting SKIPBO_PROFILE to a directory before the env processes start
+# (train.py's profile_directory does that). then:
+# - instrument(env) wraps the env's parts (engine, obs builder, parser, reward, done conditions...) so every call
+#   adds to that part's call count and total time
+# - sending an env process SIGUSR1, or touching <directory>/sample_stacks (which every env process notices),
+#   makes it sample its own stack for sample_duration seconds of cpu time, as folded stacks
+# every ship_interval seconds SkipBoSharedInfoProvider hands what's been collected to SkipBoMetricsLogger, which adds
+# it up over all the env processes for each iteration and writes the stacks out for flamegraph.pl or speedscope.
+
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+# (attribute of the RLGym, method, name) of everything instrument() times
+COMPONENTS = [
+    ('transition_engine', 'step', 'engine.step'),
+    ('state_mutator', 'apply', 'mutator.apply'),
+    ('obs_builder', 'build_obs', 'obs_builder.build_obs'),
+    ('action_parser', 'parse_actions', 'action_parser.parse_actions'),
+    ('reward_fn', 'get_rewards', 'reward_fn.get_rewards'),
+    ('termination_cond', 'is_done', 'termination_cond.is_done'),
+    ('truncation_cond', 'is_done', 'truncation_cond.is_done'),
+    ('shared_info_provider', 'step', 'shared_info_provider.step'),
+]
+
+def empty_profile() -> Dict[str, Any]:
+    """A profile with nothing in it: wall seconds covered, [calls, seconds] per component, and sample counts per folded stack."""
+    return {'processes': 0, 'seconds': 0.0, 'components': {}, 'stacks': {}}
+
+def merge_profiles(into: Dict[str, Any], profile: Dict[str, Any]):
+    """Add profile into into."""
+    into['processes'] += profile['processes']
+    into['seconds'] += profile['seconds']
+    for name, (calls, seconds) in profile['components'].items():
+        totals = into['components'].setdefault(name, [0, 0.0])
+        totals[0] += calls
+        totals[1] += seconds
+    for stack, n in profile['stacks'].items():
+        into['stacks'][stack] = into['stacks'].get(stack, 0) + n
+
+def _fold(frame, max_depth: int) -> str:
+    """frame's stack as one folded line, outermost call first."""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class Profiler:
+    """A class to represent the profiler of one process."""
+    def __init__(self):
+        self.enabled = False
+        self.directory: Optional[str] = None
+        self.ship_interval = 10.0
+        self.sample_interval = 0.005
+        self.sample_duration = 10.0
+        self.max_depth = 64
+        # [calls, seconds] per component
+        self.components: Dict[str, List] = {}
+        self.stacks: Dict[str, int] = {}
+        self._sampling_until: Optional[float] = None
+        self._flag_mtime: Optional[float] = None
+        self._last_flag_check = time.monotonic()
+        self._last_ship = time.monotonic()
+
+    def configure(self, enabled: bool = True, directory: Optional[str] = None, ship_interval: Optional[float] = None,
+                  sample_interval: Optional[float] = None, sample_duration: Optional[float] = None):
+        self.enabled = enabled
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._flag_mtime = self._read_flag_mtime()
+        if ship_interval is not None:
+            self.ship_interval = ship_interval
+        if sample_interval is not None:
+            self.sample_interval = sample_interval
+        if sample_duration is not None:
+            self.sample_duration = sample_duration
+        if enabled and hasattr(signal, 'SIGUSR1'):
+            try:
+                signal.signal(signal.SIGUSR1, lambda signum, frame: self.start_sampling())
+            except ValueError:
+                # not the main thread, so only the flag file can start sampling here
+                pass
+        self._last_ship = time.monotonic()
+
+    def instrument(self, env):
+        """Time every call to the parts of env (an RLGym) listed in COMPONENTS."""
+        for attribute, method, name in COMPONENTS:
+            part = getattr(env, attribute, None)
+            if part is not None:
+                self.wrap(part, method, name)
+
+    def wrap(self, obj: Any, method: str, name: str):
+        inner = getattr(obj, method)
+        totals = self.components.setdefault(name, [0, 0.0])
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return inner(*args, **kwargs)
+            finally:
+                totals[0] += 1
+                totals[1] += perf_counter() - start
+        # an instance attribute wins over the class's method, so only this object gets timed
+        setattr(obj, method, timed)
+
+    def start_sampling(self, duration: Optional[float] = None):
+        """Sample this process's stack every sample_interval seconds of cpu time, for duration seconds."""
+        if not hasattr(signal, 'setitimer'):
+            return
+        self._sampling_until = time.monotonic() + (self.sample_duration if duration is None else duration)
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.sample_interval, self.sample_interval)
+
+    def stop_sampling(self):
+        if self._sampling_until is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            self._sampling_until = None
+
+    def _sample(self, signum, frame):
+        if self._sampling_until is None or time.monotonic() >= self._sampling_until:
+            self.stop_sampling()
+            return
+        stack = _fold(frame, self.max_depth)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _read_flag_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(os.path.join(self.directory, "sample_stacks")).st_mtime
+        except OSError:
+            return None
+
+    def _check_flag(self):
+        # touching the flag file again starts another round
+        mtime = self._read_flag_mtime()
+        if mtime is not None and mtime != self._flag_mtime:
+            self._flag_mtime = mtime
+            self.start_sampling()
+
+    def take(self) -> Optional[Dict[str, Any]]:
+        """What's been collected since the last take, if it's been ship_interval seconds. None otherwise."""
+        now = time.monotonic()
+        if self.directory is not None and now - self._last_flag_check >= 1.0:
+            self._last_flag_check = now
+            self._check_flag()
+        if now - self._last_ship < self.ship_interval:
+            return None
+        profile = {
+            'processes': 1,
+            'seconds': now - self._last_ship,
+            'components': {name: list(totals) for name, totals in self.components.items()},
+            'stacks': self.stacks,
+        }
+        # the wrappers hold on to their totals lists, so zero them in place
+        for totals in self.components.values():
+            totals[0] = 0
+            totals[1] = 0.0
+        self.stacks = {}
+        self._last_ship = now
+        return profile
+
+# the one every env in this process reports to
+profiler = Profiler()
+
+if os.environ.get("SKIPBO_PROFILE"):
+    profiler.configure(directory=os.environ["SKIPBO_PROFILE"])
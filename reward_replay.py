@@ -0,0 +1,282 @@
+# reward_replay.py
+# score recorded games with any reward function, without having to train with it.
+# games are stored as .npz files: one compact state buffer per step (the state *after* the step, which is what
+# reward functions see), plus which move-list slot was picked. scoring a file is spread over a process pool,
+# and the rewards plus each term's share of them are written back out as .npz files.
+
+import argparse
+import glob
+import os
+import random
+from multiprocessing import Pool
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from rlgym.api import RewardFunction
+
+from compact_state import CompactLayout, CompactSkipBoState, HAND_SIZE, NUM_DISCARD_PILES, HDR_CURRENT_PLAYER, HDR_LAST_SRC, HDR_LAST_DST, HDR_LAST_WAS_VALID
+from env import SkipBoEngine, SkipBoMutator, SkipBoAction, SkipBoState, legal_move_mask, moves_in_mask
+import rewards
+from rewards import TermReward, TransitionBatch
+
+
+class TrajectoryWriter:
+    """A class to represent a file of recorded games that's still being written."""
+    def __init__(self, path: str):
+        self.path = path
+        self.layout: Optional[CompactLayout] = None
+        self.buffers: List[np.ndarray] = []
+        self.picked_padding: List[bool] = []
+        self.has_pick: List[bool] = []
+        self.episode_starts: List[int] = []
+        self._compact = None
+
+    def start_episode(self):
+        if len(self.episode_starts) == 0 or self.episode_starts[-1] != len(self.buffers):
+            self.episode_starts.append(len(self.buffers))
+
+    def add_step(self, state: SkipBoState, shared_info: Dict[str, Any]):
+        """Record the state after a step, and the move-list slot that led to it if shared_info has one."""
+        if self.layout is None:
+            self.layout = CompactLayout(num_players=len(state.player_states),
+                                        stock_capacity=max(30, max(len(ps.stock_pile) for ps in state.player_states)))
+            self._compact = CompactSkipBoState(self.layout)
+        if len(self.episode_starts) == 0:
+            self.start_episode()
+        CompactSkipBoState.from_state(state, self.layout, self._compact.buffer)
+        self.buffers.append(self._compact.buffer.copy())
+        has_pick = 'raw_action_idx' in shared_info and 'possible_moves' in shared_info
+        self.has_pick.append(has_pick)
+        self.picked_padding.append(has_pick and shared_info['possible_moves'][shared_info['raw_action_idx']][0] == -1)
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def save(self):
+        if self.layout is None:
+            return
+        # drop an episode that was started but never got a step
+        episode_starts = [start for start in self.episode_starts if start < len(self.buffers)]
+        np.savez_compressed(
+            self.path,
+            buffers=np.stack(self.buffers),
+            picked_padding=np.array(self.picked_padding, dtype=bool),
+            has_pick=np.array(self.has_pick, dtype=bool),
+            episode_starts=np.array(episode_starts, dtype=np.int64),
+            layout=np.array([self.layout.num_players, self.layout.stock_capacity, self.layout.discard_capacity], dtype=np.int64),
+        )
+
+
+class Trajectories:
+    """A class to represent a file of recorded games, loaded back in."""
+    def __init__(self, path: str):
+        with np.load(path) as data:
+            self.buffers = data['buffers']
+            self.picked_padding = data['picked_padding']
+            self.has_pick = data['has_pick']
+            self.episode_starts = data['episode_starts']
+            num_players, stock_capacity, discard_capacity = (int(x) for x in data['layout'])
+        self.layout = CompactLayout(num_players, stock_capacity, discard_capacity)
+        self.path = path
+
+    def __len__(self):
+        return len(self.buffers)
+
+    def episode_ends(self) -> np.ndarray:
+        """A bool per step, true on the last step of each episode."""
+        ends = np.zeros(len(self), dtype=bool)
+        ends[self.episode_starts[1:] - 1] = True
+        if len(self) > 0:
+            ends[-1] = True
+        return ends
+
+    def states(self):
+        for buffer in self.buffers:
+            yield CompactSkipBoState(self.layout, buffer).to_state()
+
+    def shared_info(self, step: int) -> Dict[str, Any]:
+        """What the reward function would have seen in shared_info. The move list is cut down to the slot that was picked."""
+        if not self.has_pick[step]:
+            return {}
+        move = (-1, -1) if self.picked_padding[step] else (int(self.buffers[step, HDR_LAST_SRC]), int(self.buffers[step, HDR_LAST_DST]))
+        return {'raw_action_idx': 0, 'possible_moves': [move]}
+
+    def transitions(self) -> TransitionBatch:
+        """The reward terms' view of every step, read straight out of the buffers."""
+        layout = self.layout
+        n = len(self)
+        rows = np.arange(n)
+        player = self.buffers[:, HDR_CURRENT_PLAYER].astype(np.int64)
+        lengths = self.buffers[:, layout.lengths_offset:layout.lengths_offset + layout.num_piles].astype(np.int64)
+        hand_start = layout.hands_offset + player * HAND_SIZE
+        stock_ids = player * (1 + NUM_DISCARD_PILES)
+        return TransitionBatch(
+            valid=self.buffers[:, HDR_LAST_WAS_VALID] != 0,
+            src=self.buffers[:, HDR_LAST_SRC].astype(np.int64),
+            dst=self.buffers[:, HDR_LAST_DST].astype(np.int64),
+            hand=self.buffers[rows[:, None], hand_start[:, None] + np.arange(HAND_SIZE)].astype(np.int64),
+            stock_size=lengths[rows, stock_ids],
+            discard_sizes=lengths[rows[:, None], stock_ids[:, None] + 1 + np.arange(NUM_DISCARD_PILES)],
+            build_heights=lengths[:, layout.build_id(0):layout.build_id(0) + 4],
+            picked_padding=self.picked_padding.copy(),
+            has_pick=self.has_pick.copy(),
+        )
+
+
+class RecordingReward(RewardFunction[int, SkipBoState, float]):
+    """
+    Wraps the reward function used for training and records every step it's asked about, so the games can be
+    scored with other reward functions later. Writes a new file every episodes_per_file episodes.
+    """
+    def __init__(self, reward_fn: RewardFunction, directory: str, episodes_per_file: int = 100):
+        self.reward_fn = reward_fn
+        self.directory = directory
+        self.episodes_per_file = episodes_per_file
+        self._files_written = 0
+        self._writer = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _new_writer(self):
+        self._writer = TrajectoryWriter(os.path.join(self.directory, f"trajectories_{os.getpid()}_{self._files_written}.npz"))
+        self._files_written += 1
+
+    def reset(self, agents, initial_state, shared_info):
+        if self._writer is None:
+            self._new_writer()
+        elif len(self._writer.episode_starts) >= self.episodes_per_file and len(self._writer) > self._writer.episode_starts[-1]:
+            self._writer.save()
+            self._new_writer()
+        self._writer.start_episode()
+        self.reward_fn.reset(agents, initial_state, shared_info)
+
+    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
+        self._writer.add_step(state, shared_info)
+        return self.reward_fn.get_rewards(agents, state, is_terminated, is_truncated, shared_info)
+
+    def flush(self):
+        """Write out the episodes recorded so far, including an unfinished one."""
+        if self._writer is not None and len(self._writer) > 0:
+            self._writer.save()
+            self._new_writer()
+
+
+def record_random_games(path: str, num_games: int, num_players: int = 2, stock_pile_size: int = 20, max_steps: int = 2000, seed: Optional[int] = None):
+    """Play games of uniformly random legal moves and record them, for when there aren't any real games to score."""
+    rng = random.Random(seed)
+    writer = TrajectoryWriter(path)
+    for _ in range(num_games):
+        engine = SkipBoEngine(num_players, seed=rng.getrandbits(32))
+        state = engine.create_base_state()
+        SkipBoMutator(num_players, stock_pile_size, seed=rng.getrandbits(32)).apply(state, {})
+        engine.reset(state)
+        writer.start_episode()
+        for _ in range(max_steps):
+            moves = moves_in_mask(legal_move_mask(engine.state))
+            if len(moves) == 0:
+                break
+            engine.step({0: SkipBoAction(*rng.choice(moves))}, {})
+            writer.add_step(engine.state, {})
+            if any(len(ps.stock_pile) == 0 for ps in engine.state.player_states):
+                break
+    writer.save()
+
+
+def score_trajectories(path: str, reward_name: str) -> Dict[str, np.ndarray]:
+    """Score every step in a file with a reward function from rewards.py, given by class name."""
+    reward_fn = getattr(rewards, reward_name)()
+    trajectories = Trajectories(path)
+    if isinstance(reward_fn, TermReward):
+        # the whole file in one go, with each term's share
+        total, parts = reward_fn.evaluate_batch(trajectories.transitions(), breakdown=True)
+        return {'rewards': total, **{f'term_{name}': share for name, share in parts.items()}}
+    # anything else gets asked one step at a time, like it would be inside RLGym
+    ends = trajectories.episode_ends()
+    starts = set(trajectories.episode_starts.tolist())
+    total = np.zeros(len(trajectories))
+    for step, state in enumerate(trajectories.states()):
+        if step in starts:
+            reward_fn.reset([0], state, {})
+        total[step] = reward_fn.get_rewards([0], state, {0: bool(ends[step])}, {0: False}, trajectories.shared_info(step))[0]
+    return {'rewards': total}
+
+
+def _score_job(job: Tuple[str, str]):
+    path, reward_name = job
+    return path, reward_name, score_trajectories(path, reward_name)
+
+
+def recompute_rewards(paths: List[str], reward_names: List[str], out_dir: str, processes: Optional[int] = None) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    Score every file with every reward function over a process pool.
+    For each reward function, writes <out_dir>/<reward_name>.npz with the reward stream of every step, each term's
+    share of it, the return of every episode, and which file each step came from. Returns summary stats.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(path, reward_name) for reward_name in reward_names for path in paths]
+    with Pool(processes) as pool:
+        results = pool.map(_score_job, jobs)
+    by_reward = {reward_name: {} for reward_name in reward_names}
+    for path, reward_name, result in results:
+        by_reward[reward_name][path] = result
+
+    episode_starts = {}
+    for path in paths:
+        with np.load(path) as data:
+            episode_starts[path] = data['episode_starts']
+
+    summary = {}
+    for reward_name in reward_names:
+        per_file = [by_reward[reward_name][path] for path in paths]
+        keys = list(per_file[0].keys())
+        arrays = {key: np.concatenate([result[key] for result in per_file]) for key in keys}
+        # episode starts, shifted so they index into the concatenated arrays
+        offsets = np.cumsum([0] + [len(result['rewards']) for result in per_file[:-1]])
+        starts = np.concatenate([episode_starts[path] + offset for path, offset in zip(paths, offsets)])
+        file_index = np.concatenate([np.full(len(result['rewards']), i, dtype=np.int32) for i, result in enumerate(per_file)])
+        returns = np.add.reduceat(arrays['rewards'], starts) if len(starts) > 0 else np.zeros(0)
+        np.savez_compressed(
+            os.path.join(out_dir, f"{reward_name}.npz"),
+            episode_starts=starts,
+            episode_returns=returns,
+            file_index=file_index,
+            files=np.array(paths),
+            **{key: value.astype(np.float32) for key, value in arrays.items()},
+        )
+        summary[reward_name] = {
+            key: {'mean': float(value.mean()), 'std': float(value.std()), 'nonzero': float((value != 0).mean())}
+            for key, value in arrays.items()
+        }
+        summary[reward_name]['episode_return'] = {'mean': float(returns.mean()), 'std': float(returns.std()), 'nonzero': float((returns != 0).mean())}
+    return summary
+
+
+def print_summary(summary: Dict[str, Dict[str, Dict[str, float]]]):
+    for reward_name, stats in summary.items():
+        print(f"{reward_name}:")
+        for key, values in stats.items():
+            print(f"  {key:<24} mean {values['mean']:>10.4f}  std {values['std']:>10.4f}  nonzero {values['nonzero']:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score recorded Skip-Bo games with reward functions from rewards.py.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="record games of random legal moves")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--games", type=int, default=100)
+    record_parser.add_argument("--players", type=int, default=2)
+    record_parser.add_argument("--stock-pile-size", type=int, default=20)
+    record_parser.add_argument("--seed", type=int, default=None)
+
+    score_parser = subparsers.add_parser("score", help="score recorded games")
+    score_parser.add_argument("paths", nargs="+", help="trajectory files, or globs of them")
+    score_parser.add_argument("--rewards", nargs="+", required=True, help="reward class names from rewards.py")
+    score_parser.add_argument("--out", default="reward_replay")
+    score_parser.add_argument("--processes", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record_random_games(args.path, args.games, args.players, args.stock_pile_size, seed=args.seed)
+    else:
+        paths = sorted(path for pattern in args.paths for path in (glob.glob(pattern) or [pattern]))
+        print_summary(recompute_rewards(paths, args.rewards, args.out, args.processes))
@@ -1,291 +1,351 @@
-from env import SkipBoState
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import numpy as np
+
+from env import SkipBoState, VersionCache
+from telemetry import telemetry
 from rlgym.api import RewardFunction
 
-class IoReward(RewardFunction[int, SkipBoState, float]):
-    """A class to represent the reward function for the game."""
+# every reward here is a weighted sum of named terms.
+# a term is worked out from a Transition (one step, plain python) or a TransitionBatch (many steps, numpy arrays),
+# so the same reward can be scored one step at a time inside RLGym or over a whole batch of steps at once.
+# note that the state is the one *after* the step, so after a discard "the current player" is already the next player.
+
+@dataclass
+class Transition:
+    """A class to represent what the reward terms need to know about one step."""
+    valid: bool
+    src: int
+    dst: int
+    hand: List[int] # the current player's hand
+    stock_size: int # the current player's stock pile size
+    discard_sizes: List[int] # the current player's discard pile sizes
+    build_heights: List[int]
+    picked_padding: bool # the policy picked a (-1, -1) slot of the move list
+    has_pick: bool # shared_info said which slot was picked
+
+    @classmethod
+    def from_state(cls, state: SkipBoState, shared_info: Dict[str, Any]) -> 'Transition':
+        ps = state.player_states[state.current_player]
+        action = state.last_step.action
+        has_pick = 'raw_action_idx' in shared_info and 'possible_moves' in shared_info
+        return cls(
+            valid=state.last_step.was_valid,
+            src=action.card_source,
+            dst=action.card_destination,
+            hand=ps.hand,
+            stock_size=len(ps.stock_pile),
+            discard_sizes=[len(discard_pile) for discard_pile in ps.discard_piles],
+            build_heights=[len(build_pile) for build_pile in state.build_piles],
+            picked_padding=has_pick and shared_info['possible_moves'][shared_info['raw_action_idx']][0] == -1,
+            has_pick=has_pick,
+        )
+
+@dataclass
+class TransitionBatch:
+    """A class to represent many steps at once, with each Transition field as an array with one row per step."""
+    valid: np.ndarray # (N,) bool
+    src: np.ndarray # (N,)
+    dst: np.ndarray # (N,)
+    hand: np.ndarray # (N, 5)
+    stock_size: np.ndarray # (N,)
+    discard_sizes: np.ndarray # (N, 4)
+    build_heights: np.ndarray # (N, 4)
+    picked_padding: np.ndarray # (N,) bool
+    has_pick: np.ndarray # (N,) bool
+
+    def __len__(self):
+        return len(self.valid)
+
+    @classmethod
+    def from_transitions(cls, transitions: List[Transition]) -> 'TransitionBatch':
+        def column(field, dtype=None):
+            return np.array([getattr(t, field) for t in transitions], dtype=dtype)
+        return cls(
+            valid=column('valid', bool),
+            src=column('src', np.int64),
+            dst=column('dst', np.int64),
+            hand=column('hand', np.int64).reshape(len(transitions), -1),
+            stock_size=column('stock_size', np.int64),
+            discard_sizes=column('discard_sizes', np.int64).reshape(len(transitions), -1),
+            build_heights=column('build_heights', np.int64).reshape(len(transitions), -1),
+            picked_padding=column('picked_padding', bool),
+            has_pick=column('has_pick', bool),
+        )
+
+    @classmethod
+    def from_states(cls, states: List[SkipBoState], shared_infos: Optional[List[Dict[str, Any]]] = None) -> 'TransitionBatch':
+        if shared_infos is None:
+            shared_infos = [{}] * len(states)
+        return cls.from_transitions([Transition.from_state(state, shared_info) for state, shared_info in zip(states, shared_infos)])
+
+
+class RewardTerm:
+    """A class to represent one named part of a reward. Unweighted: the reward function holds the weights."""
+    name = ''
+    # most terms only count when the move was valid. an invalid move only ever gets the ungated terms
+    gated = True
+
+    def value(self, t: Transition) -> float:
+        raise NotImplementedError
+
+    def batch(self, t: TransitionBatch) -> np.ndarray:
+        raise NotImplementedError
+
+class InvalidMoveTerm(RewardTerm):
+    """1 for an invalid move."""
+    name = 'invalid'
+    gated = False
+
+    def value(self, t):
+        return float(not t.valid)
+
+    def batch(self, t):
+        return (~t.valid).astype(np.float64)
+
+class WinTerm(RewardTerm):
+    """1 once the current player's stock pile is empty."""
+    name = 'win'
+
+    def value(self, t):
+        return float(t.stock_size == 0)
+
+    def batch(self, t):
+        return (t.stock_size == 0).astype(np.float64)
+
+class StockPlayTerm(RewardTerm):
+    """1 for playing from the stock pile."""
+    name = 'stock_play'
+
+    def value(self, t):
+        return float(t.src == 0)
+
+    def batch(self, t):
+        return (t.src == 0).astype(np.float64)
+
+class HandToBuildTerm(RewardTerm):
+    """1 for playing from the hand to a build pile. (like it always has, this counts hand slots 1-4 and destinations 0-4)"""
+    name = 'hand_to_build'
+
+    def value(self, t):
+        return float(1 <= t.src <= 4 and t.dst <= 4)
+
+    def batch(self, t):
+        return ((t.src >= 1) & (t.src <= 4) & (t.dst <= 4)).astype(np.float64)
+
+class HandRefillTerm(RewardTerm):
+    """1 when the current player ends up with a full hand after a move that wasn't from a discard pile."""
+    name = 'hand_refill'
+
+    def value(self, t):
+        return float(t.src < 5 and 0 not in t.hand)
+
+    def batch(self, t):
+        return ((t.src < 5) & (t.hand != 0).all(axis=1)).astype(np.float64)
+
+class StockProgressTerm(RewardTerm):
+    """How many cards are gone from a 20 card stock pile, while there are any left."""
+    name = 'stock_progress'
+
+    def value(self, t):
+        return float(20 - t.stock_size) if t.stock_size > 0 else 0.0
+
+    def batch(self, t):
+        return np.where(t.stock_size > 0, 20 - t.stock_size, 0).astype(np.float64)
+
+class HugeDiscardTerm(RewardTerm):
+    """The size of the discard pile at dst - 5 if it's over 5 cards, for dst 5-9 (Callisto's numbering)."""
+    name = 'huge_discard'
+
+    def value(self, t):
+        if 5 <= t.dst <= 9:
+            size = t.discard_sizes[t.dst - 5]
+            if size > 5:
+                return float(size)
+        return 0.0
+
+    def batch(self, t):
+        in_range = (t.dst >= 5) & (t.dst <= 9)
+        sizes = np.take_along_axis(t.discard_sizes, np.clip(t.dst - 5, 0, 3)[:, None], axis=1)[:, 0]
+        return np.where(in_range & (sizes > 5), sizes, 0).astype(np.float64)
+
+class AvoidableDiscardTerm(RewardTerm):
+    """For a discard to dst 5-9, how many (hand card, build pile) pairs could have been played instead."""
+    name = 'avoidable_discard'
+
+    def value(self, t):
+        if 5 <= t.dst <= 9:
+            return float(sum(card == height + 1 for card in t.hand for height in t.build_heights))
+        return 0.0
+
+    def batch(self, t):
+        in_range = (t.dst >= 5) & (t.dst <= 9)
+        pairs = (t.hand[:, :, None] == t.build_heights[:, None, :] + 1).sum(axis=(1, 2))
+        return np.where(in_range, pairs, 0).astype(np.float64)
+
+class PaddingPickTerm(RewardTerm):
+    """1 for picking a (-1, -1) padding slot of the move list."""
+    name = 'padding_pick'
+
+    def value(self, t):
+        return float(t.picked_padding)
+
+    def batch(self, t):
+        return t.picked_padding.astype(np.float64)
+
+
+class TermReward(RewardFunction[int, SkipBoState, float]):
+    """A class to represent a reward function that's a weighted sum of reward terms."""
+    def __init__(self, terms: List[Tuple[RewardTerm, float]]):
+        self.terms = terms
+        self.names = [term.name for term, _ in terms]
+
     def reset(self, agents, initial_state, shared_info):
         pass
-    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        # reward for:
-        # - winning (very large)
-        # - playing card from stock pile (large)
-        # - playing card from hand to build pile
-        # - redrawing hand (small)
-        # penalty for:
-        # - invalid move
-        # - next player plays from their stock pile
 
+    def evaluate(self, t: Transition, breakdown: bool = False):
+        """The reward for one step, and with breakdown, also each term's weighted share of it."""
         reward = 0.0
-        # print(f"Rewards for the active player, {agent}:")
-        if not state.last_step.was_valid:
-            # penalty for invalid move
-            # print(f"-0.1 for invalid move")
-            reward -= 0.1
-            return {0: reward}
-
-        if is_terminated and state.player_states[state.current_player].stock_pile == []:
-            # reward for winning
-            # print(f"1.0 for winning")
-            reward = 1.0
-        
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            # print(f"0.1 for playing from stock pile")
-            reward += 0.1
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            # print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-
-        return {0: reward}
-
-
-class EuropaReward(RewardFunction[int, SkipBoState, float]):
-    """A class to represent the reward function for the game."""
-    def reset(self, agents, initial_state, shared_info):
-        pass
+        parts = {} if breakdown else None
+        for term, weight in self.terms:
+            if term.gated and not t.valid:
+                continue
+            share = weight * term.value(t)
+            reward += share
+            if breakdown:
+                parts[term.name] = share
+        if breakdown:
+            return reward, parts
+        return reward
+
+    def evaluate_batch(self, batch: TransitionBatch, breakdown: bool = False):
+        """The rewards for a batch of steps as an (N,) array, and with breakdown, a dict of each term's (N,) weighted shares."""
+        rewards = np.zeros(len(batch))
+        parts = {} if breakdown else None
+        for term, weight in self.terms:
+            share = weight * term.batch(batch)
+            if term.gated:
+                share = np.where(batch.valid, share, 0.0)
+            rewards += share
+            if breakdown:
+                parts[term.name] = share
+        if breakdown:
+            return rewards, parts
+        return rewards
+
+    def breakdown(self, state: SkipBoState, shared_info: Dict[str, Any]) -> Dict[str, float]:
+        """Each term's weighted share of the reward for the step that led to state."""
+        return self.evaluate(Transition.from_state(state, shared_info), breakdown=True)[1]
+
     def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        # reward for:
-        # - playing card from stock pile (large)
-        # - playing card from hand to build pile
-        # - redrawing hand (small)
-        # penalty for:
-        # - invalid move
-        # - next player plays from their stock pile
+        return {0: self.evaluate(Transition.from_state(state, shared_info))}
 
-        reward = 0.0
-        # print(f"Rewards for the active player, {agent}:")
-        if not state.last_step.was_valid:
-            # penalty for invalid move
-            # print(f"-0.1 for invalid move")
-            reward -= 0.1
-            return {0: reward}
-
-        # if is_terminated and state.player_states[state.current_player].stock_pile == []:
-        #     # reward for winning
-        #     # print(f"1.0 for winning")
-        #     reward = 1.0
-        
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            # print(f"0.1 for playing from stock pile")
-            reward += 0.5
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            # print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-
-        return {0: reward}
-
-class GanymedeReward(RewardFunction[int, SkipBoState, float]):
+
+class IoReward(TermReward):
     """A class to represent the reward function for the game."""
-    def reset(self, agents, initial_state, shared_info):
-        pass
-    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        DO_LOG = False
-        # reward for:
-        # - playing card from stock pile (large)
-        # - playing card from hand to build pile
-        # - redrawing hand (small)
-        # penalty for:
-        # - invalid move
-        # - next player plays from their stock pile
+    def __init__(self):
+        super().__init__([
+            (InvalidMoveTerm(), -0.1),
+            (WinTerm(), 1.0),
+            (StockPlayTerm(), 0.1),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+        ])
 
-        reward = 0.0
-        # print(f"Rewards for the active player, {agent}:")
-        if not state.last_step.was_valid:
-            # penalty for invalid move
-            # print(f"-0.1 for invalid move")
-            reward -= 0.1
-            return {0: reward}
-
-        # if is_terminated and state.player_states[state.current_player].stock_pile == []:
-        #     # reward for winning
-        #     # print(f"1.0 for winning")
-        #     reward = 1.0
-        
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            if DO_LOG:
-                print(f"0.5 for playing from stock pile")
-            reward += 0.5
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            if DO_LOG:
-                print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-
-        return {0: reward}
-    
-
-class CallistoReward(RewardFunction[int, SkipBoState, float]):
+class EuropaReward(TermReward):
     """A class to represent the reward function for the game."""
-    def reset(self, agents, initial_state, shared_info):
-        pass
-    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        DO_LOG = False
-        # reward for:
-        # - playing card from stock pile (large)
-        # - playing card from hand to build pile
-        # - redrawing hand (small)
-        # penalty for:
-        # - invalid move
-        # - next player plays from their stock pile
+    def __init__(self):
+        # no more win reward, and the stock pile counts for a lot more
+        super().__init__([
+            (InvalidMoveTerm(), -0.1),
+            (StockPlayTerm(), 0.5),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+        ])
 
-        reward = 0.0
-        # print(f"Rewards for the active player, {agent}:")
-        if not state.last_step.was_valid:
-            # penalty for invalid move
-            # print(f"-0.1 for invalid move")
-            reward -= 0.01
-            return {0: reward}
-
-        # if is_terminated and state.player_states[state.current_player].stock_pile == []:
-        #     # reward for winning
-        #     # print(f"1.0 for winning")
-        #     reward = 1.0
-        
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            if DO_LOG:
-                print(f"0.5 for playing from stock pile")
-            reward += 0.5
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            if DO_LOG:
-                print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-        
-        if state.last_step.action.card_destination >= 5 and state.last_step.action.card_destination <= 9:
-            # penalty for huge discard piles
-            discard_pile_size = len(state.player_states[state.current_player].discard_piles[state.last_step.action.card_destination - 5])
-            if discard_pile_size > 5:
-                reward -= 0.05 * discard_pile_size
-                if DO_LOG:
-                    print(f"-0.05 * {discard_pile_size} for huge discard pile")
-        
-        # penalty for playing to discard when it was possible to play to a build pile
-        if state.last_step.action.card_destination >= 5 and state.last_step.action.card_destination <= 9:
-            # penalty for playing to discard when it was possible to play to a build pile
-            for card in state.player_states[state.current_player].hand:
-                for build_pile in state.build_piles:
-                    if card == len(build_pile) + 1:
-                        reward -= 0.03
-                        if DO_LOG:
-                            print(f"-0.03 for playing to discard when it was possible to play to a build pile")
-        
-        # general reward for smaller stock piles
-        stock_pile_size = len(state.player_states[state.current_player].stock_pile)
-        if stock_pile_size > 0:
-            reward += (20-stock_pile_size) * 0.1
-            if DO_LOG:
-                print(f"{(20-stock_pile_size) * 0.1} for cards off stock pile")
-
-        return {0: reward}
-
-class AmaltheaReward(RewardFunction[int, SkipBoState, float]):
+class GanymedeReward(TermReward):
     """A class to represent the reward function for the game."""
-    def reset(self, agents, initial_state, shared_info):
-        pass
-    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        DO_LOG = False
-        reward = 0.0
-        if not state.last_step.was_valid:
-            # the move was invalid
-            if state.last_step.action.card_source == -1:
-                # the move was invalid because the player played to the discard pile with another move available
-                reward -= 0.1
-                if DO_LOG:
-                    print(f"-0.1 for avoidable discard")
-            else:
-                # the move was just invalid (e.g. tried to play a 7 on a 2)
-                reward -= 0.1
-                if DO_LOG:
-                    print(f"-0.1 for invalid move")
-            return {0: reward}
-        # now, reward plays to the stock pile, plays from the hand, and small stock piles
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            if DO_LOG:
-                print(f"0.5 for playing from stock pile")
-            reward += 0.5
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            if DO_LOG:
-                print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-        # reward for smaller stock piles
-        stock_pile_size = len(state.player_states[state.current_player].stock_pile)
-        if stock_pile_size > 0:
-            reward += (20-stock_pile_size) * 0.1
-            if DO_LOG:
-                print(f"{(20-stock_pile_size) * 0.1} for cards off stock pile")
-        return {0: reward}
-
-class HimaliaReward(RewardFunction[int, SkipBoState, float]):
+    def __init__(self):
+        super().__init__([
+            (InvalidMoveTerm(), -0.1),
+            (StockPlayTerm(), 0.5),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+        ])
+
+class CallistoReward(TermReward):
+    """A class to represent the reward function for the game."""
+    def __init__(self):
+        super().__init__([
+            (InvalidMoveTerm(), -0.01),
+            (StockPlayTerm(), 0.5),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+            (HugeDiscardTerm(), -0.05),
+            (AvoidableDiscardTerm(), -0.03),
+            (StockProgressTerm(), 0.1),
+        ])
+
+class AmaltheaReward(TermReward):
     """A class to represent the reward function for the game."""
+    def __init__(self):
+        # an avoidable discard (the parser turns it into a -1 source) is punished the same as any other invalid move
+        super().__init__([
+            (InvalidMoveTerm(), -0.1),
+            (StockPlayTerm(), 0.5),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+            (StockProgressTerm(), 0.1),
+        ])
+
+class HimaliaReward(TermReward):
+    """
+    A class to represent the reward function for the game. With masked set (the policy can't pick padding slots,
+    see HimaliaActionParser), the padding penalty is left out, since there's nothing for it to teach.
+    """
+    def __init__(self, masked: bool = False):
+        # invalid moves shouldn't be possible at all with a move list, so they get nothing
+        terms = [
+            (StockPlayTerm(), 0.5),
+            (HandToBuildTerm(), 0.05),
+            (HandRefillTerm(), 0.01),
+            (StockProgressTerm(), 0.1),
+        ]
+        if not masked:
+            terms.append((PaddingPickTerm(), -0.005))
+        super().__init__(terms)
+
+    def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
+        t = Transition.from_state(state, shared_info)
+        if telemetry.enabled:
+            if not t.valid:
+                # this should really not be possible
+                telemetry.event('reward.invalid_move', lambda: {'action': str(state.last_step.action), 'choices': shared_info.get('possible_moves'), 'state': str(state)}, rate=1.0)
+            elif not t.has_pick:
+                telemetry.count('reward.missing_pick_info')
+        return {0: self.evaluate(t)}
+
+
+class MemoizedReward(RewardFunction[int, SkipBoState, float]):
+    """
+    Wraps another reward function so asking for the rewards of the same step twice doesn't recompute them.
+    Steps are told apart by the engine's state version plus the last step, since an invalid step
+    leaves the version alone.
+    """
+    def __init__(self, reward_fn: RewardFunction):
+        self.reward_fn = reward_fn
+        self.cache = VersionCache()
+
     def reset(self, agents, initial_state, shared_info):
-        pass
+        self.cache.clear()
+        self.reward_fn.reset(agents, initial_state, shared_info)
+
     def get_rewards(self, agents, state, is_terminated, is_truncated, shared_info) -> dict[int, float]:
-        DO_LOG = False
-        reward = 0.0
-        if not state.last_step.was_valid:
-            # the move was invalid
-            # this should really not be possible
-            print(f"\033[31mInvalid move:\033[0m {state.last_step.action} from choices {shared_info['possible_moves'] if 'possible_moves' in shared_info else 'N/A'} at state {state}")
-            return {0: reward}
-        # now, reward plays to the stock pile, plays from the hand, and small stock piles
-        if state.last_step.action.card_source == 0:
-            # reward for playing from stock pile
-            if DO_LOG:
-                print(f"0.5 for playing from stock pile")
-            reward += 0.5
-        elif state.last_step.action.card_source >= 1 and state.last_step.action.card_source <= 4 and state.last_step.action.card_destination <= 4:
-            # reward for playing from hand to build pile
-            if DO_LOG:
-                print(f"0.05 for playing from hand to build pile")
-            reward += 0.05
-        if state.last_step.action.card_source < 5 and state.player_states[state.current_player].hand.count(0) == 0:
-            # reward for redrawing hand
-            # print(f"0.01 for redrawing hand")
-            reward += 0.01
-        # reward for smaller stock piles
-        stock_pile_size = len(state.player_states[state.current_player].stock_pile)
-        if stock_pile_size > 0:
-            reward += (20-stock_pile_size) * 0.1
-            if DO_LOG:
-                print(f"{(20-stock_pile_size) * 0.1} for cards off stock pile")
-        # small penalty for not picking one of the options
-        if 'raw_action_idx' in shared_info and 'possible_moves' in shared_info:
-            if shared_info['possible_moves'][shared_info['raw_action_idx']][0] == -1:
-                reward -= 0.005
-                if DO_LOG:
-                    print(f"-0.005 for not picking one of the options")
-        else:
-            print(f"Warning: 'raw_action_idx' or 'possible_moves' not in shared_info")
-        
-        return {0: reward}
\ No newline at end of file
+        version = shared_info.get('state_version')
+        step_key = (state.last_step, shared_info.get('raw_action_idx'), tuple(agents),
+                    tuple(is_terminated[agent] for agent in agents), tuple(is_truncated[agent] for agent in agents))
+        rewards = self.cache.lookup(state, version, step_key)
+        if rewards is None:
+            rewards = self.reward_fn.get_rewards(agents, state, is_terminated, is_truncated, shared_info)
+            self.cache.store(state, version, dict(rewards), step_key)
+        return dict(rewards)
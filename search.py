@@ -0,0 +1,441 @@
+# search.py
+# lookahead for the bots. the policy network only ever looks one card ahead;
+# this plays the game forward on copies of the state to pick better moves.
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dataclasses import dataclass
+import heapq
+import math
+import random
+import threading
+import time
+
+from env import SkipBoEngine, SkipBoState, SkipBoAction, Card, moves_in_mask, canonical_moves, BUILD_MOVES_MASK
+
+Move = Tuple[int, int] # (card_source, card_destination)
+# given a state, how likely the policy is to pick each move
+PriorFn = Callable[[SkipBoState], Dict[Move, float]]
+
+# 12 of each card from 1-12 and 18 skipbo cards
+DECK_COUNTS = [0] + [12] * 12 + [18]
+
+
+@dataclass
+class SearchConfig:
+    """How an agent should search. Attach one to an AgentConfig to turn search on."""
+    time_budget: float = 0.5 # seconds of wall-clock time per move
+    max_iterations: Optional[int] = None # stop early after this many iterations
+    exploration: float = 1.5 # the PUCT exploration constant
+    prior_mix: float = 0.1 # how much of the prior is spread uniformly, so moves the policy never picks still get looked at
+    max_depth: int = 40 # cards played per iteration before falling back to the heuristic
+    seed: Optional[int] = None
+
+
+def winner(state: SkipBoState) -> Optional[int]:
+    """The player who has emptied their stock pile, if any."""
+    for i, ps in enumerate(state.player_states):
+        if len(ps.stock_pile) == 0:
+            return i
+    return None
+
+def heuristic_value(state: SkipBoState, player: int) -> float:
+    """How good the state looks for a player, from -1 (lost) to 1 (won)."""
+    won_by = winner(state)
+    if won_by is not None:
+        return 1.0 if won_by == player else -1.0
+    my_stock = len(state.player_states[player].stock_pile)
+    other_stock = min(len(ps.stock_pile) for i, ps in enumerate(state.player_states) if i != player)
+    # having the smaller stock pile is what wins games
+    return math.tanh(0.25 * (other_stock - my_stock))
+
+
+def determinize(state: SkipBoState, observer: int, rng: random.Random) -> SkipBoState:
+    """
+    Make a copy of the state where every card the observer can't see has been re-dealt at random,
+    consistent with everything they can see.
+    The observer sees their own hand, the top of every stock pile, every discard pile, the build piles
+    and the completed build piles. Other players' hands, the rest of the stock piles and the draw pile are hidden.
+    """
+    det = state.copy()
+    # everything not visible is somewhere in the hidden slots
+    unseen = list(DECK_COUNTS)
+    def see(cards: List[Card]):
+        for card in cards:
+            if card != 0 and unseen[card] > 0:
+                unseen[card] -= 1
+    see(det.player_states[observer].hand)
+    for ps in det.player_states:
+        see(ps.stock_pile[-1:])
+        for discard_pile in ps.discard_piles:
+            see(discard_pile)
+    for build_pile in det.build_piles:
+        see(build_pile)
+    see(det.completed_build_piles)
+    pool = [card for card in range(1, 14) for _ in range(unseen[card])]
+
+    num_hidden = len(det.draw_pile)
+    for i, ps in enumerate(det.player_states):
+        num_hidden += max(len(ps.stock_pile) - 1, 0)
+        if i != observer:
+            num_hidden += 5 - ps.hand.count(0)
+    if len(pool) < num_hidden:
+        # the state doesn't add up (e.g. placeholder cards typed in by hand), so just shuffle what's there
+        pool = list(det.draw_pile)
+        for i, ps in enumerate(det.player_states):
+            pool += ps.stock_pile[:-1]
+            if i != observer:
+                pool += [card for card in ps.hand if card != 0]
+    rng.shuffle(pool)
+
+    for i, ps in enumerate(det.player_states):
+        if len(ps.stock_pile) > 1:
+            hidden = len(ps.stock_pile) - 1
+            ps.stock_pile[:-1] = pool[:hidden]
+            del pool[:hidden]
+        if i != observer:
+            for j in range(5):
+                if ps.hand[j] != 0:
+                    ps.hand[j] = pool.pop()
+    # the rest is the draw pile. if the state was missing cards altogether (e.g. an empty draw pile typed in by hand)
+    # they end up here too
+    det.draw_pile = pool
+    return det
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of results keyed by zobrist hash (see env.zobrist_hash), shared by searches and caches.
+    Each hash maps to one slot. When two hashes want the same slot, the newer one wins if the old entry is from
+    an earlier generation or was searched no deeper, so expensive results stick around.
+    Safe to share between threads.
+    """
+    def __init__(self, size_log2: int = 16):
+        self.size = 1 << size_log2
+        self._mask = self.size - 1
+        self._hashes = [0] * self.size
+        self._values: List[Any] = [None] * self.size
+        self._depths = [-1] * self.size
+        self._generations = [0] * self.size
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # a slot's hash and value get written one after the other, so don't let a lookup land in between
+        self._lock = threading.Lock()
+
+    def new_generation(self):
+        """Mark everything stored so far as old, so it gets replaced first. Call this between searches."""
+        self.generation += 1
+
+    def lookup(self, state_hash: int) -> Optional[Any]:
+        slot = state_hash & self._mask
+        with self._lock:
+            if self._depths[slot] >= 0 and self._hashes[slot] == state_hash:
+                self.hits += 1
+                return self._values[slot]
+            self.misses += 1
+            return None
+
+    def store(self, state_hash: int, value: Any, depth: int = 0) -> bool:
+        """Store a result. Returns whether it was kept."""
+        slot = state_hash & self._mask
+        with self._lock:
+            if (self._depths[slot] >= 0 and self._hashes[slot] != state_hash
+                    and self._generations[slot] == self.generation and self._depths[slot] > depth):
+                return False
+            self._hashes[slot] = state_hash
+            self._values[slot] = value
+            self._depths[slot] = depth
+            self._generations[slot] = self.generation
+            return True
+
+    def __len__(self):
+        return sum(1 for depth in self._depths if depth >= 0)
+
+
+class _Node:
+    """A node in the search tree. Nodes are keyed by moves, not states, since the state differs per determinization."""
+    __slots__ = ('player', 'children', 'priors', 'visits', 'availability', 'value_sum')
+
+    def __init__(self, player: int):
+        self.player = player # the player who made the move leading here
+        self.children: Dict[Move, '_Node'] = {}
+        self.priors: Optional[Dict[Move, float]] = None
+        self.visits = 0
+        self.availability = 0 # how often this node's move was legal when its parent was visited
+        self.value_sum = 0.0
+
+
+class ISMCTS:
+    """Single-observer information-set Monte Carlo tree search, guided by a policy prior."""
+    def __init__(self, config: SearchConfig, prior_fn: Optional[PriorFn] = None, num_players: int = 2):
+        self.config = config
+        self.prior_fn = prior_fn
+        self.rng = random.Random(config.seed)
+        self.engine = SkipBoEngine(num_players, track_legal_moves=True, seed=config.seed)
+        self.iterations = 0
+
+    def _priors(self, state: SkipBoState, legal: List[Move]) -> Dict[Move, float]:
+        uniform = 1.0 / len(legal)
+        if self.prior_fn is None:
+            return {move: uniform for move in legal}
+        raw = self.prior_fn(state)
+        total = sum(raw.get(move, 0.0) for move in legal)
+        if total <= 0:
+            return {move: uniform for move in legal}
+        mix = self.config.prior_mix
+        return {move: (1 - mix) * raw.get(move, 0.0) / total + mix * uniform for move in legal}
+
+    def _select(self, node: _Node, legal: List[Move]) -> Move:
+        c = self.config.exploration
+        fallback_prior = self.config.prior_mix / len(legal)
+        best_move = legal[0]
+        best_score = -math.inf
+        for move in legal:
+            child = node.children.get(move)
+            if child is None:
+                child = node.children[move] = _Node(self.engine.state.current_player)
+            child.availability += 1
+            prior = node.priors.get(move, fallback_prior) if node.priors else fallback_prior
+            q = child.value_sum / child.visits if child.visits > 0 else 0.0
+            score = q + c * prior * math.sqrt(child.availability) / (1 + child.visits)
+            if score > best_score:
+                best_score = score
+                best_move = move
+        return best_move
+
+    def _iterate(self, root_state: SkipBoState, root: _Node):
+        engine = self.engine
+        engine.reset(determinize(root_state, root_state.current_player, self.rng))
+        path = [root]
+        node = root
+        for _ in range(self.config.max_depth):
+            state = engine.state
+            if winner(state) is not None:
+                break
+            # interchangeable moves lead to the same place, so only search one of each
+            legal = canonical_moves(state, engine.legal_moves)
+            if len(legal) == 0:
+                break
+            if node.priors is None:
+                node.priors = self._priors(state, legal)
+            move = self._select(node, legal)
+            node = node.children[move]
+            path.append(node)
+            engine.step({0: SkipBoAction(*move)}, {})
+            if node.visits == 0:
+                # expand one new node per iteration
+                break
+        values = [heuristic_value(engine.state, p) for p in range(len(root_state.player_states))]
+        for visited in path:
+            visited.visits += 1
+            visited.value_sum += values[visited.player]
+
+    def search(self, state: SkipBoState) -> Optional[Move]:
+        """Search from the state for the current player and return the move to play, or None if there isn't one."""
+        deadline = time.perf_counter() + self.config.time_budget
+        root = _Node(state.current_player)
+        self.iterations = 0
+        while time.perf_counter() < deadline:
+            if self.config.max_iterations is not None and self.iterations >= self.config.max_iterations:
+                break
+            self._iterate(state, root)
+            self.iterations += 1
+        # the current player can see all of their own moves, so the root's legal moves are the same in every determinization
+        self.engine.reset(state.copy())
+        legal = canonical_moves(self.engine.state, self.engine.legal_moves)
+        if len(legal) == 0:
+            return None
+        return max(legal, key=lambda move: root.children[move].visits if move in root.children else -1)
+
+
+# --- full-turn planning ---
+# a turn is a chain of build pile plays ending in a discard. instead of picking one card at a time,
+# enumerate every distinct position the turn can end in, score each one, and play the best whole sequence.
+
+Evaluator = Callable[[SkipBoState, int], float] # (state, player) -> how good the state is for that player
+
+
+@dataclass
+class TurnPlanConfig:
+    """How an agent should plan whole turns. Attach one to an AgentConfig to turn planning on."""
+    evaluator: str = "heuristic" # "heuristic", "rollout" or "critic"
+    critic_path: Optional[str] = None # the critic weights to use with the "critic" evaluator
+    rollouts: int = 8 # rollouts per end position with the "rollout" evaluator
+    rollout_turns: int = 4 # turns per rollout
+    shortlist: int = 16 # how many of the heuristically best end positions the rollout or critic evaluator re-scores
+    max_positions: int = 50_000 # stop enumerating after visiting this many intermediate positions
+    time_budget: float = 0.5 # seconds of wall-clock time to spend enumerating
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        if self.evaluator not in ("heuristic", "rollout", "critic"):
+            raise ValueError(f"Unknown evaluator {self.evaluator!r} in {self!r}")
+        if self.evaluator == "critic" and self.critic_path is None:
+            raise ValueError(f"The critic evaluator needs a critic_path, but {self!r} doesn't have one")
+
+
+def position_key(state: SkipBoState, player: Optional[int] = None, canonical: bool = True) -> tuple:
+    """
+    Everything about a player's side of a position that decides what they can do with it (the current player by default).
+    With canonical set, hand order and build pile order are ignored, since they don't change which positions are reachable.
+    """
+    if player is None:
+        player = state.current_player
+    ps = state.player_states[player]
+    hand = tuple(sorted(ps.hand)) if canonical else tuple(ps.hand)
+    build_heights = [len(build_pile) for build_pile in state.build_piles]
+    if canonical:
+        build_heights.sort()
+    return (
+        player,
+        state.current_player,
+        len(ps.stock_pile),
+        ps.stock_pile[-1] if len(ps.stock_pile) > 0 else 0,
+        hand,
+        tuple(tuple(discard_pile) for discard_pile in ps.discard_piles),
+        tuple(build_heights),
+    )
+
+def turn_heuristic_value(state: SkipBoState, player: int) -> float:
+    """Like heuristic_value, but also tells apart turns that end with the same stock piles."""
+    won_by = winner(state)
+    if won_by is not None:
+        return 1.0 if won_by == player else -1.0
+    ps = state.player_states[player]
+    value = 0.0
+    for i, other in enumerate(state.player_states):
+        if i == player:
+            continue
+        value += 0.25 * (len(other.stock_pile) - len(ps.stock_pile))
+        # don't leave the build piles ready for someone else's stock card
+        top = other.stock_pile[-1]
+        if top == 13 or any(top == len(build_pile) + 1 for build_pile in state.build_piles):
+            value -= 0.5
+    for discard_pile in ps.discard_piles:
+        for below, above in zip(discard_pile, discard_pile[1:]):
+            # runs going down can be played back in order; burying a lower card under a higher one can't
+            if above == below - 1 or above == below:
+                value += 0.02
+            elif above > below:
+                value -= 0.02
+        # skipbo cards are wasted sitting on a discard pile
+        if len(discard_pile) > 0 and discard_pile[-1] == 13:
+            value -= 0.1
+    return math.tanh(value)
+
+
+class RolloutEvaluator:
+    """Scores a position by playing a few turns forward at random and averaging how they end up."""
+    def __init__(self, rollouts: int = 8, rollout_turns: int = 4, num_players: int = 2, seed: Optional[int] = None):
+        self.rollouts = rollouts
+        self.rollout_turns = rollout_turns
+        self.rng = random.Random(seed)
+        self.engine = SkipBoEngine(num_players, track_legal_moves=True, seed=seed)
+
+    def __call__(self, state: SkipBoState, player: int) -> float:
+        total = 0.0
+        for _ in range(self.rollouts):
+            self.engine.reset(state.copy())
+            end_turn = state.num_turns + self.rollout_turns
+            # cap the cards played too, in case a turn never ends
+            for _ in range(self.rollout_turns * 30):
+                if self.engine.state.num_turns >= end_turn or winner(self.engine.state) is not None:
+                    break
+                mask = self.engine.legal_moves
+                # play to the build piles when possible, like any sensible player would
+                moves = moves_in_mask(mask & BUILD_MOVES_MASK) or moves_in_mask(mask)
+                if len(moves) == 0:
+                    break
+                self.engine.step({0: SkipBoAction(*self.rng.choice(moves))}, {})
+            total += turn_heuristic_value(self.engine.state, player)
+        return total / self.rollouts
+
+
+class TurnPlanner:
+    """
+    Enumerates every distinct way the current turn can end and returns the best full sequence of moves.
+    Every end position gets a cheap heuristic score; a slower evaluator (rollouts, the critic) only re-scores the best few.
+    """
+    def __init__(self, config: TurnPlanConfig, evaluator: Optional[Evaluator] = None, num_players: int = 2,
+                 table: Optional[TranspositionTable] = None):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        # evaluator scores are cached here, and can be shared between plans
+        self.table = table if table is not None else TranspositionTable(12)
+        if evaluator is None:
+            if config.evaluator == "rollout":
+                evaluator = RolloutEvaluator(config.rollouts, config.rollout_turns, num_players, config.seed)
+            elif config.evaluator == "heuristic":
+                evaluator = turn_heuristic_value
+            else:
+                raise ValueError(f"Evaluator {config.evaluator!r} has to be passed in to the TurnPlanner")
+        self.evaluator = evaluator
+        self.engine = SkipBoEngine(num_players, track_legal_moves=True, track_hash=True, seed=config.seed)
+        self.positions = 0 # intermediate positions visited by the last plan
+        self.end_positions = 0 # distinct end-of-turn positions scored by the last plan
+
+    def plan(self, state: SkipBoState) -> List[Move]:
+        """Plan the rest of the current player's turn. The plan stops early if the hand runs out and has to be refilled."""
+        player = state.current_player
+        # don't let the plan peek at cards the player can't see (e.g. what a hand refill would draw)
+        self.engine.reset(determinize(state, player, self.rng))
+        self._deadline = time.perf_counter() + self.config.time_budget
+        self._seen = set()
+        self._scored = set()
+        # a min-heap of (heuristic value, tiebreak, sequence, end state, end state hash), holding the best end positions so far
+        self._shortlist: List[tuple] = []
+        self.positions = 0
+        self.end_positions = 0
+        self._expand([], player)
+        if len(self._shortlist) == 0:
+            return []
+        if self.evaluator is turn_heuristic_value:
+            return max(self._shortlist)[2]
+        self.table.new_generation()
+        return max(self._shortlist, key=lambda entry: self._evaluate(entry[3], entry[4], player))[2]
+
+    def _evaluate(self, state: SkipBoState, state_hash: int, player: int) -> float:
+        # the hash covers whose turn it is, but not who's asking
+        key = state_hash ^ player
+        value = self.table.lookup(key)
+        if value is None:
+            value = self.evaluator(state, player)
+            self.table.store(key, value)
+        return value
+
+    def _out_of_budget(self) -> bool:
+        return self.positions >= self.config.max_positions or time.perf_counter() >= self._deadline
+
+    def _expand(self, sequence: List[Move], player: int):
+        engine = self.engine
+        key = engine.state_hash
+        if key in self._seen:
+            # got here by playing the same cards in a different order
+            return
+        self._seen.add(key)
+        self.positions += 1
+        hand = engine.state.player_states[player].hand
+        for move in canonical_moves(engine.state, engine.legal_moves):
+            if self._out_of_budget() and len(self._shortlist) > 0:
+                return
+            # playing the last card from the hand draws new ones, which we can't plan around
+            refills = 1 <= move[0] <= 5 and hand.count(0) == 4
+            engine.push({0: SkipBoAction(*move)})
+            if move[1] >= 4 or refills or winner(engine.state) is not None:
+                self._score(sequence + [move], player)
+            else:
+                self._expand(sequence + [move], player)
+            engine.pop()
+
+    def _score(self, sequence: List[Move], player: int):
+        key = self.engine.state_hash
+        if key in self._scored:
+            return
+        self._scored.add(key)
+        self.end_positions += 1
+        value = turn_heuristic_value(self.engine.state, player)
+        shortlist_size = self.config.shortlist if self.evaluator is not turn_heuristic_value else 1
+        if len(self._shortlist) < shortlist_size:
+            heapq.heappush(self._shortlist, (value, self.end_positions, sequence, self.engine.snapshot(), key))
+        elif value > self._shortlist[0][0]:
+            heapq.heapreplace(self._shortlist, (value, self.end_positions, sequence, self.engine.snapshot(), key))
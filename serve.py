@@ -1,7 +1,11 @@
 # an ASGI server for serving the Skip-Bo game
 # serves static files from site/build on "/" and provides an API for model access on /get-move
 
+import asyncio
+import os
+
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 
@@ -12,6 +16,11 @@ from bot_play import Agent
 
 agent = Agent(configs["pasiphae"])
 
+# how many requests can search at once. every search stops at its own time budget, but they all share the cpus,
+# so past this the extra requests just get the network's move instead of waiting or searching worse
+MAX_CONCURRENT_SEARCHES = os.cpu_count() or 1
+search_slots = asyncio.Semaphore(MAX_CONCURRENT_SEARCHES)
+
 app = FastAPI()
 
 # Serve static files from the "site/build" directory
@@ -27,7 +36,15 @@ async def get_move(request: Request):
     game_state_raw = data.get("game_state")
     game_state = SkipBoState.from_dict(game_state_raw)
     # print(f"Received game state: {game_state}")
-    action = agent.get_action(game_state)
+    # searching agents take a while to think, so keep that off the event loop
+    if agent.search_config is None:
+        action = await run_in_threadpool(agent.get_action, game_state)
+    elif search_slots.locked():
+        # every search slot is taken, so answer straight away instead of queueing past the time budget
+        action = await run_in_threadpool(agent.get_action, game_state, None, False)
+    else:
+        async with search_slots:
+            action = await run_in_threadpool(agent.get_action, game_state)
     print(f"Action taken: {action}")
     return {"action": action.to_dict()}
 
@@ -0,0 +1,103 @@
+# telemetry.py
+# counters and sampled snapshots from the hot paths (engine steps, done conditions, rewards, obs builders),
+# instead of printing from them. off by default, and then every call site costs one attribute check.
+# turn it on with configure() or by setting SKIPBO_TELEMETRY to a directory before the env processes start.
+# every flush_interval seconds the counts since the last flush (and the sampled snapshots) get appended to
+# <directory>/telemetry_<pid>.jsonl, and the counts are kept for SkipBoSharedInfoProvider to ship to the metrics logger.
+
+import json
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+class Telemetry:
+    """A class to represent the telemetry of one process."""
+    def __init__(self):
+        self.enabled = False
+        self.directory: Optional[str] = None
+        self.sample_rate = 1 / 80_000
+        self.flush_interval = 60.0
+        self.counters: Dict[str, int] = {}
+        self.samples: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.ring_size = 8
+        self.rng = random.Random()
+        # the last flushed counts that haven't been handed to the metrics logger yet
+        self._unshipped: Optional[Dict[str, int]] = None
+        # only look at the clock every so often, it's slower than counting
+        self._events_until_check = 1024
+        self._last_flush = time.monotonic()
+
+    def configure(self, enabled: bool = True, directory: Optional[str] = None, sample_rate: Optional[float] = None,
+                  flush_interval: Optional[float] = None, ring_size: Optional[int] = None, seed: Optional[int] = None):
+        self.enabled = enabled
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        if ring_size is not None:
+            self.ring_size = ring_size
+            self.samples = {name: deque(ring, maxlen=ring_size) for name, ring in self.samples.items()}
+        self.rng = random.Random(seed)
+        self._last_flush = time.monotonic()
+
+    def count(self, name: str, n: int = 1):
+        """Count an event. Call sites check telemetry.enabled first."""
+        self.counters[name] = self.counters.get(name, 0) + n
+        self._events_until_check -= 1
+        if self._events_until_check <= 0:
+            self._events_until_check = 1024
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def sample(self, name: str, payload: Callable[[], Any], rate: Optional[float] = None):
+        """Keep payload() in name's ring buffer with probability rate (sample_rate by default). payload is only called when kept."""
+        if self.rng.random() >= (self.sample_rate if rate is None else rate):
+            return
+        ring = self.samples.get(name)
+        if ring is None:
+            ring = self.samples[name] = deque(maxlen=self.ring_size)
+        ring.append({'time': time.time(), 'payload': payload()})
+
+    def event(self, name: str, payload: Optional[Callable[[], Any]] = None, rate: Optional[float] = None):
+        """Count an event, and sample payload() for it if given."""
+        self.count(name)
+        if payload is not None:
+            self.sample(name, payload, rate)
+
+    def flush(self) -> Dict[str, Any]:
+        """Write out everything since the last flush and start over."""
+        record = {
+            'time': time.time(),
+            'pid': os.getpid(),
+            'counters': self.counters,
+            'samples': {name: list(ring) for name, ring in self.samples.items() if len(ring) > 0},
+        }
+        if self.directory is not None:
+            with open(os.path.join(self.directory, f"telemetry_{os.getpid()}.jsonl"), "a") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+        if self._unshipped is None:
+            self._unshipped = dict(self.counters)
+        else:
+            for name, n in self.counters.items():
+                self._unshipped[name] = self._unshipped.get(name, 0) + n
+        self.counters = {}
+        for ring in self.samples.values():
+            ring.clear()
+        self._last_flush = time.monotonic()
+        return record
+
+    def take_counters(self) -> Optional[Dict[str, int]]:
+        """The counts flushed since this was last called, or None if there haven't been any flushes."""
+        counters, self._unshipped = self._unshipped, None
+        return counters
+
+# the one every module in this process reports to
+telemetry = Telemetry()
+
+if os.environ.get("SKIPBO_TELEMETRY"):
+    telemetry.configure(directory=os.environ["SKIPBO_TELEMETRY"])
@@ -2,21 +2,48 @@ import os
 
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
 
-def build_rlgym_v2_env():
-    from env import SkipBoMutator, HimaliaObsBuilder, HimaliaActionParser, SkipBoEngine, SkipBoTerminalCondition, SkipBoTruncationCondition
+# how many games each env process runs at once (see multi_env.py). with more than 1, fewer processes are needed
+# for the same number of games, and every game in a process is stepped per round trip to the learner
+GAMES_PER_PROCESS = 1
+
+# mask the padding slots of the move list out of the policy, so it never picks one
+# (and the parser and reward don't have to deal with it picking one)
+MASK_ACTIONS = True
+
+# send obs as int8 instead of int32 (see COMPACT_OBS_DTYPE in env.py). the networks see the same values either way
+COMPACT_OBS = True
+
+def build_rlgym_v2_env(seed=None):
+    import numpy as np
+    from env import SkipBoMutator, HimaliaObsBuilder, HimaliaActionParser, SkipBoEngine, SkipBoTerminalCondition, SkipBoTruncationCondition, SkipBoSharedInfoProvider, COMPACT_OBS_DTYPE
+    from episode_stats import EpisodeStats
+    from profiler import profiler
     from rewards import HimaliaReward
 
     from rlgym.api import RLGym
 
-    return RLGym(
-        state_mutator=SkipBoMutator(2, 20),
-        obs_builder=HimaliaObsBuilder(),
-        action_parser=HimaliaActionParser(),
-        reward_fn=HimaliaReward(),
-        transition_engine=SkipBoEngine(2),
+    # a seed makes every game the env plays the same from run to run, given the same actions (for benchmark.py)
+    seeds = [None] * 3 if seed is None else [seed, seed + 1, seed + 2]
+    engine = SkipBoEngine(2, track_legal_moves=True, seed=seeds[0])
+    truncation_cond = SkipBoTruncationCondition()
+    env = RLGym(
+        state_mutator=SkipBoMutator(2, 20, seed=seeds[1]),
+        obs_builder=HimaliaObsBuilder(seed=seeds[2], dtype=COMPACT_OBS_DTYPE if COMPACT_OBS else np.int32),
+        action_parser=HimaliaActionParser(masked=MASK_ACTIONS),
+        reward_fn=HimaliaReward(masked=MASK_ACTIONS),
+        transition_engine=engine,
         termination_cond=SkipBoTerminalCondition(),
-        truncation_cond=SkipBoTruncationCondition(),
+        truncation_cond=truncation_cond,
+        shared_info_provider=SkipBoSharedInfoProvider(engine, episode_stats=EpisodeStats(truncation_cond.max_turns)),
     )
+    if profiler.enabled:
+        profiler.instrument(env)
+    return env
+
+def build_multi_game_env():
+    from multi_env import MultiGameEnv
+
+    return MultiGameEnv(build_rlgym_v2_env, GAMES_PER_PROCESS)
 
 if __name__ == "__main__":
     from typing import Tuple
@@ -39,6 +66,9 @@ if __name__ == "__main__":
         PPOMetricsLogger,
     )
 
+    from env import COMPACT_OBS_DTYPE
+    from metrics import SkipBoMetricsLogger
+
     from rlgym_learn import (
         BaseConfigModel,
         LearningCoordinator,
@@ -55,11 +85,30 @@ if __name__ == "__main__":
     DefaultObsSpaceType = tuple[str, int]
     DefaultActionSpaceType = tuple[str, int]
 
+    # set to a directory to have the env processes count and sample what happens in the hot paths (see telemetry.py).
+    # the counts go to wandb once per iteration, and everything gets written to the directory
+    telemetry_directory = None
+    if telemetry_directory is not None:
+        # the env processes pick this up when they import telemetry
+        os.environ["SKIPBO_TELEMETRY"] = telemetry_directory
+
+    # set to a directory to have the env processes time their engine, obs builder, parser, reward and done conditions
+    # (see profiler.py). the times go to wandb once per iteration. to also see their stacks, touch
+    # <profile_directory>/sample_stacks (or send one of them SIGUSR1); each iteration's samples go to stacks_<n>.folded
+    profile_directory = None
+    if profile_directory is not None:
+        os.environ["SKIPBO_PROFILE"] = profile_directory
+
     def actor_factory(
         obs_space: DefaultObsSpaceType,
         action_space: DefaultActionSpaceType,
         device: str,
     ):
+        if MASK_ACTIONS:
+            from env import HimaliaObsBuilder
+            from masked_actor import MaskedDiscreteFF
+            mask_offset = HimaliaObsBuilder().spec.offsets['possible_moves']
+            return MaskedDiscreteFF(obs_space[1], action_space[1], (256, 256, 256), device, mask_offset)
         return DiscreteFF(obs_space[1], action_space[1], (256, 256, 256), device)
 
     def critic_factory(obs_space: DefaultObsSpaceType, device: str):
@@ -86,14 +135,25 @@ if __name__ == "__main__":
                 run_name="pasiphae"
             )
 
+    shared_info_serde_types = {"episode_stats": PyAnySerdeType.OPTION(PyAnySerdeType.PICKLE())}
+    if telemetry_directory is not None:
+        shared_info_serde_types["telemetry"] = PyAnySerdeType.OPTION(PyAnySerdeType.PICKLE())
+    if profile_directory is not None:
+        shared_info_serde_types["profile"] = PyAnySerdeType.OPTION(PyAnySerdeType.PICKLE())
+    if GAMES_PER_PROCESS > 1:
+        # the last obs of each game that ended, which MultiGamePPOAgentController bootstraps truncated games from
+        shared_info_serde_types["final_obs"] = PyAnySerdeType.PICKLE()
+
     # Create the config that will be used for the run
     config = LearningCoordinatorConfigModel(
         base_config=BaseConfigModel(
             serde_types=SerdeTypesModel(
                 agent_id_serde_type=PyAnySerdeType.INT(),
                 action_serde_type=PyAnySerdeType.NUMPY(np.int64, config=NumpySerdeConfig.STATIC(shape=(1,))),
-                obs_serde_type=PyAnySerdeType.NUMPY(np.int32),
+                obs_serde_type=PyAnySerdeType.NUMPY(COMPACT_OBS_DTYPE if COMPACT_OBS else np.int32),
                 reward_serde_type=PyAnySerdeType.FLOAT(),
+                # only send the episode stats, telemetry counts, profiles and final obs back from the env processes, not everything else in shared_info
+                shared_info_serde_type=PyAnySerdeType.TYPEDDICT(shared_info_serde_types),
                 obs_space_serde_type=PyAnySerdeType.TUPLE(
                     (PyAnySerdeType.STRING(), PyAnySerdeType.INT())
                 ),
@@ -104,7 +164,7 @@ if __name__ == "__main__":
             timestep_limit=2_000_100_000,  # Train for 2B steps
         ),
         process_config=ProcessConfigModel(
-            n_proc=128,  # Number of processes to spawn to run environments. Increasing will use more RAM but should increase steps per second, up to a point
+            n_proc=max(1, 128 // GAMES_PER_PROCESS),  # Number of processes to spawn to run environments. Increasing will use more RAM but should increase steps per second, up to a point
         ),
         agent_controllers_config={
             "PPO1": ppo_agent_controller_config,
@@ -122,14 +182,22 @@ if __name__ == "__main__":
         force_overwrite=True,
     )
 
+    if GAMES_PER_PROCESS > 1:
+        from multi_game_controller import MultiGamePPOAgentController
+        build_env = build_multi_game_env
+        agent_controller_class = MultiGamePPOAgentController
+    else:
+        build_env = build_rlgym_v2_env
+        agent_controller_class = PPOAgentController
+
     learning_coordinator = LearningCoordinator(
-        build_rlgym_v2_env,
+        build_env,
         agent_controllers={
-            "PPO1": PPOAgentController(
+            "PPO1": agent_controller_class(
                 actor_factory=actor_factory,
                 critic_factory=critic_factory,
                 experience_buffer=NumpyExperienceBuffer(GAETrajectoryProcessor()),
-                metrics_logger=WandbMetricsLogger(PPOMetricsLogger()),
+                metrics_logger=WandbMetricsLogger(SkipBoMetricsLogger(profile_directory)),
                 obs_standardizer=None,
             ),
             # "PPO2": PPOAgentController(
@@ -0,0 +1,273 @@
+# vector_env.py
+# steps many games of skipbo at once.
+# every game is one row of a stacked CompactLayout buffer, and each rule in SkipBoEngine.step
+# is applied to all games at once as a masked array operation.
+
+from typing import Optional
+import numpy as np
+
+from env import SkipBoState, shuffled_decks
+from compact_state import (
+    CompactLayout, CompactSkipBoState, DTYPE, DECK_SIZE, HAND_SIZE, BUILD_PILE_CAPACITY,
+    HDR_CURRENT_PLAYER, HDR_NUM_TURNS, HDR_INVALID_ACTIONS, HDR_HAS_LAST_STEP, HDR_LAST_SRC, HDR_LAST_DST,
+    HDR_LAST_TAKEN_BY, HDR_LAST_WAS_VALID,
+)
+
+
+class VectorSkipBoEngine:
+    """A class to represent many games of skipbo stepped together."""
+    def __init__(self, num_games: int, num_players: int = 2, stock_pile_size: int = 20,
+                 max_turns: int = 1000, max_invalid_actions: int = 500, min_cards_left: int = 20,
+                 auto_reset: bool = True, seed: Optional[int] = None):
+        self.num_games = num_games
+        self.num_players = num_players
+        self.stock_pile_size = stock_pile_size
+        # these mirror SkipBoTruncationCondition
+        self.max_turns = max_turns
+        self.max_invalid_actions = max_invalid_actions
+        self.min_cards_left = min_cards_left
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+
+        self.layout = CompactLayout(num_players=num_players, stock_capacity=max(stock_pile_size, 1))
+        self.buffer = np.zeros((num_games, self.layout.size), dtype=DTYPE)
+        # the pile length counters of every game, as a view into the buffer
+        self.lengths = self.buffer[:, self.layout.lengths_offset:self.layout.lengths_offset + self.layout.num_piles]
+        self._rows = np.arange(num_games)
+        self._offsets = self.layout.pile_offsets
+        self._first_build_id = self.layout.build_id(0)
+
+        # the rows that finished on the last step, and a copy of how they finished (before auto-reset)
+        self.final_rows = np.zeros(0, dtype=np.int64)
+        self.final_states = np.zeros((0, self.layout.size), dtype=DTYPE)
+
+        self.reset()
+
+    def game(self, idx: int) -> CompactSkipBoState:
+        """A zero-copy view of one game."""
+        return CompactSkipBoState(self.layout, self.buffer[idx])
+
+    def get_state(self, idx: int) -> SkipBoState:
+        return self.game(idx).to_state()
+
+    def set_state(self, idx: int, state: SkipBoState):
+        CompactSkipBoState.from_state(state, self.layout, self.buffer[idx])
+
+    def reset(self, rows: Optional[np.ndarray] = None):
+        """Deal new games into the given rows (all rows by default), exactly like SkipBoMutator.apply."""
+        if rows is None:
+            rows = self._rows
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        layout = self.layout
+        stock_size = self.stock_pile_size
+        # one shuffled deck per game
+        decks = shuffled_decks(self.rng, len(rows))
+
+        self.buffer[rows] = 0
+        position = 0
+        for player in range(self.num_players):
+            stock_id = layout.stock_id(player)
+            offset = self._offsets[stock_id]
+            self.buffer[rows, offset:offset + stock_size] = decks[:, position:position + stock_size]
+            self.lengths[rows, stock_id] = stock_size
+            position += stock_size
+        # the first player draws their hand
+        hand_offset = layout.hand_offset(0)
+        self.buffer[rows, hand_offset:hand_offset + HAND_SIZE] = decks[:, position:position + HAND_SIZE]
+        position += HAND_SIZE
+        draw_size = DECK_SIZE - position
+        draw_offset = self._offsets[layout.draw_pile_id]
+        self.buffer[rows, draw_offset:draw_offset + draw_size] = decks[:, position:]
+        self.lengths[rows, layout.draw_pile_id] = draw_size
+
+    def _top(self, rows: np.ndarray, pile_ids: np.ndarray) -> np.ndarray:
+        """The top card of one pile per row, or 0 where the pile is empty."""
+        length = self.lengths[rows, pile_ids].astype(np.int64)
+        top = self.buffer[rows, self._offsets[pile_ids] + np.maximum(length - 1, 0)]
+        return np.where(length > 0, top, 0)
+
+    def legal_moves(self) -> np.ndarray:
+        """
+        Every game's legal moves at once, as a (num_games, 80) mask. Move src * 8 + dst is (card_source=src, card_destination=dst),
+        the same as legal_move_mask for one game. Gives the same answers as action_validity for each move.
+        """
+        rows = self._rows[:, None]
+        cp = self.buffer[:, HDR_CURRENT_PLAYER].astype(np.int64)[:, None]
+        # the stock pile then the 4 discard piles of the current player, and the top card of each
+        pile_ids = cp * 5 + np.arange(5)
+        pile_lengths = self.lengths[rows, pile_ids].astype(np.int64)
+        pile_tops = self.buffer[rows, self._offsets[pile_ids] + np.maximum(pile_lengths - 1, 0)]
+        pile_tops = np.where(pile_lengths > 0, pile_tops, 0)
+        hand = self.buffer[rows, self.layout.hands_offset + cp * HAND_SIZE + np.arange(HAND_SIZE)].astype(np.int64)
+        # card value per source: 0 is the stock pile, 1-5 the hand, 6-9 the discard piles
+        values = np.concatenate([pile_tops[:, :1], hand, pile_tops[:, 1:]], axis=1).astype(np.int64)
+        build_lengths = self.lengths[:, self._first_build_id:self._first_build_id + 4].astype(np.int64)
+
+        legal = np.zeros((self.num_games, 10, 8), dtype=bool)
+        legal[:, :, :4] = (values[:, :, None] == 13) | (values[:, :, None] == build_lengths[:, None, :] + 1)
+        # only hand cards can go on the discard piles
+        legal[:, 1:6, 4:] = (hand != 0)[:, :, None]
+        return legal.reshape(self.num_games, 80)
+
+    def action_validity(self, actions: np.ndarray) -> np.ndarray:
+        """The vectorized equivalent of SkipBoEngine.is_action_valid, for one action per game."""
+        return self._validate(np.asarray(actions))[0]
+
+    def _validate(self, actions: np.ndarray):
+        rows = self._rows
+        src = actions[:, 0].astype(np.int64)
+        dst = actions[:, 1].astype(np.int64)
+        cp = self.buffer[:, HDR_CURRENT_PLAYER].astype(np.int64)
+
+        # 0: stock pile, 1-5: hand, 6-9: discard piles
+        from_hand = (src >= 1) & (src <= 5)
+        from_pile = (src == 0) | ((src >= 6) & (src <= 9))
+        src_pile = np.where(src == 0, cp * 5, cp * 5 + 1 + np.clip(src - 6, 0, 3))
+        hand_idx = self.layout.hands_offset + cp * HAND_SIZE + np.clip(src - 1, 0, HAND_SIZE - 1)
+        src_value = np.where(from_pile, self._top(rows, src_pile),
+                             np.where(from_hand, self.buffer[rows, hand_idx], 0))
+
+        # 0-3: build piles, 4-7: discard piles
+        to_build = (dst >= 0) & (dst <= 3)
+        to_discard = (dst >= 4) & (dst <= 7)
+        build_pile = self._first_build_id + np.clip(dst, 0, 3)
+        build_len = self.lengths[rows, build_pile]
+        valid = (from_hand | from_pile) & (
+            (to_build & ((src_value == 13) | (src_value == build_len + 1))) |
+            (to_discard & from_hand & (src_value != 0))
+        )
+        return valid, src, dst, cp, from_hand, from_pile, src_pile, hand_idx, src_value, to_build, build_pile
+
+    def step(self, actions: np.ndarray):
+        """
+        Step every game forward by one action. actions has shape (num_games, 2): (card_source, card_destination) per game.
+        Returns (was_valid, terminated, truncated), each of shape (num_games,).
+        Finished games are copied into final_states and, if auto_reset is set, dealt again.
+        """
+        actions = np.asarray(actions)
+        buf = self.buffer
+        lengths = self.lengths
+        layout = self.layout
+        valid, src, dst, cp, from_hand, from_pile, src_pile, hand_idx, src_value, to_build, build_pile = self._validate(actions)
+
+        # record the last step
+        buf[:, HDR_HAS_LAST_STEP] = 1
+        buf[:, HDR_LAST_SRC] = src
+        buf[:, HDR_LAST_DST] = dst
+        buf[:, HDR_LAST_TAKEN_BY] = cp
+        buf[:, HDR_LAST_WAS_VALID] = valid
+        # invalid actions only bump the counter; valid ones reset it
+        buf[:, HDR_INVALID_ACTIONS] = np.where(valid, 0, buf[:, HDR_INVALID_ACTIONS] + 1)
+
+        # take the card from the source
+        rows = self._rows[valid & from_pile]
+        lengths[rows, src_pile[rows]] -= 1
+        rows = self._rows[valid & from_hand]
+        buf[rows, hand_idx[rows]] = 0
+
+        # put the card on the destination
+        rows = self._rows[valid & to_build]
+        self._push(rows, build_pile[rows], src_value[rows])
+        discarded = valid & ~to_build
+        rows = self._rows[discarded]
+        self._push(rows, cp[rows] * 5 + 1 + (dst[rows] - 4), src_value[rows])
+
+        # remove completed build piles
+        built = self._rows[valid & to_build]
+        completed = built[lengths[built, build_pile[built]] == BUILD_PILE_CAPACITY]
+        if len(completed) > 0:
+            pile = build_pile[completed]
+            card_idx = np.arange(BUILD_PILE_CAPACITY)
+            completed_id = layout.completed_pile_id
+            from_idx = self._offsets[pile][:, None] + card_idx
+            to_idx = self._offsets[completed_id] + lengths[completed, completed_id].astype(np.int64)[:, None] + card_idx
+            buf[completed[:, None], to_idx] = buf[completed[:, None], from_idx]
+            lengths[completed, completed_id] += BUILD_PILE_CAPACITY
+            lengths[completed, pile] = 0
+
+        # draw new cards for anyone who emptied their hand
+        rows = self._rows[valid]
+        hand_cols = layout.hands_offset + cp[rows, None] * HAND_SIZE + np.arange(HAND_SIZE)
+        emptied = (buf[rows[:, None], hand_cols] == 0).all(axis=1)
+        if emptied.any():
+            self._draw_cards(rows[emptied], cp[rows[emptied]])
+
+        # discarding ends the turn, and the next player draws
+        rows = self._rows[discarded]
+        if len(rows) > 0:
+            next_player = (cp[rows] + 1) % self.num_players
+            buf[rows, HDR_CURRENT_PLAYER] = next_player
+            buf[rows, HDR_NUM_TURNS] += 1
+            self._draw_cards(rows, next_player)
+
+        terminated, truncated = self._is_done()
+        finished = self._rows[terminated | truncated]
+        self.final_rows = finished
+        self.final_states = buf[finished]
+        if self.auto_reset:
+            self.reset(finished)
+        return valid, terminated, truncated
+
+    def _push(self, rows: np.ndarray, pile_ids: np.ndarray, cards: np.ndarray):
+        length = self.lengths[rows, pile_ids].astype(np.int64)
+        if np.any(length >= self.layout.pile_capacities[pile_ids]):
+            raise ValueError("A pile overflowed its fixed capacity")
+        self.buffer[rows, self._offsets[pile_ids] + length] = cards
+        self.lengths[rows, pile_ids] = length + 1
+
+    def _draw_cards(self, rows: np.ndarray, players: np.ndarray):
+        """Draw up to 5 cards into each player's hand, reshuffling the completed build piles in where needed."""
+        buf = self.buffer
+        draw_id = self.layout.draw_pile_id
+        hand_cols = self.layout.hands_offset + players[:, None] * HAND_SIZE + np.arange(HAND_SIZE)
+        hand = buf[rows[:, None], hand_cols]
+        empty = hand == 0
+        needed = empty.sum(axis=1)
+        reshuffle = needed > self.lengths[rows, draw_id]
+        if reshuffle.any():
+            self._reshuffle(rows[reshuffle])
+
+        draw_len = self.lengths[rows, draw_id].astype(np.int64)
+        draw_offset = self._offsets[draw_id]
+        # the k-th empty slot (left to right) gets the k-th card off the top of the draw pile. once the draw pile
+        # runs dry the hand just stays short, like SkipBoEngine._draw_cards
+        rank = np.cumsum(empty, axis=1) - 1
+        drawing = empty & (rank < draw_len[:, None])
+        card_idx = draw_offset + np.maximum(draw_len[:, None] - 1 - rank, 0)
+        buf[rows[:, None], hand_cols] = np.where(drawing, buf[rows[:, None], card_idx], hand)
+        self.lengths[rows, draw_id] = draw_len - drawing.sum(axis=1)
+
+    def _reshuffle(self, rows: np.ndarray):
+        """Shuffle the completed build piles back into the draw pile."""
+        draw_id = self.layout.draw_pile_id
+        completed_id = self.layout.completed_pile_id
+        completed_len = self.lengths[rows, completed_id].astype(np.int64)[:, None]
+        draw_len = self.lengths[rows, draw_id].astype(np.int64)[:, None]
+        total = completed_len + draw_len
+        card_idx = np.arange(DECK_SIZE)
+        # completed cards first, then the draw pile, like completed_build_piles + draw_pile
+        from_idx = np.where(card_idx < completed_len,
+                            self._offsets[completed_id] + card_idx,
+                            self._offsets[draw_id] + np.clip(card_idx - completed_len, 0, DECK_SIZE - 1))
+        combined = self.buffer[rows[:, None], from_idx]
+        keys = self.rng.random((len(rows), DECK_SIZE))
+        keys[card_idx >= total] = 2.0 # keep the unused slots at the end
+        shuffled = np.take_along_axis(combined, np.argsort(keys, axis=1), axis=1)
+        draw_offset = self._offsets[draw_id]
+        self.buffer[rows, draw_offset:draw_offset + DECK_SIZE] = shuffled
+        self.lengths[rows, draw_id] = total[:, 0]
+        self.lengths[rows, completed_id] = 0
+
+    def _is_done(self):
+        """The vectorized equivalent of SkipBoTerminalCondition and SkipBoTruncationCondition."""
+        stock_ids = [self.layout.stock_id(p) for p in range(self.num_players)]
+        terminated = (self.lengths[:, stock_ids] == 0).any(axis=1)
+        cards_left = self.lengths[:, self.layout.draw_pile_id].astype(np.int64) + self.lengths[:, self.layout.completed_pile_id]
+        truncated = (
+            (self.buffer[:, HDR_NUM_TURNS] >= self.max_turns) |
+            (cards_left < self.min_cards_left) |
+            (self.buffer[:, HDR_INVALID_ACTIONS] >= self.max_invalid_actions)
+        )
+        return terminated, truncated